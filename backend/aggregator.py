@@ -0,0 +1,289 @@
+"""
+aggregator.py — Incremental Per-Attacker Summaries
+
+Instead of reloading an attacker's full history and re-running detect_ttps
+over it for every report, the ingestion writer folds each event into a
+compact `AttackerSummary` row: matched TTPs, max score, per-category counts,
+first/last timestamps and a bounded sample of distinct values for prompts.
+Sampled commands are distinct by template (normalizer.fingerprint), so a bot
+replaying one payload against many C2 addresses takes a single slot.
+
+Command templates are also what the fingerprint aggregation groups by:
+`fingerprint_stats` answers "which behaviours are we seeing" in one GROUP BY.
+
+Tuning (environment variables):
+    SUMMARY_SAMPLE_SIZE   distinct commands/credentials/payloads kept (default 25)
+"""
+
+import json
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+
+from .ai_analyzer import detect_ttps
+from .models import (
+    Attacker, AttackerSummary, HoneypotCommand, Credential,
+    WebAttack, ServiceInteraction, DynamicService
+)
+from .normalizer import fingerprint
+
+SUMMARY_SAMPLE_SIZE = int(os.getenv("SUMMARY_SAMPLE_SIZE", "25"))
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [v for v in (value or "").split(",") if v]
+
+
+def _sample(values: List[str], value: str, key: Callable[[str], str] = str):
+    if len(values) < SUMMARY_SAMPLE_SIZE and key(value) not in {key(v) for v in values}:
+        values.append(value)
+
+
+class SummaryDelta:
+    """Changes to one attacker's summary accumulated over an ingestion batch."""
+
+    def __init__(self):
+        self.commands = 0
+        self.credentials = 0
+        self.web_attacks = 0
+        self.service_probes = 0
+        self.max_score = 0
+        self.ttps = set()
+        self.services = set()
+        self.sample_commands: List[str] = []
+        self.sample_credentials: List[str] = []
+        self.sample_web_attacks: List[str] = []
+        self.first_seen: Optional[datetime] = None
+        self.last_seen: Optional[datetime] = None
+
+    def _seen(self, timestamp: datetime):
+        if self.first_seen is None or timestamp < self.first_seen:
+            self.first_seen = timestamp
+        if self.last_seen is None or timestamp > self.last_seen:
+            self.last_seen = timestamp
+
+    def add_command(self, command: str, score: int, timestamp: datetime):
+        self.commands += 1
+        self.max_score = max(self.max_score, score or 0)
+        self.ttps.update(detect_ttps([command], [], [], []))
+        _sample(self.sample_commands, command, key=fingerprint)
+        self._seen(timestamp)
+
+    def add_credential(self, username: str, password: str, timestamp: datetime):
+        self.credentials += 1
+        self.ttps.update(detect_ttps([], [], [username], []))
+        _sample(self.sample_credentials, f"{username}:{password}")
+        self._seen(timestamp)
+
+    def add_web_attack(self, payload: str, timestamp: datetime):
+        self.web_attacks += 1
+        if payload:
+            self.ttps.update(detect_ttps([], [payload], [], []))
+            _sample(self.sample_web_attacks, payload)
+        self._seen(timestamp)
+
+    def add_service_probe(self, service_name: str, timestamp: datetime):
+        self.service_probes += 1
+        self.services.add(service_name)
+        self.ttps.update(detect_ttps([], [], [], [service_name]))
+        self._seen(timestamp)
+
+
+def _merge_sample(
+    existing_json: Optional[str], new_values: Iterable[str], key: Callable[[str], str] = str
+) -> str:
+    sample = json.loads(existing_json or "[]")
+    if len(sample) < SUMMARY_SAMPLE_SIZE:
+        seen = {key(v) for v in sample}
+        for value in new_values:
+            if key(value) not in seen:
+                sample.append(value)
+                seen.add(key(value))
+                if len(sample) >= SUMMARY_SAMPLE_SIZE:
+                    break
+    return json.dumps(sample)
+
+
+def _new_summary(attacker_id: int) -> AttackerSummary:
+    return AttackerSummary(
+        attacker_id=attacker_id, ttps="", max_score=0,
+        command_count=0, credential_count=0, web_attack_count=0, service_probe_count=0,
+        services_hit="", sample_commands="[]", sample_credentials="[]", sample_web_attacks="[]",
+    )
+
+
+def merge_delta(summary: AttackerSummary, delta: SummaryDelta):
+    """Fold a delta into a summary row in place."""
+    summary.command_count = (summary.command_count or 0) + delta.commands
+    summary.credential_count = (summary.credential_count or 0) + delta.credentials
+    summary.web_attack_count = (summary.web_attack_count or 0) + delta.web_attacks
+    summary.service_probe_count = (summary.service_probe_count or 0) + delta.service_probes
+    summary.max_score = max(summary.max_score or 0, delta.max_score)
+
+    ttps = set(_split(summary.ttps))
+    if not delta.ttps <= ttps:
+        summary.ttps = ",".join(sorted(ttps | delta.ttps))
+    services = set(_split(summary.services_hit))
+    if not delta.services <= services:
+        summary.services_hit = ",".join(sorted(services | delta.services))
+
+    if delta.sample_commands:
+        summary.sample_commands = _merge_sample(
+            summary.sample_commands, delta.sample_commands, key=fingerprint
+        )
+    if delta.sample_credentials:
+        summary.sample_credentials = _merge_sample(summary.sample_credentials, delta.sample_credentials)
+    if delta.sample_web_attacks:
+        summary.sample_web_attacks = _merge_sample(summary.sample_web_attacks, delta.sample_web_attacks)
+
+    if delta.first_seen and (summary.first_seen is None or delta.first_seen < summary.first_seen):
+        summary.first_seen = delta.first_seen
+    if delta.last_seen and (summary.last_seen is None or delta.last_seen > summary.last_seen):
+        summary.last_seen = delta.last_seen
+
+
+def apply_deltas(db, deltas: Dict[int, SummaryDelta]):
+    """Write a batch of deltas: one SELECT for all touched attackers, then in-place updates."""
+    if not deltas:
+        return
+    rows = {
+        s.attacker_id: s
+        for s in db.query(AttackerSummary).filter(AttackerSummary.attacker_id.in_(list(deltas)))
+    }
+    for attacker_id, delta in deltas.items():
+        summary = rows.get(attacker_id)
+        if summary is None:
+            summary = _new_summary(attacker_id)
+            db.add(summary)
+        merge_delta(summary, delta)
+
+
+def rebuild_summary(db, attacker_id: int) -> AttackerSummary:
+    """
+    Build a summary from raw history in one streaming pass. Only needed for
+    attackers recorded before summaries existed (see backfill_summaries).
+    """
+    delta = SummaryDelta()
+    for command, ts in (
+        db.query(HoneypotCommand.command, HoneypotCommand.timestamp)
+        .filter(HoneypotCommand.attacker_id == attacker_id).yield_per(1000)
+    ):
+        delta.add_command(command or "", 0, ts)
+    for username, password, ts in (
+        db.query(Credential.username, Credential.password, Credential.timestamp)
+        .filter(Credential.attacker_id == attacker_id).yield_per(1000)
+    ):
+        delta.add_credential(username, password, ts)
+    for payload, ts in (
+        db.query(WebAttack.payload, WebAttack.timestamp)
+        .filter(WebAttack.attacker_id == attacker_id).yield_per(1000)
+    ):
+        delta.add_web_attack(payload, ts)
+    for service_name, ts in (
+        db.query(DynamicService.name, ServiceInteraction.timestamp)
+        .outerjoin(DynamicService, ServiceInteraction.service_id == DynamicService.id)
+        .filter(ServiceInteraction.attacker_id == attacker_id).yield_per(1000)
+    ):
+        delta.add_service_probe(service_name or "unknown", ts)
+
+    summary = db.get(AttackerSummary, attacker_id)
+    if summary is None:
+        summary = _new_summary(attacker_id)
+        db.add(summary)
+    else:
+        for column in ("command_count", "credential_count", "web_attack_count", "service_probe_count", "max_score"):
+            setattr(summary, column, 0)
+        summary.ttps = summary.services_hit = ""
+        summary.sample_commands = summary.sample_credentials = summary.sample_web_attacks = "[]"
+        summary.first_seen = summary.last_seen = None
+    merge_delta(summary, delta)
+
+    # The historical max score is already tracked on the attacker row
+    attacker = db.get(Attacker, attacker_id)
+    if attacker is not None:
+        summary.max_score = max(summary.max_score or 0, attacker.risk_score or 0)
+    return summary
+
+
+def backfill_summaries(db) -> int:
+    """Create summaries for attackers that predate them. Returns how many were built."""
+    missing = [
+        attacker_id for (attacker_id,) in
+        db.query(Attacker.id).outerjoin(AttackerSummary).filter(AttackerSummary.attacker_id.is_(None))
+    ]
+    for attacker_id in missing:
+        rebuild_summary(db, attacker_id)
+    if missing:
+        db.commit()
+    return len(missing)
+
+
+def backfill_fingerprints(db, batch_size: int = 1000) -> int:
+    """Template commands stored before fingerprints existed. Returns how many were filled."""
+    filled = 0
+    while True:
+        rows = (
+            db.query(HoneypotCommand)
+            .filter(HoneypotCommand.fingerprint.is_(None))
+            .limit(batch_size).all()
+        )
+        if not rows:
+            return filled
+        for row in rows:
+            row.fingerprint = fingerprint(row.command or "")
+        db.commit()
+        filled += len(rows)
+
+
+def fingerprint_stats(db, limit: int = 50, attacker_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Distinct command templates, most frequent first."""
+    query = db.query(
+        HoneypotCommand.fingerprint,
+        func.count(HoneypotCommand.id),
+        func.count(func.distinct(HoneypotCommand.attacker_id)),
+        func.min(HoneypotCommand.timestamp),
+        func.max(HoneypotCommand.timestamp),
+        func.max(HoneypotCommand.command),
+    )
+    if attacker_id is not None:
+        query = query.filter(HoneypotCommand.attacker_id == attacker_id)
+    rows = (
+        query.group_by(HoneypotCommand.fingerprint)
+        .order_by(func.count(HoneypotCommand.id).desc())
+        .limit(limit)
+    )
+    return [
+        {
+            "fingerprint": fp,
+            "count": count,
+            "attackers": attackers,
+            "first_seen": first_seen,
+            "last_seen": last_seen,
+            "example": example,
+        }
+        for fp, count, attackers, first_seen, last_seen, example in rows
+    ]
+
+
+def summary_to_attacker_data(attacker: Attacker, summary: AttackerSummary) -> Dict[str, Any]:
+    """The `attacker_data` dict consumed by the report generators, built in O(1)."""
+    return {
+        "ip_address": attacker.ip_address,
+        "city": attacker.city,
+        "country": attacker.country,
+        "risk_score": attacker.risk_score,
+        "first_seen": str(summary.first_seen or attacker.first_seen),
+        "last_seen": str(summary.last_seen or attacker.last_seen),
+        "commands": json.loads(summary.sample_commands or "[]"),
+        "credentials": json.loads(summary.sample_credentials or "[]"),
+        "web_attacks": json.loads(summary.sample_web_attacks or "[]"),
+        "services_hit": _split(summary.services_hit),
+        "ttps": _split(summary.ttps),
+        "max_score": summary.max_score or 0,
+        "command_count": summary.command_count or 0,
+        "credential_count": summary.credential_count or 0,
+        "web_attack_count": summary.web_attack_count or 0,
+        "service_probe_count": summary.service_probe_count or 0,
+    }
@@ -1,6 +1,5 @@
 import os
 import json
-import time
 import asyncio
 from typing import Dict, Any, Optional
 from dotenv import load_dotenv
@@ -8,109 +7,48 @@ from dotenv import load_dotenv
 # Load .env so GEMINI_API_KEY is available when running via uvicorn
 load_dotenv()
 
-from google import genai
+from .analysis_cache import analysis_cache
+from .llm_client import AsyncGeminiClient
+from .rules import command_engine, web_engine, verdict, ttps_of
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 # gemini-2.5-flash: confirmed working on free tier
 GEMINI_MODEL = "models/gemini-2.5-flash"
 
-_client: Optional[genai.Client] = None
+# How long a report request may wait for a rate-limit token before falling
+# back to the rule-based report
+REPORT_QUOTA_WAIT_S = float(os.getenv("GEMINI_REPORT_QUOTA_WAIT_S", "10"))
 
-# ─── Rate-Limit Guard ─────────────────────────────────────────────────────────
-# Tracks recent Gemini call timestamps to avoid hammering the free-tier quota.
-# Free tier allows 20 requests per minute (RPM). We stay safe at 15.
-_call_timestamps: list = []
-_MAX_CALLS_PER_MINUTE = 15
+# ─── Gemini Client ────────────────────────────────────────────────────────────
+# Async client with a token-bucket rate limiter (free tier allows 20 RPM; the
+# default stays safe at 15), bounded concurrency and jittered retries.
+gemini = AsyncGeminiClient(GEMINI_API_KEY, GEMINI_MODEL)
 
-# ─── Command-Level Cache ──────────────────────────────────────────────────────
-# Maps command string → analysis result dict to avoid re-calling Gemini for
-# the same command (very common in honeypot simulations).
-_analysis_cache: Dict[str, Dict[str, Any]] = {}
-
-
-def _get_client() -> Optional[genai.Client]:
-    global _client
-    if _client is None and GEMINI_API_KEY:
-        _client = genai.Client(api_key=GEMINI_API_KEY)
-    return _client
-
-
-def _is_quota_available() -> bool:
-    """Return True if we have remaining quota for a Gemini call right now."""
-    now = time.monotonic()
-    # Keep only timestamps from the last 60 seconds
-    recent = [t for t in _call_timestamps if now - t < 60]
-    _call_timestamps.clear()
-    _call_timestamps.extend(recent)
-    return len(recent) < _MAX_CALLS_PER_MINUTE
-
-
-def _record_call():
-    """Record that a Gemini API call was just made."""
-    _call_timestamps.append(time.monotonic())
-
-
-def _call_gemini(prompt: str, retries: int = 1) -> Optional[str]:
+async def _call_gemini(prompt: str, quota_wait: float = 0) -> Optional[str]:
     """
-    Call Gemini with automatic retry on 429 quota errors.
-    Uses a rate-limit guard to avoid wasting retries when quota is exhausted.
-    Returns the response text, or None if all retries fail.
-    NOTE: This is a synchronous function — call via asyncio.to_thread() from
-    async contexts to avoid blocking the event loop.
+    Call Gemini without blocking the event loop.
+    Returns the response text, or None if unavailable/rate-limited/failed.
     """
-    client = _get_client()
-    if not client:
-        print("[Gemini] No API key configured.")
-        return None
-
-    # Check local rate-limit guard before even trying
-    if not _is_quota_available():
-        print("[Gemini] Local rate-limit guard: quota near limit, using rule-based fallback.")
-        return None
-
-    for attempt in range(retries + 1):
-        try:
-            _record_call()
-            response = client.models.generate_content(
-                model=GEMINI_MODEL,
-                contents=prompt,
-            )
-            return response.text
-        except Exception as e:
-            err = str(e)
-            if "429" in err and attempt < retries:
-                wait = 30  # Wait for quota reset
-                print(f"[Gemini] Rate limited. Waiting {wait}s before retry {attempt+1}/{retries}...")
-                time.sleep(wait)
-            else:
-                print(f"[Gemini] Failed after {attempt+1} attempt(s): {type(e).__name__}: {e}")
-                return None
-    return None
-
-
-def analyze_command(command: str) -> Dict[str, Any]:
+    return await gemini.generate(prompt, quota_wait=quota_wait)
+
+
+async def analyze_command(command: str) -> Dict[str, Any]:
     """
     Analyze a shell command for threat level using Gemini.
-    - Checks the command cache first to avoid redundant API calls.
+    - Checks the bounded, persistent analysis cache first (analysis_cache.py).
     - Falls back to rule-based analysis if Gemini is unavailable or rate-limited.
-    NOTE: This is synchronous — in async contexts call via asyncio.to_thread().
+      Fallback results are not cached: the compiled rules are cheap, and the
+      command should get a real Gemini verdict once quota is available again.
     """
     # 1. Cache hit — return immediately, no API call needed
-    if command in _analysis_cache:
-        return _analysis_cache[command]
+    cached = await asyncio.to_thread(analysis_cache.get, command)
+    if cached is not None:
+        return cached
 
-    # 2. No API key — use rule-based fallback instantly
-    if not GEMINI_API_KEY:
-        result = _rule_based_analysis(command)
-        _analysis_cache[command] = result
-        return result
-
-    # 3. Quota guard — fall back without waiting if we're near the limit
-    if not _is_quota_available():
-        result = _rule_based_analysis(command)
-        _analysis_cache[command] = result
-        return result
+    # 2. No API key / quota guard — use rule-based fallback instantly
+    if not GEMINI_API_KEY or not gemini.quota_available():
+        return _rule_based_analysis(command)
 
     prompt = (
         "You are a cybersecurity expert analyzing a command entered by an attacker inside an SSH honeypot.\n"
@@ -123,27 +61,23 @@ def analyze_command(command: str) -> Dict[str, Any]:
         '- "ttp": MITRE ATT&CK technique name (e.g. "T1059 - Command and Scripting Interpreter")'
     )
     try:
-        text = _call_gemini(prompt)
+        text = await _call_gemini(prompt)
         if not text:
-            result = _rule_based_analysis(command)
-            _analysis_cache[command] = result
-            return result
+            return _rule_based_analysis(command)
         text = text.strip()
         if text.startswith("```"):
             text = text.split("```")[1]
             if text.startswith("json"):
                 text = text[4:]
         result = json.loads(text)
-        _analysis_cache[command] = result
+        await asyncio.to_thread(analysis_cache.put, command, result)
         return result
     except Exception as e:
         print(f"Gemini analysis failed: {e}")
-        result = _rule_based_analysis(command)
-        _analysis_cache[command] = result
-        return result
+        return _rule_based_analysis(command)
 
 
-def generate_attacker_profile(attacker_data: Dict[str, Any]) -> str:
+async def generate_attacker_profile(attacker_data: Dict[str, Any]) -> str:
     """
     Generate a detailed attacker profile with TTP mapping using Gemini.
     """
@@ -171,13 +105,15 @@ def generate_attacker_profile(attacker_data: Dict[str, Any]) -> str:
         "5. **Recommended Defensive Actions**\n"
         "Keep it concise but professional. Use markdown formatting."
     )
-    text = _call_gemini(prompt)
+    # Reports are user-initiated, so wait briefly for a token rather than
+    # falling back immediately
+    text = await _call_gemini(prompt, quota_wait=REPORT_QUOTA_WAIT_S)
     if text:
         return text
     return _rule_based_profile(attacker_data)
 
 
-def generate_threat_report(attacker_data: Dict[str, Any]) -> Dict[str, Any]:
+async def generate_threat_report(attacker_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Generate a full structured threat intelligence report.
     Uses Gemini for the narrative; falls back to rule-based analysis when
@@ -219,7 +155,7 @@ def generate_threat_report(attacker_data: Dict[str, Any]) -> Dict[str, Any]:
         '- "ioc": list of indicators of compromise (IPs, usernames, payloads)'
     )
     try:
-        text = _call_gemini(prompt)
+        text = await _call_gemini(prompt, quota_wait=REPORT_QUOTA_WAIT_S)
         if not text:
             # Gemini unavailable — return fully-populated rule-based report
             rule_report["summary"] = (
@@ -245,46 +181,19 @@ def generate_threat_report(attacker_data: Dict[str, Any]) -> Dict[str, Any]:
 def detect_ttps(commands: list, web_attacks: list, credentials: list, services_hit: list) -> list:
     """
     Rule-based TTP detection mapped to MITRE ATT&CK.
+    Each command / payload is matched once against the compiled rule tables.
     Returns a list of TTP tag strings.
     """
     ttps = set()
 
-    all_cmds = " ".join(commands).lower()
-    all_web = " ".join(web_attacks).lower()
-
-    # Recon
-    if any(x in all_cmds for x in ["whoami", "id", "uname", "hostname", "ifconfig", "ip addr"]):
-        ttps.add("T1082 - System Information Discovery")
-    if any(x in all_cmds for x in ["ps", "netstat", "ss "]):
-        ttps.add("T1057 - Process Discovery")
+    for cmd in commands:
+        ttps.update(ttps_of(command_engine.match(cmd)))
+    for payload in web_attacks:
+        ttps.update(ttps_of(web_engine.match(payload)))
 
     # Credential Access
     if credentials:
         ttps.add("T1110 - Brute Force")
-    if any(x in all_cmds for x in ["cat /etc/passwd", "cat /etc/shadow"]):
-        ttps.add("T1003 - OS Credential Dumping")
-
-    # Execution
-    if any(x in all_cmds for x in ["bash -i", "python -c", "perl -e", "ruby -e", "php -r"]):
-        ttps.add("T1059 - Command and Scripting Interpreter")
-
-    # Persistence
-    if any(x in all_cmds for x in ["crontab", ".bashrc", ".profile", "~/.ssh/authorized_keys"]):
-        ttps.add("T1053 - Scheduled Task/Job")
-
-    # Defense Evasion
-    if any(x in all_cmds for x in ["history -c", "unset HISTFILE", "rm -rf /var/log"]):
-        ttps.add("T1070 - Indicator Removal")
-
-    # C2 / Exfiltration
-    if any(x in all_cmds for x in ["wget", "curl", "nc ", "ncat", "socat"]):
-        ttps.add("T1105 - Ingress Tool Transfer")
-
-    # Web Attacks
-    if any(x in all_web for x in ["select", "union", "' or", "1=1", "--"]):
-        ttps.add("T1190 - Exploit Public-Facing Application (SQLi)")
-    if "<script" in all_web:
-        ttps.add("T1059.007 - Cross-Site Scripting")
 
     # Service Probing
     if "mysql" in services_hit:
@@ -301,42 +210,24 @@ def classify_command(command: str) -> Dict[str, Any]:
 
 
 def _rule_based_analysis(command: str) -> Dict[str, Any]:
-    """Fallback rule-based analysis."""
-    cmd = command.lower()
-
-    if any(x in cmd for x in ["wget", "curl", "nc ", "ncat", "bash -i", "python -c", "php -r"]):
-        return {
-            "severity": "CRITICAL",
-            "description": "Attempted reverse shell or malware download.",
-            "action": "Immediate IP Block",
-            "score": 95,
-            "ttp": "T1059 - Command and Scripting Interpreter"
-        }
-
-    if any(x in cmd for x in ["sudo", "rm -rf", "chmod 777", "chown", "dd ", "mkfs"]):
-        return {
-            "severity": "HIGH",
-            "description": "Destructive or privileged command attempt.",
-            "action": "Monitor Closely",
-            "score": 75,
-            "ttp": "T1548 - Abuse Elevation Control Mechanism"
-        }
-
-    if any(x in cmd for x in ["whoami", "id", "pwd", "ls", "uname", "cat /etc/passwd"]):
-        return {
-            "severity": "MEDIUM",
-            "description": "System enumeration and reconnaissance.",
-            "action": "Log Activity",
-            "score": 45,
-            "ttp": "T1082 - System Information Discovery"
-        }
-
+    """
+    Fallback rule-based analysis. The verdict comes from the highest-scoring
+    matched rule; `matches` lists every rule that fired. Rules run on, and
+    are memoized by, the raw command: a template would hide the URLs and
+    paths the rules look for.
+    """
+    matches = command_engine.match(command)
+    top = verdict(matches)
     return {
-        "severity": "LOW",
-        "description": "General shell interaction.",
-        "action": "None",
-        "score": 10,
-        "ttp": "T1059 - Command and Scripting Interpreter"
+        "severity": top.severity,
+        "description": top.description,
+        "action": top.action,
+        "score": top.score,
+        "ttp": top.ttp,
+        "matches": [
+            {"rule": r.rule_id, "ttp": r.ttp, "severity": r.severity, "score": r.score}
+            for r in matches
+        ],
     }
 
 
@@ -352,7 +243,15 @@ def _rule_based_report(attacker_data: Dict[str, Any]) -> Dict[str, Any]:
     ip         = attacker_data.get("ip_address", "Unknown")
     risk_score = attacker_data.get("risk_score", 0)
 
-    ttps = detect_ttps(commands, web_attacks, credentials, services_hit)
+    # Summaries (aggregator.py) carry precomputed TTPs and full counts;
+    # otherwise fall back to scanning the lists we were given.
+    if "ttps" in attacker_data:
+        ttps = list(attacker_data["ttps"])
+    else:
+        ttps = detect_ttps(commands, web_attacks, credentials, services_hit)
+    command_count = attacker_data.get("command_count", len(commands))
+    credential_count = attacker_data.get("credential_count", len(credentials))
+    web_attack_count = attacker_data.get("web_attack_count", len(web_attacks))
 
     # ── Risk Level ────────────────────────────────────────────────────────────
     if risk_score >= 75:
@@ -365,14 +264,17 @@ def _rule_based_report(attacker_data: Dict[str, Any]) -> Dict[str, Any]:
         risk_level = "LOW"
 
     # ── Attacker Type ─────────────────────────────────────────────────────────
-    all_cmds = " ".join(commands).lower()
-    if any(x in all_cmds for x in ["bash -i", "wget", "curl", "nc ", "python -c"]):
+    remote_payload = bool({
+        "T1059 - Command and Scripting Interpreter",
+        "T1105 - Ingress Tool Transfer",
+    } & set(ttps))
+    if remote_payload:
         attacker_type = "Advanced Manual Attacker"
-    elif credentials and not commands:
+    elif credential_count and not command_count:
         attacker_type = "Credential Brute-Force Bot"
-    elif web_attacks:
+    elif web_attack_count:
         attacker_type = "Web Application Attacker"
-    elif commands:
+    elif command_count:
         attacker_type = "Script Kiddie / Opportunistic Attacker"
     else:
         attacker_type = "Automated Scanner"
@@ -380,11 +282,11 @@ def _rule_based_report(attacker_data: Dict[str, Any]) -> Dict[str, Any]:
     # ── Timeline ──────────────────────────────────────────────────────────────
     timeline = []
     if credentials:
-        timeline.append(f"[Credential Phase] {len(credentials)} login attempt(s) observed (e.g. {credentials[0]!r}).")
-    if commands:
-        timeline.append(f"[Execution Phase] {len(commands)} SSH command(s) executed after gaining access.")
-    if web_attacks:
-        timeline.append(f"[Web Attack Phase] {len(web_attacks)} web payload(s) detected.")
+        timeline.append(f"[Credential Phase] {credential_count} login attempt(s) observed (e.g. {credentials[0]!r}).")
+    if command_count:
+        timeline.append(f"[Execution Phase] {command_count} SSH command(s) executed after gaining access.")
+    if web_attack_count:
+        timeline.append(f"[Web Attack Phase] {web_attack_count} web payload(s) detected.")
     if services_hit:
         timeline.append(f"[Service Probing] Honeypot services probed: {', '.join(services_hit)}.")
     if not timeline:
@@ -392,12 +294,12 @@ def _rule_based_report(attacker_data: Dict[str, Any]) -> Dict[str, Any]:
 
     # ── Recommendations ───────────────────────────────────────────────────────
     recs = []
-    if credentials:
+    if credential_count:
         recs.append("Enforce strong password policies and enable MFA on all SSH endpoints.")
         recs.append(f"Block or rate-limit IP {ip} at the firewall level.")
-    if any(x in all_cmds for x in ["wget", "curl", "nc ", "bash -i"]):
+    if remote_payload:
         recs.append("Isolate affected systems immediately and perform forensic triage.")
-    if web_attacks:
+    if web_attack_count:
         recs.append("Review and harden web application input validation; deploy a WAF.")
     if "T1082 - System Information Discovery" in ttps:
         recs.append("Audit exposed system information and restrict command execution where possible.")
@@ -0,0 +1,173 @@
+"""
+analysis_cache.py — Bounded, Persistent Command-Analysis Cache
+
+Replaces the unbounded module-level dict in ai_analyzer. Attacker-controlled
+commands (random filenames, IPs, base64 payloads) can no longer grow memory
+without limit, and Gemini results survive restarts so quota is not spent
+twice on the same command.
+
+Two tiers:
+    memory  LRU with TTL, bounded by entry count
+    disk    `analysis_cache` table, bounded by entry count (oldest-used evicted)
+
+Keys are command templates (normalizer.fingerprint), so variants that only
+differ in C2 address, URL, port or payload share one entry.
+
+Tuning (environment variables):
+    ANALYSIS_CACHE_MEMORY_SIZE   entries kept in memory      (default 2048)
+    ANALYSIS_CACHE_DISK_SIZE     entries kept on disk        (default 50000)
+    ANALYSIS_CACHE_TTL_S         entry lifetime in seconds   (default 7 days)
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from .database import SessionLocal
+from .models import AnalysisCacheEntry
+from .normalizer import fingerprint
+
+ANALYSIS_CACHE_MEMORY_SIZE = int(os.getenv("ANALYSIS_CACHE_MEMORY_SIZE", "2048"))
+ANALYSIS_CACHE_DISK_SIZE = int(os.getenv("ANALYSIS_CACHE_DISK_SIZE", "50000"))
+ANALYSIS_CACHE_TTL_S = float(os.getenv("ANALYSIS_CACHE_TTL_S", str(7 * 24 * 3600)))
+
+# Enforce the disk bound every N writes instead of counting rows on each put
+_DISK_TRIM_EVERY = 256
+
+
+class AnalysisCache:
+    def __init__(
+        self,
+        memory_size: int = ANALYSIS_CACHE_MEMORY_SIZE,
+        disk_size: int = ANALYSIS_CACHE_DISK_SIZE,
+        ttl: float = ANALYSIS_CACHE_TTL_S,
+    ):
+        self.memory_size = max(1, memory_size)
+        self.disk_size = max(1, disk_size)
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    # ── Memory tier ──────────────────────────────────────────────────────────
+
+    def _memory_get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None:
+                return None
+            expires_at, result = item
+            if expires_at < time.time():
+                del self._memory[key]
+                self.stats["expirations"] += 1
+                return None
+            self._memory.move_to_end(key)
+            return result
+
+    def _memory_put(self, key: str, result: Dict[str, Any], expires_at: float):
+        with self._lock:
+            self._memory[key] = (expires_at, result)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    # ── Public API (blocking on a miss — call via asyncio.to_thread) ─────────
+
+    def get(self, command: str) -> Optional[Dict[str, Any]]:
+        key = fingerprint(command)
+        result = self._memory_get(key)
+        if result is not None:
+            self.stats["hits"] += 1
+            return result
+
+        db = SessionLocal()
+        try:
+            entry = db.get(AnalysisCacheEntry, key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            age = (datetime.utcnow() - entry.created_at).total_seconds()
+            if age > self.ttl:
+                db.delete(entry)
+                db.commit()
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return None
+            entry.last_used_at = datetime.utcnow()
+            db.commit()
+            result = json.loads(entry.result_json)
+        finally:
+            db.close()
+
+        self.stats["disk_hits"] += 1
+        self._memory_put(key, result, time.time() + self.ttl - age)
+        return result
+
+    def put(self, command: str, result: Dict[str, Any]):
+        key = fingerprint(command)
+        self._memory_put(key, result, time.time() + self.ttl)
+
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            db.merge(AnalysisCacheEntry(
+                key=key, result_json=json.dumps(result), created_at=now, last_used_at=now
+            ))
+            db.commit()
+            self._writes_since_trim += 1
+            if self._writes_since_trim >= _DISK_TRIM_EVERY:
+                self._writes_since_trim = 0
+                self._trim_disk(db)
+        finally:
+            db.close()
+
+    def _trim_disk(self, db):
+        """Drop expired rows, then the least recently used rows beyond the bound."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        expired = db.query(AnalysisCacheEntry).filter(AnalysisCacheEntry.created_at < cutoff).delete()
+        self.stats["expirations"] += expired
+
+        excess = db.query(AnalysisCacheEntry).count() - self.disk_size
+        if excess > 0:
+            oldest = (
+                db.query(AnalysisCacheEntry.key)
+                .order_by(AnalysisCacheEntry.last_used_at.asc())
+                .limit(excess)
+                .subquery()
+            )
+            evicted = (
+                db.query(AnalysisCacheEntry)
+                .filter(AnalysisCacheEntry.key.in_(oldest.select()))
+                .delete(synchronize_session=False)
+            )
+            self.stats["evictions"] += evicted
+        db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        db = SessionLocal()
+        try:
+            db.query(AnalysisCacheEntry).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "memory_entries": len(self._memory),
+            "memory_size": self.memory_size,
+            "disk_size": self.disk_size,
+            "ttl_s": self.ttl,
+            **self.stats,
+        }
+
+
+# Singleton
+analysis_cache = AnalysisCache()
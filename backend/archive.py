@@ -0,0 +1,371 @@
+"""
+archive.py — Tiered Retention: Parquet Archive for Old Events
+
+The live database keeps recent activity only. A scheduled job moves events
+older than ARCHIVE_AFTER_DAYS out of the raw event tables into columnar
+Parquet files, partitioned by event type and day:
+
+    <ARCHIVE_DIR>/commands/day=2026-01-31/part-<uuid>.parquet
+    <ARCHIVE_DIR>/credentials/day=...
+    <ARCHIVE_DIR>/service_interactions/day=...
+    <ARCHIVE_DIR>/web_attacks/day=...
+
+Rows are denormalized on the way out (attacker IP, service name), so archived
+data can be read without the live tables. Whole days are archived at a time.
+Each chunk's file is written before its rows are deleted. A crash in between
+can leave duplicates in the archive, and readers drop them by id.
+
+Attacker rows, summaries, dashboard counters and threat reports stay live:
+counters keep counting archived events, and reports stay small.
+
+`query_events` reads the live table first and then the archive, newest
+partitions first, stopping once it has enough rows. `/api/history/...` uses
+it, so callers never need to know where a row lives.
+
+Requires `pyarrow`; without it the archive is disabled and the history API
+serves live data only.
+
+Tuning (environment variables):
+    ARCHIVE_DIR           archive root                       (default ./archive)
+    ARCHIVE_AFTER_DAYS    archive events older than N days;  (default 30)
+                          0 disables archiving, scheduled and manual
+    ARCHIVE_INTERVAL_H    hours between archive runs         (default 6)
+    ARCHIVE_BATCH_ROWS    rows moved per transaction         (default 50000)
+"""
+
+import asyncio
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from .database import SessionLocal
+from .models import (
+    Attacker, HoneypotCommand, Credential, WebAttack,
+    ServiceInteraction, DynamicService
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pads
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = pads = pq = None
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_INTERVAL_H = float(os.getenv("ARCHIVE_INTERVAL_H", "6"))
+ARCHIVE_BATCH_ROWS = int(os.getenv("ARCHIVE_BATCH_ROWS", "50000"))
+
+
+def archive_available() -> bool:
+    return pa is not None
+
+
+# ─── Event Tables ────────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class EventTable:
+    name: str
+    model: Any
+    columns: Dict[str, Any]                  # archived column → SQL expression
+    joins: Callable[[Any], Any] = lambda q: q
+    ip_column: Any = None                    # SQL expression for IP filtering
+
+    def query(self, db):
+        return self.joins(db.query(*[expr.label(col) for col, expr in self.columns.items()]))
+
+    def arrow_schema(self):
+        return pa.schema([
+            (col, pa.timestamp("us") if col == "timestamp" else pa.int64() if col.endswith("id") else pa.string())
+            for col in self.columns
+        ])
+
+
+def _with_attacker(model):
+    return lambda q: q.outerjoin(Attacker, model.attacker_id == Attacker.id)
+
+
+EVENT_TABLES: Dict[str, EventTable] = {
+    "commands": EventTable(
+        name="commands",
+        model=HoneypotCommand,
+        columns={
+            "id": HoneypotCommand.id,
+            "attacker_id": HoneypotCommand.attacker_id,
+            "attacker_ip": Attacker.ip_address,
+            "command": HoneypotCommand.command,
+            "fingerprint": HoneypotCommand.fingerprint,
+            "severity": HoneypotCommand.severity,
+            "ttp": HoneypotCommand.ttp,
+            "timestamp": HoneypotCommand.timestamp,
+        },
+        joins=_with_attacker(HoneypotCommand),
+        ip_column=Attacker.ip_address,
+    ),
+    "credentials": EventTable(
+        name="credentials",
+        model=Credential,
+        columns={
+            "id": Credential.id,
+            "attacker_id": Credential.attacker_id,
+            "attacker_ip": Attacker.ip_address,
+            "username": Credential.username,
+            "password": Credential.password,
+            "source": Credential.source,
+            "timestamp": Credential.timestamp,
+        },
+        joins=_with_attacker(Credential),
+        ip_column=Attacker.ip_address,
+    ),
+    "web_attacks": EventTable(
+        name="web_attacks",
+        model=WebAttack,
+        columns={
+            "id": WebAttack.id,
+            "attacker_id": WebAttack.attacker_id,
+            "attacker_ip": Attacker.ip_address,
+            "endpoint": WebAttack.endpoint,
+            "payload": WebAttack.payload,
+            "user_agent": WebAttack.user_agent,
+            "timestamp": WebAttack.timestamp,
+        },
+        joins=_with_attacker(WebAttack),
+        ip_column=Attacker.ip_address,
+    ),
+    "service_interactions": EventTable(
+        name="service_interactions",
+        model=ServiceInteraction,
+        columns={
+            "id": ServiceInteraction.id,
+            "service_id": ServiceInteraction.service_id,
+            "service_name": DynamicService.name,
+            "attacker_id": ServiceInteraction.attacker_id,
+            "attacker_ip": ServiceInteraction.attacker_ip,
+            "raw_data": ServiceInteraction.raw_data,
+            "timestamp": ServiceInteraction.timestamp,
+        },
+        joins=lambda q: q.outerjoin(DynamicService, ServiceInteraction.service_id == DynamicService.id),
+        ip_column=ServiceInteraction.attacker_ip,
+    ),
+}
+
+
+# ─── Archiving ───────────────────────────────────────────────────────────────
+
+def _partition_dir(root: str, table: str, day: str) -> str:
+    return os.path.join(root, table, f"day={day}")
+
+
+def _archive_table(db, table: EventTable, cutoff: datetime, root: str, batch_rows: int) -> int:
+    moved = 0
+    ts = table.model.timestamp
+    while True:
+        rows = (
+            table.query(db)
+            .filter(ts < cutoff)
+            .order_by(ts, table.model.id)
+            .limit(batch_rows)
+            .all()
+        )
+        if not rows:
+            return moved
+
+        by_day: Dict[str, List[Any]] = {}
+        for row in rows:
+            by_day.setdefault(row.timestamp.date().isoformat(), []).append(row)
+
+        schema = table.arrow_schema()
+        for day, day_rows in by_day.items():
+            directory = _partition_dir(root, table.name, day)
+            os.makedirs(directory, exist_ok=True)
+            arrays = {col: [getattr(r, col) for r in day_rows] for col in table.columns}
+            path = os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet")
+            pq.write_table(pa.table(arrays, schema=schema), path + ".tmp", compression="zstd")
+            os.replace(path + ".tmp", path)
+
+        ids = [row.id for row in rows]
+        db.query(table.model).filter(table.model.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        moved += len(rows)
+
+
+def run_archive(
+    after_days: int = ARCHIVE_AFTER_DAYS,
+    root: str = ARCHIVE_DIR,
+    batch_rows: int = ARCHIVE_BATCH_ROWS,
+) -> Dict[str, Any]:
+    """Move whole days older than `after_days` into the archive. Blocking — run in a thread."""
+    if after_days <= 0:
+        # 0 means "archiving off", not "archive everything before today"
+        return {"status": "disabled", "reason": "ARCHIVE_AFTER_DAYS is 0"}
+    if not archive_available():
+        return {"status": "disabled", "reason": "pyarrow is not installed"}
+
+    started = datetime.utcnow()
+    cutoff = (started - timedelta(days=after_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    db = SessionLocal()
+    try:
+        moved = {
+            name: _archive_table(db, table, cutoff, root, max(1, batch_rows))
+            for name, table in EVENT_TABLES.items()
+        }
+    finally:
+        db.close()
+    return {
+        "status": "ok",
+        "cutoff": cutoff,
+        "moved": moved,
+        "duration_s": round((datetime.utcnow() - started).total_seconds(), 3),
+        "finished_at": datetime.utcnow(),
+    }
+
+
+class ArchiveScheduler:
+    def __init__(self, after_days: int = ARCHIVE_AFTER_DAYS, interval_h: float = ARCHIVE_INTERVAL_H):
+        self.after_days = after_days
+        self.interval = interval_h * 3600
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def start(self):
+        if self.after_days <= 0:
+            return
+        if not archive_available():
+            print("[Archive] pyarrow not installed — event archival disabled.")
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+            print(f"[Archive] Archiving events older than {self.after_days} days every {self.interval / 3600:g}h.")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> Dict[str, Any]:
+        if self.after_days <= 0:
+            return run_archive(self.after_days)
+        # One run at a time; shielded so shutdown cannot interrupt a half-moved chunk
+        async with self._lock:
+            self.last_run = await asyncio.shield(asyncio.to_thread(run_archive, self.after_days))
+        moved = sum((self.last_run.get("moved") or {}).values())
+        if moved:
+            print(f"[Archive] Moved {moved} events older than {self.last_run['cutoff']:%Y-%m-%d} to {ARCHIVE_DIR}.")
+        return self.last_run
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Archive] Run failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+# ─── Querying ────────────────────────────────────────────────────────────────
+
+def _archived_days(root: str, table: str) -> List[str]:
+    """Partition days on disk, newest first."""
+    base = os.path.join(root, table)
+    if not os.path.isdir(base):
+        return []
+    return sorted(
+        (entry[4:] for entry in os.listdir(base) if entry.startswith("day=")),
+        reverse=True,
+    )
+
+
+def _query_archive(
+    table: EventTable, root: str, since: Optional[datetime], until: Optional[datetime],
+    ip: Optional[str], limit: int, seen_ids: set,
+) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    for day in _archived_days(root, table.name):
+        if until is not None and day > until.date().isoformat():
+            continue
+        if since is not None and day < since.date().isoformat():
+            break
+        expr = None
+        for condition in (
+            pads.field("timestamp") >= pa.scalar(since, pa.timestamp("us")) if since else None,
+            pads.field("timestamp") < pa.scalar(until, pa.timestamp("us")) if until else None,
+            pads.field("attacker_ip") == ip if ip else None,
+        ):
+            if condition is not None:
+                expr = condition if expr is None else expr & condition
+        dataset = pads.dataset(_partition_dir(root, table.name, day), format="parquet")
+        day_table = dataset.to_table(filter=expr).sort_by([("timestamp", "descending"), ("id", "descending")])
+        for row in day_table.to_pylist():
+            if row["id"] in seen_ids:
+                continue
+            seen_ids.add(row["id"])
+            rows.append(row)
+            if len(rows) >= limit:
+                return rows
+    return rows
+
+
+def query_events(
+    event_type: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    ip: Optional[str] = None,
+    limit: int = 1000,
+    root: str = ARCHIVE_DIR,
+) -> List[Dict[str, Any]]:
+    """Newest-first events of one type across the live table and the archive."""
+    table = EVENT_TABLES[event_type]
+    ts = table.model.timestamp
+
+    db = SessionLocal()
+    try:
+        query = table.query(db)
+        if since is not None:
+            query = query.filter(ts >= since)
+        if until is not None:
+            query = query.filter(ts < until)
+        if ip:
+            query = query.filter(table.ip_column == ip)
+        live = [
+            dict(row._mapping)
+            for row in query.order_by(ts.desc(), table.model.id.desc()).limit(limit)
+        ]
+    finally:
+        db.close()
+
+    if len(live) >= limit or not archive_available():
+        return live
+    # Live rows are always newer than the archive cutoff, so the archive only fills the tail
+    seen_ids = {row["id"] for row in live}
+    return live + _query_archive(table, root, since, until, ip, limit - len(live), seen_ids)
+
+
+def archive_info(root: str = ARCHIVE_DIR) -> Dict[str, Any]:
+    tables = {}
+    for name in EVENT_TABLES:
+        days = _archived_days(root, name)
+        files = size = 0
+        for day in days:
+            directory = _partition_dir(root, name, day)
+            for entry in os.listdir(directory):
+                if entry.endswith(".parquet"):
+                    files += 1
+                    size += os.path.getsize(os.path.join(directory, entry))
+        tables[name] = {
+            "days": len(days),
+            "oldest_day": days[-1] if days else None,
+            "newest_day": days[0] if days else None,
+            "files": files,
+            "bytes": size,
+        }
+    return {"available": archive_available(), "root": os.path.abspath(root), "tables": tables}
+
+
+# Singleton
+archive_scheduler = ArchiveScheduler()
@@ -0,0 +1,149 @@
+"""
+attacker_cache.py — Attacker Identity Cache
+
+Bounded LRU/TTL cache mapping an attacker IP to its `Attacker.id`, current
+risk score and technique bitset (see techniques.py). Every honeypot event has to resolve its attacker, so
+hot IPs are answered from memory instead of a SELECT per event. Changes are
+written through to the database with a single UPDATE by primary key.
+
+Tuning (environment variables):
+    ATTACKER_CACHE_SIZE   max IPs kept in memory        (default 50000)
+    ATTACKER_CACHE_TTL    seconds before re-reading row (default 600)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Optional, Set, Tuple
+
+from .models import Attacker
+from .techniques import technique_catalog
+
+ATTACKER_CACHE_SIZE = int(os.getenv("ATTACKER_CACHE_SIZE", "50000"))
+ATTACKER_CACHE_TTL = float(os.getenv("ATTACKER_CACHE_TTL", "600"))
+
+
+@dataclass
+class AttackerEntry:
+    id: int
+    ip_address: str
+    risk_score: int = 0
+    techniques: int = 0  # bitset of Technique ids
+    expires_at: float = 0.0
+
+
+def _split_ttps(ttp_tags: Optional[str]) -> Set[str]:
+    return set(filter(None, (ttp_tags or "").split(",")))
+
+
+class AttackerCache:
+    """Thread-safe LRU of attacker identities with write-through updates."""
+
+    def __init__(self, max_size: int = ATTACKER_CACHE_SIZE, ttl: float = ATTACKER_CACHE_TTL):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, AttackerEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "inserts": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, ip: str) -> Optional[AttackerEntry]:
+        """Return the cached entry for `ip` without touching the database."""
+        with self._lock:
+            entry = self._entries.get(ip)
+            if entry is None:
+                return None
+            if entry.expires_at < time.monotonic():
+                del self._entries[ip]
+                return None
+            self._entries.move_to_end(ip)
+            return entry
+
+    def _store(self, entry: AttackerEntry) -> AttackerEntry:
+        entry.expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[entry.ip_address] = entry
+            self._entries.move_to_end(entry.ip_address)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return entry
+
+    def upsert(
+        self, db, ip: str, geo: Optional[dict] = None, risk_score: int = 0
+    ) -> Tuple[AttackerEntry, bool]:
+        """
+        Resolve `ip` to its attacker entry, inserting the row if it is new.
+        New rows are only flushed — the caller's transaction commits them.
+        Returns (entry, created).
+        """
+        entry = self.get(ip)
+        if entry is not None:
+            self.stats["hits"] += 1
+            return entry, False
+        self.stats["misses"] += 1
+
+        attacker = db.query(Attacker).filter(Attacker.ip_address == ip).first()
+        created = attacker is None
+        if created:
+            attacker = Attacker(ip_address=ip, risk_score=risk_score, ttp_tags="")
+            if geo:
+                attacker.city = geo["city"]
+                attacker.country = geo["country"]
+                attacker.latitude = geo["lat"]
+                attacker.longitude = geo["lon"]
+            db.add(attacker)
+            db.flush()  # assign attacker.id without committing
+            self.stats["inserts"] += 1
+
+        return self._store(AttackerEntry(
+            id=attacker.id,
+            ip_address=ip,
+            risk_score=attacker.risk_score or 0,
+            techniques=technique_catalog.bits(db, _split_ttps(attacker.ttp_tags)),
+        )), created
+
+    def update(
+        self,
+        db,
+        entry: AttackerEntry,
+        risk_score: Optional[int] = None,
+        techniques: int = 0,
+        last_seen: Optional[datetime] = None,
+    ):
+        """
+        Merge a new risk score / technique bitset into `entry` and write only
+        the columns that changed with one UPDATE by primary key (no SELECT).
+        """
+        values = {}
+        if risk_score is not None and risk_score > entry.risk_score:
+            entry.risk_score = risk_score
+            values["risk_score"] = risk_score
+
+        if techniques & ~entry.techniques:
+            entry.techniques |= techniques
+            values["ttp_tags"] = technique_catalog.render(db, entry.techniques)
+
+        if last_seen is not None:
+            values["last_seen"] = last_seen
+
+        if values:
+            db.query(Attacker).filter(Attacker.id == entry.id).update(values, synchronize_session=False)
+
+    def invalidate(self, ips: Optional[Iterable[str]] = None):
+        """Forget the given IPs (or everything) — used after rollbacks and resets."""
+        with self._lock:
+            if ips is None:
+                self._entries.clear()
+                return
+            for ip in ips:
+                self._entries.pop(ip, None)
+
+
+# Singleton
+attacker_cache = AttackerCache()
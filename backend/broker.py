@@ -0,0 +1,457 @@
+"""
+broker.py — Local Message Bus for Multi-Process Mode
+
+In multi-process mode (see cluster.py) the honeypot listeners, the API
+workers and the hub that owns the database writer run as separate processes.
+They talk over one local socket: a Unix domain socket where available,
+loopback TCP otherwise (Windows).
+
+Every message is a length-prefixed JSON frame (4-byte big-endian length):
+
+    {"op": "hello",   "role": "ssh", "topics": [...], "serves": [...]}
+    {"op": "event",   "event": {...}}                  listener → hub ingestion
+    {"op": "publish", "topic": "live", "data": {...}}
+    {"op": "state",   "values": {key: value, ...}}     shared state, last write wins
+    {"op": "call",    "id": 7, "method": "reports.submit", "args": {...}, "all": false}
+    {"op": "reply",   "id": 7, "result": ..., "error": null}
+
+The hub answers calls for the methods it registered. A call whose prefix
+(`services.` in `services.spawn`) is served by a connected peer is routed to
+that peer and its reply routed back; with `"all": true` it goes to every
+peer serving the prefix (listener shards) and the reply lists each one's
+result. Published messages go to every peer
+subscribed to the topic; a peer whose socket buffer is over
+BROKER_MAX_BUFFER_BYTES misses them instead of stalling the others.
+
+Clients reconnect with backoff. Events and publishes sent while the hub is
+unreachable wait in a bounded backlog (oldest dropped first).
+
+Tuning (environment variables):
+    BROKER_ADDRESS            unix:<path> or tcp:<host>:<port>
+                              (default unix:<tmp>/honeypot-broker.sock,
+                               tcp:127.0.0.1:7878 on Windows)
+    BROKER_MAX_BUFFER_BYTES   unsent bytes per peer before publishes drop (default 4 MiB)
+    BROKER_BACKLOG            client frames kept while disconnected      (default 10000)
+    BROKER_CALL_TIMEOUT_S     seconds to wait for a call's reply         (default 10)
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import socket
+import struct
+import tempfile
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+
+from .pagination import json_default
+
+
+def _default_address() -> str:
+    if os.name != "nt" and hasattr(socket, "AF_UNIX"):
+        return "unix:" + os.path.join(tempfile.gettempdir(), "honeypot-broker.sock")
+    return "tcp:127.0.0.1:7878"
+
+
+BROKER_ADDRESS = os.getenv("BROKER_ADDRESS") or _default_address()
+BROKER_MAX_BUFFER_BYTES = int(os.getenv("BROKER_MAX_BUFFER_BYTES", str(4 * 1024 * 1024)))
+BROKER_BACKLOG = int(os.getenv("BROKER_BACKLOG", "10000"))
+BROKER_CALL_TIMEOUT_S = float(os.getenv("BROKER_CALL_TIMEOUT_S", "10"))
+
+_HEADER = struct.Struct(">I")
+_MAX_FRAME = 16 * 1024 * 1024
+_RECONNECT_MIN_S = 0.2
+_RECONNECT_MAX_S = 5.0
+
+
+class BrokerError(Exception):
+    """A call failed: unknown method, handler error, lost peer or timeout."""
+
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """"unix:/path" → ("unix", "/path"); "tcp:host:port" → ("tcp", (host, port))."""
+    kind, _, rest = address.partition(":")
+    if kind == "unix" and rest:
+        return "unix", rest
+    if kind == "tcp" and rest:
+        host, _, port = rest.rpartition(":")
+        return "tcp", (host or "127.0.0.1", int(port))
+    raise ValueError(f"Invalid BROKER_ADDRESS {address!r} (expected unix:<path> or tcp:<host>:<port>)")
+
+
+async def open_connection(address: str = BROKER_ADDRESS):
+    kind, target = parse_address(address)
+    if kind == "unix":
+        return await asyncio.open_unix_connection(target)
+    return await asyncio.open_connection(*target)
+
+
+def encode(message: Dict[str, Any]) -> bytes:
+    body = json.dumps(message, default=json_default, separators=(",", ":")).encode()
+    return _HEADER.pack(len(body)) + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    """Next message, or None at end of stream."""
+    try:
+        header = await reader.readexactly(_HEADER.size)
+        (length,) = _HEADER.unpack(header)
+        if length > _MAX_FRAME:
+            raise BrokerError(f"Frame of {length} bytes exceeds the {_MAX_FRAME} byte limit")
+        return json.loads(await reader.readexactly(length))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+# ─── Hub side ────────────────────────────────────────────────────────────────
+
+class _Peer:
+    """One connected process as seen by the hub."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.role = "?"
+        self.pid: Optional[int] = None
+        self.topics: Set[str] = set()
+        self.serves: Set[str] = set()
+        self.dropped = 0
+
+    def send(self, frame: bytes, droppable: bool = False) -> bool:
+        transport = self.writer.transport
+        if transport.is_closing():
+            return False
+        if droppable and transport.get_write_buffer_size() > BROKER_MAX_BUFFER_BYTES:
+            self.dropped += 1
+            return False
+        self.writer.write(frame)
+        return True
+
+
+class BrokerServer:
+    def __init__(self, address: str = BROKER_ADDRESS):
+        self.address = address
+        self.on_event: Optional[Callable[[Dict[str, Any]], Awaitable[Any]]] = None
+        self.state: Dict[str, Any] = {}
+        self.stats = {"events": 0, "published": 0, "calls": 0, "dropped": 0}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Set[_Peer] = set()
+        self._methods: Dict[str, Callable[..., Awaitable[Any]]] = {}
+        self._routed: Dict[int, Tuple[asyncio.Future, _Peer]] = {}  # forwarded call id → (reply, callee)
+        self._ids = itertools.count(1)
+
+    def register(self, method: str, handler: Callable[..., Awaitable[Any]]):
+        """Answer `method` calls in the hub with `await handler(**args)`."""
+        self._methods[method] = handler
+
+    async def start(self):
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            if os.path.exists(target):
+                os.unlink(target)  # stale socket from a previous run
+            self._server = await asyncio.start_unix_server(self._handle, target)
+        else:
+            self._server = await asyncio.start_server(self._handle, *target)
+        print(f"[Broker] Listening on {self.address}")
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        for peer in list(self._peers):
+            peer.writer.close()
+        await self._server.wait_closed()
+        self._server = None
+        kind, target = parse_address(self.address)
+        if kind == "unix" and os.path.exists(target):
+            os.unlink(target)
+
+    # ── Fan-out ──────────────────────────────────────────────────────────────
+
+    def publish(self, topic: str, data: Dict[str, Any]):
+        """Send `data` to every peer subscribed to `topic`. Never blocks."""
+        self.stats["published"] += 1
+        frame = encode({"op": "publish", "topic": topic, "data": data})
+        for peer in list(self._peers):
+            if topic in peer.topics and not peer.send(frame, droppable=True):
+                self.stats["dropped"] += 1
+
+    def set_state(self, values: Dict[str, Any]):
+        self.state.update(values)
+        frame = encode({"op": "state", "values": values})
+        for peer in list(self._peers):
+            peer.send(frame)
+
+    def peers(self):
+        return [
+            {"role": p.role, "pid": p.pid, "topics": sorted(p.topics), "serves": sorted(p.serves),
+             "buffered_bytes": p.writer.transport.get_write_buffer_size(), "dropped": p.dropped}
+            for p in self._peers
+        ]
+
+    # ── Connections ──────────────────────────────────────────────────────────
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = _Peer(writer)
+        self._peers.add(peer)
+        try:
+            while True:
+                message = await read_frame(reader)
+                if message is None:
+                    break
+                await self._dispatch(peer, message)
+        except (ConnectionError, BrokerError, ValueError) as e:
+            print(f"[Broker] Dropping {peer.role} peer: {e}")
+        finally:
+            self._peers.discard(peer)
+            self._fail_routed(peer)
+            writer.close()
+            if peer.pid is not None:
+                print(f"[Broker] {peer.role} (pid {peer.pid}) disconnected")
+
+    async def _dispatch(self, peer: _Peer, message: Dict[str, Any]):
+        op = message.get("op")
+        if op == "event":
+            self.stats["events"] += 1
+            if self.on_event is not None:
+                # Awaited in the read loop so a blocking ingest queue pushes back on the sender
+                await self.on_event(message["event"])
+        elif op == "publish":
+            self.publish(message["topic"], message.get("data"))
+        elif op == "state":
+            self.set_state(message.get("values") or {})
+        elif op == "call":
+            self.stats["calls"] += 1
+            asyncio.create_task(self._call(peer, message))
+        elif op == "reply":
+            routed = self._routed.get(message.get("id"))
+            if routed is not None and not routed[0].done():
+                future = routed[0]
+                if message.get("error"):
+                    future.set_exception(BrokerError(message["error"]))
+                else:
+                    future.set_result(message.get("result"))
+        elif op == "hello":
+            peer.role = message.get("role", "?")
+            peer.pid = message.get("pid")
+            peer.topics = set(message.get("topics") or ())
+            peer.serves = set(message.get("serves") or ())
+            peer.send(encode({"op": "state", "values": self.state}))
+            print(f"[Broker] {peer.role} (pid {peer.pid}) connected")
+
+    async def _call(self, peer: _Peer, message: Dict[str, Any]):
+        method = message.get("method", "")
+        prefix = method.split(".", 1)[0]
+        callees = [p for p in self._peers if prefix in p.serves]
+        reply = {"op": "reply", "id": message.get("id"), "result": None, "error": None}
+        try:
+            if callees and message.get("all"):
+                # Fan out to every shard serving the prefix; one result per shard
+                outcomes = await asyncio.gather(
+                    *(self._forward(callee, message) for callee in callees), return_exceptions=True
+                )
+                reply["result"] = [
+                    {"role": callee.role, "pid": callee.pid,
+                     "result": None if isinstance(outcome, Exception) else outcome,
+                     "error": str(outcome) if isinstance(outcome, Exception) else None}
+                    for callee, outcome in zip(callees, outcomes)
+                ]
+            elif callees:
+                reply["result"] = await self._forward(callees[0], message)
+            elif method in self._methods:
+                reply["result"] = await self._methods[method](**(message.get("args") or {}))
+            else:
+                reply["error"] = f"No process serves {method!r}"
+        except Exception as e:
+            reply["error"] = str(e) if isinstance(e, BrokerError) else f"{type(e).__name__}: {e}"
+        peer.send(encode(reply))
+
+    async def _forward(self, callee: _Peer, message: Dict[str, Any]) -> Any:
+        """Send a call to the peer that serves it and wait for its reply."""
+        call_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._routed[call_id] = (future, callee)
+        try:
+            callee.send(encode({**message, "id": call_id}))
+            return await asyncio.wait_for(future, BROKER_CALL_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            raise BrokerError(f"{callee.role} did not answer {message.get('method')!r}") from None
+        finally:
+            self._routed.pop(call_id, None)
+
+    def _fail_routed(self, gone: _Peer):
+        """Fail calls that were routed to a peer that went away."""
+        for future, callee in list(self._routed.values()):
+            if callee is gone and not future.done():
+                future.set_exception(BrokerError(f"{gone.role} process disconnected"))
+
+
+# ─── Process side ────────────────────────────────────────────────────────────
+
+class BrokerClient:
+    """A process's connection to the hub, reconnecting in the background."""
+
+    def __init__(self, role: str, topics=(), serves=(), address: str = BROKER_ADDRESS):
+        self.role = role
+        self.address = address
+        self.topics = tuple(topics)
+        self.serves = tuple(serves)
+        self.state: Dict[str, Any] = {}
+        self._own_state: Dict[str, Any] = {}
+        self.connected = asyncio.Event()
+        self.stats = {"sent": 0, "backlogged": 0, "dropped": 0, "reconnects": 0}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._backlog: Deque[bytes] = deque()
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+        self._methods: Dict[str, Callable[..., Awaitable[Any]]] = {}
+        self._calls: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, topic: str, handler: Callable[[Dict[str, Any]], None]):
+        """Call `handler(data)` for every message published on `topic`."""
+        self._handlers[topic] = handler
+
+    def serve(self, method: str, handler: Callable[..., Awaitable[Any]]):
+        """Answer `method` calls routed to this process (its prefix must be in `serves`)."""
+        self._methods[method] = handler
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # ── Sending ──────────────────────────────────────────────────────────────
+
+    def _send(self, message: Dict[str, Any]):
+        frame = encode(message)
+        writer = self._writer
+        if writer is not None and not writer.transport.is_closing():
+            writer.write(frame)
+            self.stats["sent"] += 1
+            return
+        if len(self._backlog) >= BROKER_BACKLOG:
+            self._backlog.popleft()
+            self.stats["dropped"] += 1
+        self._backlog.append(frame)
+        self.stats["backlogged"] += 1
+
+    def send_event(self, event: Dict[str, Any]):
+        self._send({"op": "event", "event": event})
+
+    def publish(self, topic: str, data: Dict[str, Any]):
+        self._send({"op": "publish", "topic": topic, "data": data})
+
+    def set_state(self, values: Dict[str, Any]):
+        """Share `values` with every process; re-sent after a reconnect."""
+        self.state.update(values)
+        self._own_state.update(values)
+        self._send({"op": "state", "values": values})
+
+    async def call(
+        self, method: str, timeout: float = BROKER_CALL_TIMEOUT_S, broadcast: bool = False, **args
+    ) -> Any:
+        """
+        Run `method` in whichever process serves it and return its result.
+        With `broadcast`, run it in every process serving it and return a list
+        of {"role", "pid", "result", "error"}.
+        """
+        try:
+            await asyncio.wait_for(self.connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise BrokerError(f"Broker at {self.address} is unreachable") from None
+        call_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._calls[call_id] = future
+        self._send({"op": "call", "id": call_id, "method": method, "args": args, "all": broadcast})
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise BrokerError(f"{method} timed out after {timeout:.0f}s") from None
+        finally:
+            self._calls.pop(call_id, None)
+
+    # ── Connection loop ──────────────────────────────────────────────────────
+
+    async def _run(self):
+        delay = _RECONNECT_MIN_S
+        while True:
+            try:
+                reader, writer = await open_connection(self.address)
+            except OSError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _RECONNECT_MAX_S)
+                continue
+            delay = _RECONNECT_MIN_S
+            writer.write(encode({
+                "op": "hello", "role": self.role, "pid": os.getpid(),
+                "topics": list(self.topics), "serves": list(self.serves),
+            }))
+            if self._own_state:
+                writer.write(encode({"op": "state", "values": self._own_state}))
+            while self._backlog:
+                writer.write(self._backlog.popleft())
+            self._writer = writer
+            self.connected.set()
+            print(f"[Broker] {self.role} connected to {self.address}")
+            try:
+                while True:
+                    message = await read_frame(reader)
+                    if message is None:
+                        break
+                    self._dispatch(message)
+            except (ConnectionError, BrokerError, ValueError) as e:
+                print(f"[Broker] Connection lost: {e}")
+            finally:
+                self.connected.clear()
+                self._writer = None
+                writer.close()
+                for future in self._calls.values():
+                    if not future.done():
+                        future.set_exception(BrokerError("Broker connection lost"))
+            self.stats["reconnects"] += 1
+            print(f"[Broker] {self.role} disconnected from hub; reconnecting...")
+
+    def _dispatch(self, message: Dict[str, Any]):
+        op = message.get("op")
+        if op == "publish":
+            handler = self._handlers.get(message.get("topic"))
+            if handler is not None:
+                handler(message.get("data"))
+        elif op == "state":
+            self.state.update(message.get("values") or {})
+        elif op == "reply":
+            future = self._calls.get(message.get("id"))
+            if future is not None and not future.done():
+                if message.get("error"):
+                    future.set_exception(BrokerError(message["error"]))
+                else:
+                    future.set_result(message.get("result"))
+        elif op == "call":
+            asyncio.create_task(self._answer(message))
+
+    async def _answer(self, message: Dict[str, Any]):
+        reply = {"op": "reply", "id": message.get("id"), "result": None, "error": None}
+        handler = self._methods.get(message.get("method"))
+        if handler is None:
+            reply["error"] = f"{self.role} does not serve {message.get('method')!r}"
+        else:
+            try:
+                reply["result"] = await handler(**(message.get("args") or {}))
+            except Exception as e:
+                reply["error"] = f"{type(e).__name__}: {e}"
+        self._send(reply)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "role": self.role,
+            "address": self.address,
+            "connected": self.connected.is_set(),
+            "backlog": len(self._backlog),
+            **self.stats,
+        }
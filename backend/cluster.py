@@ -0,0 +1,401 @@
+"""
+cluster.py — Multi-Process Deployment
+
+By default (HONEYPOT_PROCESS_MODE=single) everything runs inside the uvicorn
+process, as before. Multi-process mode splits the system into processes that
+talk over the local broker (broker.py), so listeners and API workers can use
+every core:
+
+    hub       the broker, the only database writer (ingestion + attacker
+              cache), report jobs, the archiver and the Gemini rate limiter
+    ssh       the SSH honeypot                      } LISTENER_SHARDS processes
+    services  the fake TCP services; answers        } each, sharing their ports
+              `services.*` calls                    } with SO_REUSEPORT
+    web       the web honeypot router on its own port (optional — the API
+              workers serve /admin too)
+    api       uvicorn backend.main:app --workers N, with
+              HONEYPOT_PROCESS_MODE=multi
+
+Listener and API processes forward events and live-feed messages to the hub
+instead of handling them locally. State is shared like this:
+
+    ingestion, attacker cache   hub only, one writer however many producers
+    Gemini token bucket         hub; other processes acquire through it
+    report jobs                 queued and tracked in the hub
+    running services            each services shard publishes them as broker
+                                state; every API worker keeps a mirror, and
+                                start/stop calls go to every shard
+    listener shard health       each ssh/services shard publishes its counters
+                                every SHARD_REPORT_INTERVAL_S (shard_stats.py)
+    analysis cache              memory tier per process over the shared
+                                `analysis_cache` table
+    dashboard live feed         every publish fans out to all API workers
+
+Usage:
+    python -m backend.cluster all [--workers 4] [--shards 2] [--host 0.0.0.0] [--port 8000] [--web]
+    python -m backend.cluster hub | ssh | services | web
+
+Tuning (environment variables):
+    HONEYPOT_PROCESS_MODE   "single" (default) or "multi"; set for you by `all`
+    WEB_HONEYPOT_PORT       port of the standalone web role  (default 8080)
+    LISTENER_SHARDS         default for --shards (see shard_stats.py)
+    HONEYPOT_RUNTIME        event loop / backlog / pre-warm profile, applied
+                            to every process (see runtime.py)
+    BROKER_*                see broker.py
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from .ai_analyzer import gemini
+from .aggregator import backfill_fingerprints, backfill_summaries
+from .analysis_cache import analysis_cache
+from .archive import archive_scheduler
+from .attacker_cache import attacker_cache
+from .broker import BROKER_ADDRESS, BROKER_CALL_TIMEOUT_S, BrokerClient, BrokerError, BrokerServer, parse_address
+from .database import SessionLocal, async_engine, engine
+from .dynamic_services import AUTOSTART_SERVICES, service_manager
+from .ingestion import event_from_dict, ingestor
+from .migrations import migrate
+from .report_jobs import report_jobs
+from .runtime import LISTEN_BACKLOG, install_event_loop, prewarm, uvicorn_args
+from .shard_stats import (
+    LISTENER_SHARD, LISTENER_SHARDS, REUSE_PORT_SUPPORTED, SHARD_REPORT_INTERVAL_S, shard_report, shard_state_key,
+)
+from .stats_counters import backfill_counters
+from .websocket_manager import manager
+
+PROCESS_MODE = os.getenv("HONEYPOT_PROCESS_MODE", "single").lower()
+MULTI_PROCESS = PROCESS_MODE == "multi"
+WEB_HONEYPOT_PORT = int(os.getenv("WEB_HONEYPOT_PORT", "8080"))
+
+ROLES = ("hub", "ssh", "services", "web")
+
+
+async def run_backfills():
+    """One-time rollups for databases recorded before summaries, fingerprints and counters existed."""
+    db = SessionLocal()
+    try:
+        built = await asyncio.to_thread(backfill_summaries, db)
+        if built:
+            print(f"[Startup] Built {built} attacker summaries from history.")
+        filled = await asyncio.to_thread(backfill_fingerprints, db)
+        if filled:
+            print(f"[Startup] Fingerprinted {filled} stored commands.")
+        if await asyncio.to_thread(backfill_counters, db):
+            print("[Startup] Seeded dashboard counters from history.")
+    finally:
+        db.close()
+
+
+# ─── Proxies used outside the hub ────────────────────────────────────────────
+
+class RemoteTokenBucket:
+    """Stand-in for the Gemini TokenBucket that takes tokens from the hub's bucket."""
+
+    def __init__(self, client: BrokerClient):
+        self.client = client
+
+    def available(self) -> bool:
+        return bool(self.client.state.get("gemini.quota_available", True))
+
+    async def acquire(self, timeout: float = 0) -> bool:
+        try:
+            return bool(await self.client.call("gemini.acquire", timeout=timeout + BROKER_CALL_TIMEOUT_S, wait=timeout))
+        except BrokerError as e:
+            print(f"[Gemini] Shared rate limiter unavailable ({e}).")
+            return False
+
+
+class RemoteServiceManager:
+    """service_manager for API workers: calls go to every services shard."""
+
+    def __init__(self, client: BrokerClient):
+        self.client = client
+
+    async def _call(self, method: str, **args) -> bool:
+        try:
+            replies = await self.client.call(method, broadcast=True, **args)
+        except BrokerError as e:
+            print(f"[ServiceManager] {method} failed: {e}")
+            return False
+        for reply in replies:
+            if reply.get("error"):
+                print(f"[ServiceManager] {method} failed on pid {reply.get('pid')}: {reply['error']}")
+        return any(reply.get("result") for reply in replies)
+
+    async def spawn_service(self, name: str) -> bool:
+        return await self._call("services.spawn", name=name)
+
+    async def stop_service(self, name: str) -> bool:
+        return await self._call("services.stop", name=name)
+
+    def is_running(self, name: str) -> bool:
+        return name in self.list_running()
+
+    def list_running(self) -> List[str]:
+        running = set()
+        for key, names in self.client.state.items():
+            if key.startswith("services.running."):
+                running.update(names or ())
+        return sorted(running)
+
+
+def connect_process(client: BrokerClient):
+    """Route this process's events, live-feed messages and Gemini quota through the hub."""
+    ingestor.forward_to(client)
+    manager.forward_to(lambda data: client.publish("live", data))
+    gemini.bucket = RemoteTokenBucket(client)
+    client.start()
+
+
+async def report_shard(client: BrokerClient, role: str):
+    """Publish this listener shard's counters until cancelled."""
+    key = shard_state_key(role)
+    while True:
+        client.set_state({key: {"role": role, **shard_report()}})
+        await asyncio.sleep(SHARD_REPORT_INTERVAL_S)
+
+
+# ─── Roles ───────────────────────────────────────────────────────────────────
+
+async def run_hub(stop: asyncio.Event):
+    migrate(engine)
+    await prewarm(("rules", "db"))
+    await run_backfills()
+
+    broker = BrokerServer()
+
+    async def ingest(event: Dict[str, Any]):
+        try:
+            await ingestor.put(event_from_dict(event))
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"[Broker] Discarding malformed event: {e!r}")
+
+    async def gemini_acquire(wait: float = 0) -> bool:
+        acquired = await gemini.bucket.acquire(timeout=wait)
+        broker.set_state({"gemini.quota_available": gemini.bucket.available()})
+        return acquired
+
+    async def reports_submit(ip: str) -> Dict[str, Any]:
+        job, created = report_jobs.submit(ip)
+        return {**job.to_dict(), "deduplicated": not created}
+
+    async def reports_get(job_id: str) -> Optional[Dict[str, Any]]:
+        job = report_jobs.get(job_id)
+        return job.to_dict() if job else None
+
+    async def ingestion_info() -> Dict[str, Any]:
+        return ingestor.info()
+
+    async def analysis_cache_info() -> Dict[str, Any]:
+        return analysis_cache.info()
+
+    async def invalidate_caches() -> bool:
+        attacker_cache.invalidate()
+        return True
+
+    async def cluster_info() -> Dict[str, Any]:
+        return {"address": broker.address, "peers": broker.peers(), **broker.stats}
+
+    broker.on_event = ingest
+    broker.register("gemini.acquire", gemini_acquire)
+    broker.register("reports.submit", reports_submit)
+    broker.register("reports.get", reports_get)
+    broker.register("hub.ingestion", ingestion_info)
+    broker.register("hub.analysis_cache", analysis_cache_info)
+    broker.register("hub.invalidate_caches", invalidate_caches)
+    broker.register("hub.cluster", cluster_info)
+
+    ingestor.start()
+    report_jobs.start()
+    archive_scheduler.start()
+    manager.forward_to(lambda data: broker.publish("live", data))
+    await broker.start()
+    try:
+        await stop.wait()
+    finally:
+        await broker.stop()
+        await report_jobs.stop()
+        await archive_scheduler.stop()
+        await ingestor.stop()
+        await async_engine.dispose()
+
+
+async def run_ssh(stop: asyncio.Event):
+    from . import ssh_honeypot
+    from .transcripts import transcript_writer
+
+    client = BrokerClient("ssh")
+    await prewarm(("host_keys", "rules"))
+    connect_process(client)
+    server = await ssh_honeypot.start_ssh_server()
+    reporter = asyncio.create_task(report_shard(client, "ssh"))
+    try:
+        await stop.wait()
+    finally:
+        reporter.cancel()
+        server.close()
+        await server.wait_closed()
+        await transcript_writer.stop()
+
+
+async def run_services(stop: asyncio.Event):
+    client = BrokerClient("services", serves=("services",))
+    running_key = f"services.running.{LISTENER_SHARD}"
+    service_manager.on_change = lambda running: client.set_state({running_key: running})
+    client.serve("services.spawn", service_manager.spawn_service)
+    client.serve("services.stop", service_manager.stop_service)
+    await prewarm(("db",))
+    connect_process(client)
+    for name in AUTOSTART_SERVICES:
+        await service_manager.spawn_service(name)
+    reporter = asyncio.create_task(report_shard(client, "services"))
+    try:
+        await stop.wait()
+    finally:
+        reporter.cancel()
+        await service_manager.shutdown_all()
+        await async_engine.dispose()
+
+
+async def run_web(stop: asyncio.Event):
+    import uvicorn
+    from fastapi import FastAPI
+    from . import web_honeypot
+
+    connect_process(BrokerClient("web"))
+    app = FastAPI(title="Web Honeypot")
+    app.include_router(web_honeypot.router)
+    server = uvicorn.Server(uvicorn.Config(
+        app, host="0.0.0.0", port=WEB_HONEYPOT_PORT, log_level="warning", backlog=max(LISTEN_BACKLOG, 2048),
+    ))
+    serving = asyncio.create_task(server.serve())
+    stopping = asyncio.create_task(stop.wait())
+    # uvicorn handles SIGINT itself, so either side may finish first
+    await asyncio.wait({serving, stopping}, return_when=asyncio.FIRST_COMPLETED)
+    server.should_exit = True
+    stopping.cancel()
+    await serving
+
+
+_RUNNERS = {"hub": run_hub, "ssh": run_ssh, "services": run_services, "web": run_web}
+
+
+def run_role(role: str):
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C arrives as KeyboardInterrupt
+        print(f"[Cluster] {role} process {os.getpid()} starting")
+        await _RUNNERS[role](stop)
+
+    install_event_loop()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+# ─── Supervisor ──────────────────────────────────────────────────────────────
+
+def _broker_reachable(address: str) -> bool:
+    kind, target = parse_address(address)
+    family = socket.AF_UNIX if kind == "unix" else socket.AF_INET
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(1)
+        try:
+            sock.connect(target)
+            return True
+        except OSError:
+            return False
+
+
+def run_all(workers: int, host: str, port: int, web: bool, shards: int = 1):
+    """Start the hub, the listeners and a multi-worker API, and stop them together."""
+    if shards > 1 and not REUSE_PORT_SUPPORTED:
+        print("[Cluster] SO_REUSEPORT is not available on this platform; running one shard per listener.")
+        shards = 1
+    env = {
+        **os.environ,
+        "HONEYPOT_PROCESS_MODE": "multi",
+        "BROKER_ADDRESS": BROKER_ADDRESS,
+        "LISTENER_SHARDS": str(shards),
+    }
+
+    def spawn(*args: str, shard: int = 0) -> subprocess.Popen:
+        return subprocess.Popen([sys.executable, "-m", *args], env={**env, "LISTENER_SHARD": str(shard)})
+
+    procs: Dict[str, subprocess.Popen] = {"hub": spawn("backend.cluster", "hub")}
+    deadline = time.monotonic() + 60
+    while not _broker_reachable(BROKER_ADDRESS):
+        if procs["hub"].poll() is not None or time.monotonic() > deadline:
+            print("[Cluster] Hub did not come up; aborting.")
+            procs["hub"].terminate()
+            sys.exit(1)
+        time.sleep(0.2)
+
+    # Generate any missing host keys once, before the SSH shards start
+    from .host_keys import host_keys
+    host_keys.load_sync()
+    for role in ("ssh", "services"):
+        for shard in range(shards):
+            procs[role if shards == 1 else f"{role}#{shard}"] = spawn("backend.cluster", role, shard=shard)
+    if web:
+        procs["web"] = spawn("backend.cluster", "web")
+    procs["api"] = spawn(
+        "uvicorn", "backend.main:app", "--host", host, "--port", str(port), "--workers", str(workers),
+        *uvicorn_args(),
+    )
+    print(f"[Cluster] Running {', '.join(procs)} ({workers} API worker(s) on {host}:{port})")
+
+    # Stop the children on SIGTERM too, not only on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while all(p.poll() is None for p in procs.values()):
+            time.sleep(0.5)
+        exited = [role for role, p in procs.items() if p.poll() is not None]
+        print(f"[Cluster] {', '.join(exited)} exited; stopping the rest.")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Producers first, the hub last so it can flush what they sent
+        for role, proc in reversed(list(procs.items())):
+            if proc.poll() is None:
+                proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                print(f"[Cluster] {role} did not stop; killing it.")
+                proc.kill()
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("role", choices=("all",) + ROLES)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="API worker processes (all)")
+    parser.add_argument("--shards", type=int, default=LISTENER_SHARDS, help="processes per listener role (all)")
+    parser.add_argument("--host", default="0.0.0.0", help="API bind address (all)")
+    parser.add_argument("--port", type=int, default=8000, help="API port (all)")
+    parser.add_argument("--web", action="store_true", help="also run the standalone web role (all)")
+    args = parser.parse_args()
+
+    if args.role == "all":
+        run_all(max(1, args.workers), args.host, args.port, args.web, max(1, args.shards))
+    else:
+        run_role(args.role)
+
+
+if __name__ == "__main__":
+    main_()
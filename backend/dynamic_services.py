@@ -3,36 +3,26 @@ dynamic_services.py — Adaptive Honeypot Service Manager
 
 Runs fake TCP services (MySQL, FTP) that respond with realistic banners and
 capture all attacker interactions. Services can be started/stopped at runtime.
+
+With LISTENER_SHARDS > 1 every services process binds the same ports with
+SO_REUSEPORT; each keeps its own per-service counters (shard_stats.py).
 """
 
 import asyncio
 import json
 from datetime import datetime
-from typing import Dict, Optional
-
-from .database import SessionLocal
-from .models import Attacker, DynamicService, ServiceInteraction, ThreatReport
-from .websocket_manager import manager
-
-import random
+from typing import Callable, Dict, List, Optional
 
-SAMPLE_LOCATIONS = [
-    {"country": "China", "city": "Beijing", "lat": 39.9042, "lon": 116.4074},
-    {"country": "Russia", "city": "Moscow", "lat": 55.7558, "lon": 37.6173},
-    {"country": "Brazil", "city": "São Paulo", "lat": -23.5505, "lon": -46.6333},
-    {"country": "Iran", "city": "Tehran", "lat": 35.6892, "lon": 51.3890},
-    {"country": "USA", "city": "New York", "lat": 40.7128, "lon": -74.0060},
-    {"country": "Germany", "city": "Berlin", "lat": 52.5200, "lon": 13.4050},
-    {"country": "Ukraine", "city": "Kyiv", "lat": 50.4501, "lon": 30.5234},
-]
-
-
-def _get_geoip(ip: str) -> dict:
-    random.seed(ip)
-    loc = random.choice(SAMPLE_LOCATIONS)
-    random.seed()
-    return loc
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
+from .database import AsyncSessionLocal
+from .models import DynamicService
+from .ingestion import ingestor, ServiceProbeEvent
+from .pseudonyms import geo_for, recorded_ip
+from .runtime import LISTEN_BACKLOG
+from .shard_stats import REUSE_PORT, ListenerStats, register_listener, listeners
+from .websocket_manager import manager
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Service definitions: name → (port, banner bytes)
@@ -71,90 +61,55 @@ SERVICE_CONFIGS = {
 }
 
 
+# Started with the honeypot
+AUTOSTART_SERVICES = ("mysql", "ftp", "http_alt")
+
+
 class FakeServiceProtocol(asyncio.Protocol):
     """Generic fake service protocol — sends a banner and logs all received data."""
 
-    def __init__(self, service_name: str, service_port: int, banner: bytes):
+    def __init__(self, service_name: str, service_port: int, banner: bytes, stats: ListenerStats):
         self.service_name = service_name
         self.service_port = service_port
         self.banner = banner
+        self.stats = stats
         self.peer_ip: Optional[str] = None
         self.buffer = b""
 
     def connection_made(self, transport):
         self.transport = transport
         peername = transport.get_extra_info("peername")
-        self.peer_ip = peername[0] if peername else "Unknown"
+        self.peer_ip = recorded_ip(peername[0]) if peername else "Unknown"
+        self.stats.opened()
         print(f"[{self.service_name.upper()}] Connection from {self.peer_ip}")
         # Send the realistic service banner
         transport.write(self.banner)
 
     def data_received(self, data: bytes):
         self.buffer += data
+        self.stats.received(len(data))
+        self.stats.event()
         asyncio.create_task(self._log_interaction(data))
 
     def connection_lost(self, exc):
+        self.stats.closed()
         print(f"[{self.service_name.upper()}] {self.peer_ip} disconnected")
 
     async def _log_interaction(self, raw_data: bytes):
-        db = SessionLocal()
         try:
             ip = self.peer_ip
 
-            # Upsert attacker
-            attacker = db.query(Attacker).filter(Attacker.ip_address == ip).first()
-            if not attacker:
-                geo = _get_geoip(ip)
-                attacker = Attacker(
-                    ip_address=ip,
-                    city=geo["city"],
-                    country=geo["country"],
-                    latitude=geo["lat"],
-                    longitude=geo["lon"],
-                    risk_score=30  # Base score for probing
-                )
-                db.add(attacker)
-                db.commit()
-                db.refresh(attacker)
-
-            # Find service record
-            svc = db.query(DynamicService).filter(DynamicService.name == self.service_name).first()
-            svc_id = svc.id if svc else None
-
-            # Log interaction
-            interaction = ServiceInteraction(
-                service_id=svc_id,
-                attacker_id=attacker.id,
-                attacker_ip=ip,
-                raw_data=raw_data.decode("utf-8", errors="replace")[:500]
-            )
-            db.add(interaction)
-
-            # Update service interaction count
-            if svc:
-                svc.interaction_count = (svc.interaction_count or 0) + 1
-
-            # Update attacker last seen
-            attacker.last_seen = datetime.utcnow()
-
-            # Append TTP for network scanning
-            existing_ttps = set((attacker.ttp_tags or "").split(","))
-            existing_ttps.add(f"T1046-{self.service_name.upper()}")
-            attacker.ttp_tags = ",".join(filter(None, existing_ttps))
-
-            # Create threat report for service probe
-            report = ThreatReport(
-                attacker_id=attacker.id,
-                severity="MEDIUM",
-                description=f"Attacker probed fake {self.service_name.upper()} service on port {self.service_port}",
-                recommended_action="Monitor and correlate with other activity",
-                service_type=self.service_name
-            )
-            db.add(report)
-            db.commit()
+            # Persisted asynchronously by the batched ingestion writer
+            await ingestor.put(ServiceProbeEvent(
+                ip=ip,
+                service_name=self.service_name,
+                service_port=self.service_port,
+                raw_data=raw_data.decode("utf-8", errors="replace")[:500],
+                geo=geo_for(ip)
+            ))
 
             # Broadcast via WebSocket
-            await manager.broadcast_json({
+            manager.publish({
                 "type": "service_probe",
                 "service": self.service_name,
                 "port": self.service_port,
@@ -164,8 +119,6 @@ class FakeServiceProtocol(asyncio.Protocol):
 
         except Exception as e:
             print(f"[{self.service_name.upper()}] Error logging: {e}")
-        finally:
-            db.close()
 
 
 class ServiceManager:
@@ -176,6 +129,12 @@ class ServiceManager:
 
     def __init__(self):
         self._servers: Dict[str, asyncio.AbstractServer] = {}
+        # Called with the running service names after every start/stop
+        self.on_change: Optional[Callable[[List[str]], None]] = None
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change(self.list_running())
 
     async def spawn_service(self, name: str) -> bool:
         """Start a fake service by name. Returns True on success."""
@@ -194,18 +153,23 @@ class ServiceManager:
 
         loop = asyncio.get_event_loop()
         try:
+            stats = register_listener(name, port)
             server = await loop.create_server(
-                lambda: FakeServiceProtocol(name, port, banner),
+                lambda: FakeServiceProtocol(name, port, banner, stats),
                 host="0.0.0.0",
-                port=port
+                port=port,
+                reuse_port=REUSE_PORT,
+                backlog=LISTEN_BACKLOG,
             )
             self._servers[name] = server
+            self._changed()
             print(f"[ServiceManager] Started fake {name.upper()} on port {port}")
 
             # Persist to DB
-            db = SessionLocal()
-            try:
-                svc = db.query(DynamicService).filter(DynamicService.name == name).first()
+            async with AsyncSessionLocal() as db:
+                svc = (await db.execute(
+                    select(DynamicService).where(DynamicService.name == name)
+                )).scalars().first()
                 if svc:
                     svc.is_active = 1
                     svc.started_at = datetime.utcnow()
@@ -213,13 +177,16 @@ class ServiceManager:
                 else:
                     svc = DynamicService(name=name, port=port, banner=description)
                     db.add(svc)
-                db.commit()
-            finally:
-                db.close()
+                try:
+                    await db.commit()
+                except IntegrityError:
+                    # Another listener shard registered the service first
+                    await db.rollback()
 
             return True
 
         except OSError as e:
+            listeners[name].listening = False
             print(f"[ServiceManager] Failed to start {name} on port {port}: {e}")
             return False
 
@@ -230,16 +197,17 @@ class ServiceManager:
             return False
         server.close()
         await server.wait_closed()
+        listeners[name].listening = False
+        self._changed()
         print(f"[ServiceManager] Stopped fake {name.upper()}")
 
-        db = SessionLocal()
-        try:
-            svc = db.query(DynamicService).filter(DynamicService.name == name).first()
+        async with AsyncSessionLocal() as db:
+            svc = (await db.execute(
+                select(DynamicService).where(DynamicService.name == name)
+            )).scalars().first()
             if svc:
                 svc.is_active = 0
-            db.commit()
-        finally:
-            db.close()
+            await db.commit()
 
         return True
 
@@ -0,0 +1,890 @@
+"""
+fake_shell.py — Stateful Fake Shell over a Copy-on-Write Virtual Filesystem
+
+Each SSH session gets a `ShellSession`: a bash look-alike that keeps its
+working directory, environment and history between commands and runs until
+the attacker types `exit`, so post-exploitation behaviour is captured beyond
+the first command.
+
+The filesystem is one immutable base image (BASE_IMAGE, built once per
+process and shared by every session) plus a per-session overlay that holds
+only what the session created, changed or deleted, with whiteouts for
+deletions, as overlayfs does. 10k sessions share a single tree; a session
+that never writes costs a few hundred bytes.
+
+Everything a session adds is accounted: overlay paths and file contents,
+environment overrides and history. Beyond SHELL_SESSION_MAX_BYTES, writes
+fail with "No space left on device", as on a full disk. `shell_sessions.info()`
+reports live sessions and their accounted usage.
+
+Supported: cd, pwd, ls [-l] [-a], cat, echo [-n], uname [-a|-s|-n|-r|-m],
+ps, env/printenv, export, unset, whoami, id, hostname, touch, mkdir [-p],
+rm [-r] [-f], grep [-i] [-v], head/tail [-n N], wc [-l], history, clear,
+exit/logout, and wget/curl that fail name resolution; pipes (|), redirection (>, >>, <, 2>), sequences (;, &&, ||)
+and $VAR expansion.
+
+Tuning (environment variables):
+    SHELL_SESSION_MAX_BYTES   accounted memory per session (default 262144)
+    SHELL_HISTORY_SIZE        commands kept for `history`   (default 200)
+"""
+
+import os
+import re
+import shlex
+import time
+import weakref
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+SHELL_SESSION_MAX_BYTES = int(os.getenv("SHELL_SESSION_MAX_BYTES", str(256 * 1024)))
+SHELL_HISTORY_SIZE = int(os.getenv("SHELL_HISTORY_SIZE", "200"))
+
+HOSTNAME = "srv-prod-01"
+KERNEL = "5.15.0-91-generic"
+KERNEL_VERSION = "#101-Ubuntu SMP Tue Nov 14 13:30:08 UTC 2023"
+
+# Rough per-entry cost of an overlay node (dict slot, path string, node object)
+_NODE_OVERHEAD = 120
+_HISTORY_LINE_MAX = 1024
+_MAX_NESTING = 8
+_BASE_MTIME = time.mktime((2024, 1, 12, 9, 14, 0, 0, 0, -1))
+
+
+class Node:
+    """A file or directory. Base image nodes are never mutated."""
+
+    __slots__ = ("is_dir", "data", "mode", "mtime")
+
+    def __init__(self, is_dir: bool, data: str = "", mode: int = 0o644, mtime: float = _BASE_MTIME):
+        self.is_dir = is_dir
+        self.data = data
+        self.mode = mode
+        self.mtime = mtime
+
+    @property
+    def size(self) -> int:
+        return 4096 if self.is_dir else len(self.data.encode())
+
+
+# ─── Base image ──────────────────────────────────────────────────────────────
+
+_PASSWD = """root:x:0:0:root:/root:/bin/bash
+daemon:x:1:1:daemon:/usr/sbin:/usr/sbin/nologin
+bin:x:2:2:bin:/bin:/usr/sbin/nologin
+sys:x:3:3:sys:/dev:/usr/sbin/nologin
+www-data:x:33:33:www-data:/var/www:/usr/sbin/nologin
+nobody:x:65534:65534:nobody:/nonexistent:/usr/sbin/nologin
+systemd-network:x:100:102:systemd Network Management,,,:/run/systemd:/usr/sbin/nologin
+sshd:x:105:65534::/run/sshd:/usr/sbin/nologin
+mysql:x:112:118:MySQL Server,,,:/nonexistent:/bin/false
+ubuntu:x:1000:1000:Ubuntu:/home/ubuntu:/bin/bash
+"""
+
+_SHADOW = """root:$6$xyz9Qe1L$4bJ2nL0bJmT3Yv0aQ7cX8pYQ1hS9gQz0T5nW3eF2kR6uV8dA1sL4oP7mN2bC5xZ9qW3eR6tY8uI0oP1aS2dF3g:19734:0:99999:7:::
+daemon:*:19523:0:99999:7:::
+bin:*:19523:0:99999:7:::
+sys:*:19523:0:99999:7:::
+www-data:*:19523:0:99999:7:::
+nobody:*:19523:0:99999:7:::
+sshd:*:19523:0:99999:7:::
+mysql:!:19524:0:99999:7:::
+ubuntu:$6$Rk2pLw8s$h7Gf3Dk9sL2mQ8nB4vC6xZ1aS5dF7gH9jK3lP0oI2uY4tR6eW8qA1zX3cV5bN7mM9kJ2hG4fD6sA8pO0iU1y:19734:0:99999:7:::
+"""
+
+_OS_RELEASE = """PRETTY_NAME="Ubuntu 22.04.3 LTS"
+NAME="Ubuntu"
+VERSION_ID="22.04"
+VERSION="22.04.3 LTS (Jammy Jellyfish)"
+VERSION_CODENAME=jammy
+ID=ubuntu
+ID_LIKE=debian
+HOME_URL="https://www.ubuntu.com/"
+SUPPORT_URL="https://help.ubuntu.com/"
+BUG_REPORT_URL="https://bugs.launchpad.net/ubuntu/"
+UBUNTU_CODENAME=jammy
+"""
+
+_BASHRC = """# ~/.bashrc: executed by bash(1) for non-login shells.
+[ -z "$PS1" ] && return
+HISTCONTROL=ignoredups:ignorespace
+shopt -s histappend
+HISTSIZE=1000
+HISTFILESIZE=2000
+alias ll='ls -alF'
+alias la='ls -A'
+export PATH=$PATH:/opt/backup/bin
+"""
+
+_BINARIES = (
+    "bash", "cat", "chmod", "chown", "cp", "curl", "dd", "df", "echo", "grep", "gzip", "hostname",
+    "kill", "ls", "mkdir", "mount", "mv", "nc", "netstat", "ping", "ps", "pwd", "rm", "sed", "sh",
+    "su", "sudo", "tar", "touch", "uname", "wget", "whoami",
+)
+
+_FILES: Dict[str, Tuple[str, int]] = {
+    "/etc/passwd": (_PASSWD, 0o644),
+    "/etc/shadow": (_SHADOW, 0o640),
+    "/etc/group": ("root:x:0:\nsudo:x:27:ubuntu\nwww-data:x:33:\nmysql:x:118:\nubuntu:x:1000:\n", 0o644),
+    "/etc/hostname": (HOSTNAME + "\n", 0o644),
+    "/etc/hosts": (f"127.0.0.1 localhost\n127.0.1.1 {HOSTNAME}\n10.0.3.15 db-internal\n", 0o644),
+    "/etc/os-release": (_OS_RELEASE, 0o644),
+    "/etc/issue": ("Ubuntu 22.04.3 LTS \\n \\l\n\n", 0o644),
+    "/etc/crontab": ("SHELL=/bin/sh\nPATH=/usr/local/sbin:/usr/local/bin:/sbin:/bin:/usr/sbin:/usr/bin\n"
+                     "17 *\t* * *\troot\tcd / && run-parts --report /etc/cron.hourly\n"
+                     "30 2\t* * *\troot\t/opt/backup/bin/nightly.sh\n", 0o644),
+    "/etc/ssh/sshd_config": ("Port 22\nPermitRootLogin yes\nPasswordAuthentication yes\n"
+                             "ChallengeResponseAuthentication no\nUsePAM yes\nX11Forwarding yes\n", 0o644),
+    "/root/.bashrc": (_BASHRC, 0o644),
+    "/root/.profile": ("if [ \"$BASH\" ]; then\n  if [ -f ~/.bashrc ]; then\n    . ~/.bashrc\n  fi\nfi\n", 0o644),
+    "/root/.bash_history": ("apt update\nsystemctl restart mysql\nmysql -u root -p\nvim /etc/ssh/sshd_config\n", 0o600),
+    "/root/.ssh/authorized_keys": ("ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIJ8fQp6dVhGx3m1L0yq7kR9vW2sZ4cN5bT8uE1oA6pXs admin@jumpbox\n", 0o600),
+    "/root/botnet.sh": ("#!/bin/bash\n# cleanup old miners\npkill -f xmrig\n", 0o755),
+    "/root/passwords.txt": ("mysql root: Str0ngP@ss2023!\nbackup ftp: backup / b4ckup_2023\n", 0o600),
+    "/home/ubuntu/.bashrc": (_BASHRC, 0o644),
+    "/opt/backup/bin/nightly.sh": ("#!/bin/bash\nmysqldump --all-databases | gzip > /var/backups/db.sql.gz\n", 0o755),
+    "/var/log/auth.log": ("Jan 12 09:10:01 srv-prod-01 CRON[2011]: pam_unix(cron:session): session opened for user root\n"
+                          "Jan 12 09:14:22 srv-prod-01 sshd[2231]: Accepted password for root from 10.0.3.2 port 50122 ssh2\n", 0o640),
+    "/var/log/syslog": ("Jan 12 09:00:01 srv-prod-01 systemd[1]: Started Daily apt download activities.\n", 0o640),
+    "/proc/version": (f"Linux version {KERNEL} (buildd@lcy02-amd64-045) (gcc (Ubuntu 11.4.0-1ubuntu1~22.04) 11.4.0) {KERNEL_VERSION}\n", 0o444),
+    "/proc/cpuinfo": ("processor\t: 0\nvendor_id\t: GenuineIntel\nmodel name\t: Intel(R) Xeon(R) CPU E5-2686 v4 @ 2.30GHz\n"
+                      "cpu MHz\t\t: 2299.998\ncache size\t: 46080 KB\ncpu cores\t: 2\n", 0o444),
+    "/proc/meminfo": ("MemTotal:        8152864 kB\nMemFree:          612340 kB\nMemAvailable:    5240112 kB\n", 0o444),
+}
+_FILES.update({f"/usr/bin/{name}": ("\x7fELF", 0o755) for name in _BINARIES})
+_DIRS = ("/tmp", "/dev", "/var/www/html", "/var/backups", "/usr/sbin", "/home/ubuntu")
+
+
+def _parent(path: str) -> str:
+    return path.rsplit("/", 1)[0] or "/"
+
+
+def _build_base() -> Tuple[Dict[str, Node], Dict[str, Tuple[str, ...]]]:
+    nodes: Dict[str, Node] = {"/": Node(True, mode=0o755)}
+    children: Dict[str, Set[str]] = {"/": set()}
+
+    def add_dir(path: str):
+        if path in nodes:
+            return
+        add_dir(_parent(path))
+        nodes[path] = Node(True, mode=0o1777 if path == "/tmp" else 0o700 if path == "/root" else 0o755)
+        children[path] = set()
+        children[_parent(path)].add(path.rsplit("/", 1)[1])
+
+    for path in _DIRS:
+        add_dir(path)
+    for path, (data, mode) in _FILES.items():
+        add_dir(_parent(path))
+        nodes[path] = Node(False, data, mode)
+        children[_parent(path)].add(path.rsplit("/", 1)[1])
+    nodes["/dev/null"] = Node(False, "", 0o666)
+    children["/dev"].add("null")
+    return nodes, {path: tuple(sorted(names)) for path, names in children.items()}
+
+
+# Shared by every session; never modified after import
+BASE_IMAGE, _BASE_CHILDREN = _build_base()
+BASE_IMAGE_BYTES = sum(len(path) + len(node.data) + _NODE_OVERHEAD for path, node in BASE_IMAGE.items())
+
+BASE_ENV = {
+    "SHELL": "/bin/bash",
+    "PWD": "/root",
+    "LOGNAME": "root",
+    "HOME": "/root",
+    "LANG": "C.UTF-8",
+    "TERM": "xterm-256color",
+    "USER": "root",
+    "SHLVL": "1",
+    "PATH": "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin:/opt/backup/bin",
+    "_": "/usr/bin/env",
+}
+
+
+class NoSpace(OSError):
+    pass
+
+
+# ─── Per-session filesystem ──────────────────────────────────────────────────
+
+class SessionFS:
+    """The base image seen through this session's copy-on-write overlay."""
+
+    def __init__(self, budget: "Budget"):
+        self.budget = budget
+        self._nodes: Dict[str, Optional[Node]] = {}  # None = whiteout (deleted)
+        self._added: Dict[str, Set[str]] = {}        # dir → names created in the overlay
+        self._opaque: Set[str] = set()               # recreated dirs that hide the base's children
+
+    def lookup(self, path: str) -> Optional[Node]:
+        if path in self._nodes:
+            return self._nodes[path]
+        ancestor = path
+        while ancestor != "/":
+            ancestor = _parent(ancestor)
+            if ancestor in self._nodes and (self._nodes[ancestor] is None or ancestor in self._opaque):
+                return None
+        return BASE_IMAGE.get(path)
+
+    def listdir(self, path: str) -> List[str]:
+        base = () if path in self._opaque or path not in BASE_IMAGE else _BASE_CHILDREN.get(path, ())
+        names = set(base) | self._added.get(path, set())
+        prefix = path.rstrip("/") + "/"
+        return sorted(name for name in names if self.lookup(prefix + name) is not None)
+
+    def _set(self, path: str, node: Optional[Node]):
+        old = self._nodes.get(path, False)
+        cost = len(path) + _NODE_OVERHEAD + (len(node.data) if node is not None else 0)
+        freed = 0 if old is False else len(path) + _NODE_OVERHEAD + (len(old.data) if old is not None else 0)
+        self.budget.charge(cost - freed)
+        self._nodes[path] = node
+        if node is not None and path != "/":
+            self._added.setdefault(_parent(path), set()).add(path.rsplit("/", 1)[1])
+
+    def write(self, path: str, data: str, append: bool = False):
+        node = self.lookup(path)
+        if path == "/dev/null":
+            return
+        if node is not None and node.is_dir:
+            raise IsADirectoryError(path)
+        parent = self.lookup(_parent(path))
+        if parent is None or not parent.is_dir:
+            raise FileNotFoundError(path)
+        if append and node is not None:
+            data = node.data + data
+        self._set(path, Node(False, data, node.mode if node else 0o644, time.time()))
+
+    def mkdir(self, path: str):
+        was_deleted = path in self._nodes and self._nodes[path] is None
+        self._set(path, Node(True, mode=0o755, mtime=time.time()))
+        if was_deleted or path in BASE_IMAGE:
+            self._opaque.add(path)
+
+    def _drop(self, path: str):
+        old = self._nodes.pop(path, None)
+        self.budget.charge(-(len(path) + _NODE_OVERHEAD + (len(old.data) if old else 0)))
+        self._added.get(_parent(path), set()).discard(path.rsplit("/", 1)[1])
+        self._added.pop(path, None)
+        self._opaque.discard(path)
+
+    def remove(self, path: str):
+        """Delete a file or a whole directory tree."""
+        prefix = path + "/"
+        for descendant in [p for p in self._nodes if p.startswith(prefix)]:
+            self._drop(descendant)
+        if path in BASE_IMAGE:
+            self._opaque.discard(path)
+            self._set(path, None)  # whiteout hides the base entry and everything below it
+        else:
+            self._drop(path)
+
+
+class Budget:
+    """Accounted bytes of one session, capped at SHELL_SESSION_MAX_BYTES."""
+
+    def __init__(self, limit: int = SHELL_SESSION_MAX_BYTES):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+
+    def charge(self, nbytes: int):
+        if nbytes > 0 and self.used + nbytes > self.limit:
+            raise NoSpace("No space left on device")
+        self.used += nbytes
+        self.peak = max(self.peak, self.used)
+
+
+# ─── Shell ───────────────────────────────────────────────────────────────────
+
+_VAR = re.compile(r"\$(\w+|\{\w+\}|\?)")
+# ASCII digits only: str.isdigit() also accepts "²", which int() rejects
+_NUMBER = re.compile(r"[0-9]+")
+_SEPARATORS = {";", "&&", "||", "&"}
+# "2>", "1>" and friends only when the digit touches the operator; "echo 2 > f" writes "2" to f
+_STDERR_REDIRECTS = {"2>", "2>>", "2>&"}
+_STDOUT_REDIRECTS = {"1>", "1>>", "1>&"}
+_REDIRECTS = {">", ">>", "<", ">&"} | _STDERR_REDIRECTS | _STDOUT_REDIRECTS
+_OPERATORS = _SEPARATORS | _REDIRECTS | {"|"}
+
+
+class ShellError(Exception):
+    """A command failure: message for stderr and exit status."""
+
+    def __init__(self, message: str, status: int = 1):
+        super().__init__(message)
+        self.status = status
+
+
+class ShellSession:
+    """One interactive session: cwd, environment, history and overlay filesystem."""
+
+    def __init__(self, user: str = "root"):
+        self.budget = Budget()
+        self.fs = SessionFS(self.budget)
+        self.user = user
+        self.cwd = "/root"
+        self.oldpwd = "/root"
+        self._env: Dict[str, Optional[str]] = {}  # overrides of BASE_ENV; None = unset
+        self.history: deque = deque(maxlen=SHELL_HISTORY_SIZE)
+        self.status = 0
+        self.exited = False
+        # Per-command state of the stage being run
+        self._errors: List[str] = []
+        self._exit = 0
+        self._to_terminal = True
+        self._depth = 0
+        shell_sessions.add(self)
+
+    # ── environment ──
+    def getenv(self, name: str) -> Optional[str]:
+        if name in self._env:
+            return self._env[name]
+        return BASE_ENV.get(name)
+
+    def setenv(self, name: str, value: Optional[str]):
+        old = self._env.get(name)
+        self.budget.charge(len(name) + len(value or "") - (len(name) + len(old or "") if name in self._env else 0))
+        self._env[name] = value
+
+    def environ(self) -> Dict[str, str]:
+        env = {**BASE_ENV, **self._env, "PWD": self.cwd}
+        return {k: v for k, v in env.items() if v is not None}
+
+    def prompt(self) -> str:
+        home = self.getenv("HOME") or "/root"
+        where = "~" + self.cwd[len(home):] if self.cwd == home or self.cwd.startswith(home + "/") else self.cwd
+        return f"{self.user}@{HOSTNAME}:{where}# "
+
+    def resolve(self, path: str) -> str:
+        if path == "~" or path.startswith("~/"):
+            path = (self.getenv("HOME") or "/root") + path[1:]
+        if not path.startswith("/"):
+            path = self.cwd.rstrip("/") + "/" + path
+        parts: List[str] = []
+        for part in path.split("/"):
+            if part in ("", "."):
+                continue
+            if part == "..":
+                if parts:
+                    parts.pop()
+            else:
+                parts.append(part)
+        return "/" + "/".join(parts)
+
+    # ── parsing ──
+    def _expand(self, line: str) -> str:
+        """$VAR expansion outside single quotes."""
+        pieces = re.split(r"('[^']*')", line)
+        for i, piece in enumerate(pieces):
+            if not piece.startswith("'"):
+                pieces[i] = _VAR.sub(self._var_value, piece)
+        return "".join(pieces)
+
+    def _var_value(self, match) -> str:
+        name = match.group(1).strip("{}")
+        if name == "?":
+            return str(self.status)
+        return self.getenv(name) or ""
+
+    def _tokenize(self, line: str) -> List[str]:
+        """Split into words and operators, quotes kept so expansion can happen per command."""
+        lexer = shlex.shlex(line, posix=False, punctuation_chars=";&|<>")
+        lexer.whitespace_split = True
+        lexer.commenters = "#"
+        try:
+            tokens = list(lexer)
+        except ValueError:
+            raise ShellError("bash: syntax error: unexpected end of file", 2)
+        # posix=False keeps tokens verbatim, so their offsets in the line show the spacing
+        merged: List[str] = []
+        pos = 0
+        adjacent_fd = False
+        for token in tokens:
+            start = line.find(token, pos)
+            if adjacent_fd and start == pos and token in (">", ">>", ">&"):
+                merged[-1] += token
+            else:
+                merged.append(token)
+            pos = start + len(token) if start >= 0 else pos
+            adjacent_fd = token in ("1", "2") and start >= 0
+        return merged
+
+    def _word(self, token: str) -> str:
+        if token in _OPERATORS:
+            return token
+        try:
+            return " ".join(shlex.split(self._expand(token)))
+        except ValueError:
+            return token
+
+    # ── execution ──
+    def run(self, line: str) -> str:
+        """Run one command line and return what the terminal shows."""
+        line = line.strip()
+        if not line:
+            return ""
+        stored = line[:_HISTORY_LINE_MAX]
+        try:
+            self.budget.charge(len(stored))
+            if len(self.history) == self.history.maxlen:
+                self.budget.charge(-len(self.history[0]))
+            self.history.append(stored)
+        except NoSpace:
+            pass  # history is best effort once the session is full
+        return self._execute(line)
+
+    def _execute(self, line: str) -> str:
+        try:
+            tokens = self._tokenize(line)
+        except ShellError as e:
+            self.status = e.status
+            return str(e) + "\n"
+
+        output: List[str] = []
+        op = ";"
+        segment: List[str] = []
+        for token in tokens + [";"]:
+            if token not in _SEPARATORS:
+                segment.append(token)
+                continue
+            if segment and (op in (";", "&") or (op == "&&") == (self.status == 0)):
+                output.append(self._pipeline([self._word(t) for t in segment]))
+                if self.exited:
+                    break
+            segment, op = [], token
+        return "".join(output)
+
+    def _pipeline(self, tokens: List[str]) -> str:
+        stages: List[List[str]] = [[]]
+        for token in tokens:
+            if token == "|":
+                stages.append([])
+            else:
+                stages[-1].append(token)
+        stdin = ""
+        errors: List[str] = []
+        for i, stage in enumerate(stages):
+            stdin, err = self._command(stage, stdin, to_terminal=i == len(stages) - 1)
+            errors.append(err)
+        return "".join(errors) + stdin
+
+    def _command(self, tokens: List[str], stdin: str, to_terminal: bool = True) -> Tuple[str, str]:
+        """Run one pipeline stage; returns (stdout, stderr)."""
+        args: List[str] = []
+        redirect: Optional[Tuple[str, str]] = None
+        stderr_to: Optional[Tuple[str, str]] = None
+        merge_stderr = False
+        self._errors = []
+        self._exit = 0
+        try:
+            i = 0
+            while i < len(tokens):
+                token = tokens[i]
+                if token not in _REDIRECTS:
+                    args.append(token)
+                    i += 1
+                    continue
+                if i + 1 >= len(tokens) or tokens[i + 1] in _OPERATORS:
+                    raise ShellError("bash: syntax error near unexpected token `newline'", 2)
+                target, i = tokens[i + 1], i + 2
+                to_stderr = token in _STDERR_REDIRECTS
+                if to_stderr or token in _STDOUT_REDIRECTS:
+                    token = token[1:]
+                if token == ">&":
+                    merge_stderr = to_stderr and target == "1"
+                elif token == "<":
+                    stdin = self._read(self.resolve(target), target)
+                elif to_stderr:
+                    stderr_to = (token, self.resolve(target))
+                else:
+                    redirect = (token, self.resolve(target))
+            # ls prints one name per line unless it writes to the terminal
+            self._to_terminal = to_terminal and redirect is None
+            out = self._builtin(args, stdin) if args else ""
+        except ShellError as e:
+            out = ""
+            self._warn(str(e), e.status)
+        err = "".join(self._errors)
+        self.status = self._exit
+
+        if merge_stderr:
+            out, err = err + out, ""
+        if stderr_to is not None:
+            err = self._redirect(stderr_to[0], stderr_to[1], err)
+        if redirect is not None:
+            err += self._redirect(redirect[0], redirect[1], out)
+            out = ""
+        return out, err
+
+    def _warn(self, message: str, status: int = 1):
+        """Report an error on stderr and fail the command, but keep going."""
+        if message:
+            self._errors.append(message + "\n")
+        self._exit = status
+
+    def _redirect(self, op: str, path: str, data: str) -> str:
+        """Write `data` to a file; returns an error message for the terminal, if any."""
+        try:
+            self.fs.write(path, data, append=op == ">>")
+            return ""
+        except NoSpace:
+            message = "No space left on device"
+        except IsADirectoryError:
+            message = "Is a directory"
+        except FileNotFoundError:
+            message = "No such file or directory"
+        self.status = 1
+        return f"bash: {path}: {message}\n"
+
+    def _read(self, path: str, shown: str, command: str = "bash") -> str:
+        node = self.fs.lookup(path)
+        if node is None:
+            raise ShellError(f"{command}: {shown}: No such file or directory")
+        if node.is_dir:
+            raise ShellError(f"{command}: {shown}: Is a directory")
+        return node.data
+
+    def _builtin(self, args: List[str], stdin: str) -> str:
+        name = args[0]
+        if name == "sudo" and len(args) > 1:
+            return self._builtin(args[1:], stdin)
+        handler = getattr(self, f"_cmd_{name}", None) or _ALIASES.get(name)
+        if handler is None:
+            raise ShellError(f"bash: {name}: command not found", 127)
+        if isinstance(handler, str):
+            handler = getattr(self, handler)
+        return handler(args[1:], stdin)
+
+    # ── built-ins ──
+    def _cmd_cd(self, args, stdin):
+        target = args[0] if args else "~"
+        if target == "-":
+            target = self.oldpwd
+        path = self.resolve(target)
+        node = self.fs.lookup(path)
+        if node is None:
+            raise ShellError(f"bash: cd: {target}: No such file or directory")
+        if not node.is_dir:
+            raise ShellError(f"bash: cd: {target}: Not a directory")
+        self.oldpwd, self.cwd = self.cwd, path
+        return path + "\n" if args and args[0] == "-" else ""
+
+    def _cmd_pwd(self, args, stdin):
+        return self.cwd + "\n"
+
+    def _cmd_ls(self, args, stdin):
+        flags = "".join(a[1:] for a in args if a.startswith("-") and len(a) > 1)
+        paths = [a for a in args if not a.startswith("-")] or ["."]
+        long, show_all = "l" in flags, "a" in flags or "A" in flags
+        blocks: List[str] = []
+        for shown in paths:
+            path = self.resolve(shown)
+            node = self.fs.lookup(path)
+            if node is None:
+                self._warn(f"ls: cannot access '{shown}': No such file or directory", 2)
+                continue
+            if not node.is_dir:
+                blocks.append(self._ls_line(shown, node) + "\n" if long else shown + "\n")
+                continue
+            names = [n for n in self.fs.listdir(path) if show_all or not n.startswith(".")]
+            entries = [(n, self.fs.lookup(path.rstrip("/") + "/" + n)) for n in names]
+            if "a" in flags:
+                entries = [(".", node), ("..", self.fs.lookup(_parent(path)))] + entries
+            header = f"{shown}:\n" if len(paths) > 1 else ""
+            if long:
+                total = sum((e.size + 4095) // 4096 * 4 for _, e in entries)
+                body = f"total {total}\n" + "".join(self._ls_line(n, e) + "\n" for n, e in entries)
+            else:
+                sep = "  " if self._to_terminal else "\n"
+                body = sep.join(n for n, _ in entries) + ("\n" if entries else "")
+            blocks.append(header + body)
+        return "\n".join(blocks)
+
+    def _ls_line(self, name: str, node: Node) -> str:
+        kind = "d" if node.is_dir else "-"
+        bits = "".join(
+            flag if node.mode & (1 << (8 - i)) else "-" for i, flag in enumerate("rwxrwxrwx")
+        )
+        if node.mode & 0o1000:
+            bits = bits[:-1] + "t"
+        links = 2 if node.is_dir else 1
+        stamp = time.strftime("%b %d %H:%M", time.localtime(node.mtime))
+        return f"{kind}{bits} {links:>2} root root {node.size:>5} {stamp} {name}"
+
+    def _cmd_cat(self, args, stdin):
+        files = [a for a in args if a != "-"]
+        if not files:
+            return stdin
+        out = []
+        for shown in files:
+            try:
+                out.append(self._read(self.resolve(shown), shown, "cat"))
+            except ShellError as e:
+                self._warn(str(e))
+        return "".join(out)
+
+    def _cmd_echo(self, args, stdin):
+        newline = True
+        if args and args[0] == "-n":
+            newline, args = False, args[1:]
+        elif args and args[0] == "-e":
+            args = [a.replace("\\n", "\n").replace("\\t", "\t") for a in args[1:]]
+        return " ".join(args) + ("\n" if newline else "")
+
+    def _cmd_uname(self, args, stdin):
+        fields = {
+            "s": "Linux", "n": HOSTNAME, "r": KERNEL, "v": KERNEL_VERSION,
+            "m": "x86_64", "p": "x86_64", "i": "x86_64", "o": "GNU/Linux",
+        }
+        flags = "".join(a[1:] for a in args if a.startswith("-")) or "s"
+        if "a" in flags:
+            flags = "snrvmpio"
+        return " ".join(fields[f] for f in "snrvmpio" if f in flags) + "\n"
+
+    def _cmd_ps(self, args, stdin):
+        if any(a in ("aux", "-aux", "-ef", "-e", "ax") for a in args):
+            return (
+                "USER         PID %CPU %MEM    VSZ   RSS TTY      STAT START   TIME COMMAND\n"
+                "root           1  0.0  0.1 167744 11880 ?        Ss   Jan12   0:04 /sbin/init\n"
+                "root         412  0.0  0.2  47588 16620 ?        S<s  Jan12   0:01 /lib/systemd/systemd-journald\n"
+                "root         788  0.0  0.0  15432  9004 ?        Ss   Jan12   0:00 sshd: /usr/sbin/sshd -D\n"
+                "mysql        902  0.3  4.9 1794676 402332 ?      Ssl  Jan12  41:12 /usr/sbin/mysqld\n"
+                "www-data    1044  0.0  0.1  55280  8912 ?        S    Jan12   0:00 nginx: worker process\n"
+                "root        1130  0.0  0.0   6896  2996 ?        Ss   Jan12   0:01 /usr/sbin/cron -f\n"
+                "root        2231  0.0  0.1  17144 10844 ?        Ss   09:14   0:00 sshd: root@pts/0\n"
+                "root        2280  0.0  0.0   8600  5380 pts/0    Ss   09:14   0:00 -bash\n"
+                "root        2311  0.0  0.0  10072  3340 pts/0    R+   09:15   0:00 ps " + " ".join(args) + "\n"
+            )
+        return (
+            "    PID TTY          TIME CMD\n"
+            "   2280 pts/0    00:00:00 bash\n"
+            "   2311 pts/0    00:00:00 ps\n"
+        )
+
+    def _cmd_env(self, args, stdin):
+        return "".join(f"{k}={v}\n" for k, v in self.environ().items())
+
+    def _cmd_printenv(self, args, stdin):
+        if args:
+            env = self.environ()
+            values = [env[a] for a in args if a in env]
+            if len(values) < len(args):
+                raise ShellError("")
+            return "".join(v + "\n" for v in values)
+        return self._cmd_env(args, stdin)
+
+    def _cmd_export(self, args, stdin):
+        for arg in args:
+            name, sep, value = arg.partition("=")
+            if sep:
+                self._set_env(name, value)
+        return ""
+
+    def _cmd_unset(self, args, stdin):
+        for name in args:
+            self._set_env(name, None)
+        return ""
+
+    def _set_env(self, name: str, value: Optional[str]):
+        try:
+            self.setenv(name, value)
+        except NoSpace:
+            raise ShellError("bash: xmalloc: cannot allocate memory", 2)
+
+    def _cmd_whoami(self, args, stdin):
+        return self.user + "\n"
+
+    def _cmd_id(self, args, stdin):
+        return "uid=0(root) gid=0(root) groups=0(root)\n"
+
+    def _cmd_hostname(self, args, stdin):
+        return HOSTNAME + "\n"
+
+    def _cmd_touch(self, args, stdin):
+        for shown in args:
+            path = self.resolve(shown)
+            node = self.fs.lookup(path)
+            if node is None or not node.is_dir:
+                self._fs_call(self.fs.write, path, "", True, failure=f"touch: cannot touch '{shown}'")
+        return ""
+
+    def _cmd_mkdir(self, args, stdin):
+        parents = "-p" in args
+        for shown in (a for a in args if not a.startswith("-")):
+            path = self.resolve(shown)
+            if self.fs.lookup(path) is not None:
+                if not parents:
+                    self._warn(f"mkdir: cannot create directory '{shown}': File exists")
+                continue
+            missing = []
+            probe = path
+            while self.fs.lookup(probe) is None:
+                missing.append(probe)
+                probe = _parent(probe)
+            if len(missing) > 1 and not parents:
+                self._warn(f"mkdir: cannot create directory '{shown}': No such file or directory")
+                continue
+            for p in reversed(missing):
+                self._fs_call(self.fs.mkdir, p, failure=f"mkdir: cannot create directory '{shown}'")
+        return ""
+
+    def _cmd_rm(self, args, stdin):
+        flags = "".join(a[1:] for a in args if a.startswith("-"))
+        recursive, force = "r" in flags or "R" in flags, "f" in flags
+        for shown in (a for a in args if not a.startswith("-")):
+            path = self.resolve(shown)
+            node = self.fs.lookup(path)
+            if node is None:
+                if not force:
+                    self._warn(f"rm: cannot remove '{shown}': No such file or directory")
+                continue
+            if node.is_dir and not recursive:
+                self._warn(f"rm: cannot remove '{shown}': Is a directory")
+                continue
+            if path == "/":
+                raise ShellError("rm: it is dangerous to operate recursively on '/'\n"
+                                 "rm: use --no-preserve-root to override this failsafe")
+            self._fs_call(self.fs.remove, path, failure=f"rm: cannot remove '{shown}'")
+        return ""
+
+    def _fs_call(self, fn, *args, failure: str):
+        try:
+            fn(*args)
+        except NoSpace:
+            self._warn(f"{failure}: No space left on device")
+        except FileNotFoundError:
+            self._warn(f"{failure}: No such file or directory")
+        except IsADirectoryError:
+            self._warn(f"{failure}: Is a directory")
+
+    def _lines_of(self, files: List[str], stdin: str, command: str) -> List[str]:
+        text = "".join(self._read(self.resolve(f), f, command) for f in files) if files else stdin
+        return text.splitlines(keepends=True)
+
+    def _cmd_grep(self, args, stdin):
+        flags = "".join(a[1:] for a in args if a.startswith("-"))
+        rest = [a for a in args if not a.startswith("-")]
+        if not rest:
+            raise ShellError("Usage: grep [OPTION]... PATTERNS [FILE]...", 2)
+        pattern, files = rest[0], rest[1:]
+        needle = pattern.lower() if "i" in flags else pattern
+        hits = [
+            line for line in self._lines_of(files, stdin, "grep")
+            if (needle in (line.lower() if "i" in flags else line)) != ("v" in flags)
+        ]
+        if not hits:
+            raise ShellError("")
+        return "".join(hits)
+
+    def _count(self, args) -> Tuple[int, List[str]]:
+        n, files, i = 10, [], 0
+        while i < len(args):
+            if args[i] == "-n" and i + 1 < len(args):
+                n, i = int(args[i + 1]) if _NUMBER.fullmatch(args[i + 1]) else 10, i + 2
+                continue
+            if args[i].startswith("-") and _NUMBER.fullmatch(args[i][1:]):
+                n = int(args[i][1:])
+            else:
+                files.append(args[i])
+            i += 1
+        return n, files
+
+    def _cmd_head(self, args, stdin):
+        n, files = self._count(args)
+        return "".join(self._lines_of(files, stdin, "head")[:n])
+
+    def _cmd_tail(self, args, stdin):
+        n, files = self._count(args)
+        return "".join(self._lines_of(files, stdin, "tail")[-n:] if n else [])
+
+    def _cmd_wc(self, args, stdin):
+        files = [a for a in args if not a.startswith("-")]
+        text = "".join(self._lines_of(files, stdin, "wc"))
+        counts = (text.count("\n"), len(text.split()), len(text.encode()))
+        if "-l" in args:
+            return f"{counts[0]}" + (f" {files[0]}" if files else "") + "\n"
+        return " ".join(f"{c:>7}" for c in counts) + (f" {files[0]}" if files else "") + "\n"
+
+    def _cmd_history(self, args, stdin):
+        return "".join(f"{i:>5}  {line}\n" for i, line in enumerate(self.history, 1))
+
+    def _cmd_clear(self, args, stdin):
+        return "\x1b[H\x1b[2J"
+
+    def _cmd_exit(self, args, stdin):
+        self.exited = True
+        self._exit = int(args[0]) & 0xFF if args and _NUMBER.fullmatch(args[0]) else 0
+        return "logout\n"
+
+    def _cmd_wget(self, args, stdin):
+        # Downloads are recorded, never performed; the box looks offline
+        url = next((a for a in args if not a.startswith("-")), "")
+        if not url:
+            raise ShellError("wget: missing URL\nUsage: wget [OPTION]... [URL]...", 1)
+        host = re.sub(r"^\w+://", "", url).split("/")[0].split(":")[0]
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        raise ShellError(f"--{stamp}--  {url}\nResolving {host} ({host})... failed: "
+                         f"Temporary failure in name resolution.\nwget: unable to resolve host address '{host}'", 4)
+
+    def _cmd_curl(self, args, stdin):
+        url = next((a for a in args if not a.startswith("-") and ("://" in a or "." in a)), "")
+        if not url:
+            raise ShellError("curl: try 'curl --help' or 'curl --manual' for more information", 2)
+        host = re.sub(r"^\w+://", "", url).split("/")[0].split(":")[0]
+        raise ShellError(f"curl: (6) Could not resolve host: {host}", 6)
+
+    def _cmd_bash(self, args, stdin):
+        """`bash -c CMD`, `bash FILE` or a script piped in, run in this session."""
+        if self._depth >= _MAX_NESTING:
+            raise ShellError("bash: maximum nesting level exceeded", 1)
+        if args[:1] == ["-c"]:
+            script = " ".join(args[1:2])
+        elif args:
+            script = self._read(self.resolve(args[0]), args[0])
+        else:
+            script = stdin
+        # A child shell: its cd does not move this one
+        saved = self.cwd, self.oldpwd
+        self._depth += 1
+        try:
+            out = "".join(self._execute(line) for line in script.splitlines() if line.strip())
+        finally:
+            self._depth -= 1
+            self.cwd, self.oldpwd = saved
+        return out
+
+    def _cmd_true(self, args, stdin):
+        return ""
+
+    def _cmd_false(self, args, stdin):
+        raise ShellError("")
+
+
+_ALIASES = {"logout": "_cmd_exit", "ll": "_cmd_ls", ":": "_cmd_true", "dir": "_cmd_ls", "sh": "_cmd_bash"}
+
+
+# ─── Accounting ──────────────────────────────────────────────────────────────
+
+class SessionRegistry:
+    """Live sessions of this process, for memory reporting."""
+
+    def __init__(self):
+        self._sessions: "weakref.WeakSet[ShellSession]" = weakref.WeakSet()
+        self.started = 0
+
+    def add(self, session: ShellSession):
+        self._sessions.add(session)
+        self.started += 1
+
+    def info(self) -> Dict:
+        used = [s.budget.used for s in list(self._sessions)]
+        return {
+            "active_sessions": len(used),
+            "sessions_started": self.started,
+            "overlay_bytes": sum(used),
+            "max_session_bytes": max(used, default=0),
+            "session_limit_bytes": SHELL_SESSION_MAX_BYTES,
+            "base_image_bytes": BASE_IMAGE_BYTES,
+        }
+
+
+# Singleton
+shell_sessions = SessionRegistry()
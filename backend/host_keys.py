@@ -0,0 +1,130 @@
+"""
+host_keys.py — SSH Host Key Set
+
+The SSH honeypot used to offer a single ssh-rsa key, generated on the event
+loop the first time it started. Real OpenSSH offers ed25519, ecdsa and rsa
+host keys, so a lone RSA key is an easy tell, and generating a key on a fresh
+container blocked startup.
+
+The manager keeps one key per configured algorithm in HOST_KEY_DIR under the
+names OpenSSH uses (ssh_host_ed25519_key, ...). Missing keys are generated in
+worker threads, all algorithms in parallel, and every key file is parsed once
+per process. A new key is published with a hard link, so when several SSH
+shards start together the first key written wins and the others load it.
+A legacy `ssh_host_key` in the working directory is adopted as the rsa key,
+which keeps the honeypot's RSA fingerprint across the upgrade.
+
+Timings of each key (loaded or generated) land in the runtime startup
+metrics, surfaced by /api/runtime and the SSH shard reports.
+
+Tuning (environment variables):
+    HOST_KEY_DIR     directory holding the host keys   (default ./ssh_host_keys)
+    HOST_KEY_TYPES   comma-separated algorithms         (default
+                     ssh-ed25519,ecdsa-sha2-nistp256,ssh-rsa)
+    HOST_KEY_RSA_BITS  size of a generated rsa key      (default 3072, as OpenSSH)
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import asyncssh
+
+from .runtime import startup_metrics
+
+HOST_KEY_DIR = os.getenv("HOST_KEY_DIR", "ssh_host_keys")
+HOST_KEY_TYPES = [t.strip() for t in os.getenv(
+    "HOST_KEY_TYPES", "ssh-ed25519,ecdsa-sha2-nistp256,ssh-rsa"
+).split(",") if t.strip()]
+HOST_KEY_RSA_BITS = int(os.getenv("HOST_KEY_RSA_BITS", "3072"))
+
+# Algorithm → file name, as OpenSSH lays out /etc/ssh
+KEY_FILES = {
+    "ssh-ed25519": "ssh_host_ed25519_key",
+    "ecdsa-sha2-nistp256": "ssh_host_ecdsa_key",
+    "ssh-rsa": "ssh_host_rsa_key",
+}
+LEGACY_KEY_FILE = "ssh_host_key"
+
+for _alg in HOST_KEY_TYPES:
+    if _alg not in KEY_FILES:
+        raise ValueError(f"Unknown HOST_KEY_TYPES entry {_alg!r}. Options: {list(KEY_FILES)}")
+
+
+class HostKeyManager:
+    """Loads (generating if needed) the host key set once per process."""
+
+    def __init__(self, key_dir: str = HOST_KEY_DIR, algorithms: Optional[List[str]] = None):
+        self.key_dir = key_dir
+        self.algorithms = list(algorithms or HOST_KEY_TYPES)
+        self._keys: Optional[List[asyncssh.SSHKey]] = None
+        self._lock = threading.Lock()
+        self.report: Dict[str, Dict] = {}
+
+    def _path(self, alg: str) -> str:
+        return os.path.join(self.key_dir, KEY_FILES[alg])
+
+    def _publish(self, key: asyncssh.SSHKey, path: str):
+        """Write a new key; if another process published one first, keep theirs."""
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        key.write_private_key(tmp)
+        os.chmod(tmp, 0o600)
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+
+    def _load_one(self, alg: str) -> Tuple[asyncssh.SSHKey, Dict]:
+        started = time.perf_counter()
+        path = self._path(alg)
+        source = "loaded"
+        if not os.path.exists(path) and alg == "ssh-rsa" and os.path.exists(LEGACY_KEY_FILE):
+            self._publish(asyncssh.read_private_key(LEGACY_KEY_FILE), path)
+            source = "adopted"
+        elif not os.path.exists(path):
+            options = {"key_size": HOST_KEY_RSA_BITS} if alg == "ssh-rsa" else {}
+            self._publish(asyncssh.generate_private_key(alg, **options), path)
+            source = "generated"
+        key = asyncssh.read_private_key(path)
+        return key, {
+            "algorithm": alg,
+            "fingerprint": key.get_fingerprint(),
+            "source": source,
+            "seconds": round(time.perf_counter() - started, 4),
+        }
+
+    def load_sync(self) -> List[asyncssh.SSHKey]:
+        """The key set, loaded on first call; missing keys are generated in parallel."""
+        with self._lock:
+            if self._keys is None:
+                started = time.perf_counter()
+                os.makedirs(self.key_dir, mode=0o700, exist_ok=True)
+                with ThreadPoolExecutor(max_workers=len(self.algorithms)) as pool:
+                    results = list(pool.map(self._load_one, self.algorithms))
+                self._keys = [key for key, _ in results]
+                self.report = {entry["algorithm"]: entry for _, entry in results}
+                elapsed = time.perf_counter() - started
+                startup_metrics["host_keys_s"] = round(elapsed, 4)
+                for entry in self.report.values():
+                    startup_metrics[f"host_keys.{entry['algorithm']}_s"] = entry["seconds"]
+                summary = ", ".join(f"{e['algorithm']} ({e['source']})" for e in self.report.values())
+                print(f"[HostKeys] {summary} in {elapsed * 1000:.0f} ms from {self.key_dir}")
+            return self._keys
+
+    async def load(self) -> List[asyncssh.SSHKey]:
+        """load_sync() off the event loop."""
+        if self._keys is not None:
+            return self._keys
+        return await asyncio.to_thread(self.load_sync)
+
+    def info(self) -> Dict:
+        return {"key_dir": self.key_dir, "keys": list(self.report.values())}
+
+
+# Singleton
+host_keys = HostKeyManager()
@@ -0,0 +1,538 @@
+"""
+ingestion.py — Batched Event Ingestion Pipeline
+
+Honeypot listeners no longer open a database session per event. Instead they
+enqueue small typed events here; a single background writer drains the queue
+and flushes each batch inside one transaction, off the event loop.
+
+Tuning (environment variables):
+    INGEST_QUEUE_SIZE     max events buffered in memory          (default 10000)
+    INGEST_BATCH_SIZE     max events written per transaction     (default 500)
+    INGEST_LINGER_MS      how long to wait for a batch to fill   (default 50)
+    INGEST_BACKPRESSURE   policy when the queue is full:
+                            "block"       — await until space is available
+                            "drop_newest" — discard the incoming event
+                            "drop_oldest" — discard the oldest queued event (default)
+
+In multi-process mode (cluster.py) only the hub runs the writer; listener and
+API processes call `forward_to(client)` and `put` sends each event to the hub
+over the broker instead.
+"""
+
+import asyncio
+import os
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from .aggregator import SummaryDelta, apply_deltas
+from .attacker_cache import attacker_cache, AttackerEntry
+from .database import SessionLocal, dialect_insert
+from .models import (
+    HoneypotCommand, Credential, WebAttack,
+    ThreatReport, DynamicService, ServiceInteraction, SshConnection, SshSession
+)
+from .normalizer import fingerprint
+from .ssh_telemetry import FingerprintDelta, apply_fingerprint_deltas
+from .stats_counters import CounterDelta, apply_counter_deltas
+from .techniques import TechniqueDelta, apply_technique_deltas, technique_catalog
+
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_LINGER_MS = int(os.getenv("INGEST_LINGER_MS", "50"))
+INGEST_BACKPRESSURE = os.getenv("INGEST_BACKPRESSURE", "drop_oldest")
+
+BACKPRESSURE_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Event types
+# ─────────────────────────────────────────────────────────────────────────────
+
+@dataclass
+class CommandEvent:
+    """A shell command typed into the SSH honeypot."""
+    ip: str
+    command: str
+    analysis: Dict[str, Any]
+    geo: Optional[dict] = None
+    timestamp: datetime = field(default_factory=datetime.utcnow)
+
+
+@dataclass
+class LoginEvent:
+    """A credential pair submitted to any honeypot (ssh, web, ...)."""
+    ip: str
+    username: str
+    password: str
+    source: str
+    geo: Optional[dict] = None
+    timestamp: datetime = field(default_factory=datetime.utcnow)
+
+
+@dataclass
+class WebAttackEvent:
+    """A suspicious payload sent to the web honeypot."""
+    ip: str
+    endpoint: str
+    payload: str
+    user_agent: Optional[str] = None
+    timestamp: datetime = field(default_factory=datetime.utcnow)
+
+
+@dataclass
+class ServiceProbeEvent:
+    """Raw data received by one of the dynamic fake services."""
+    ip: str
+    service_name: str
+    service_port: int
+    raw_data: str
+    geo: Optional[dict] = None
+    timestamp: datetime = field(default_factory=datetime.utcnow)
+
+
+@dataclass
+class SshSessionEvent:
+    """
+    Start or end (`ended`) of an SSH shell session; both upsert its SshSession
+    row. The keystrokes themselves go to the transcript file, not the database.
+    """
+    ip: str
+    session_id: str
+    username: Optional[str] = None
+    term_type: Optional[str] = None
+    term_size: Optional[str] = None
+    transcript_path: Optional[str] = None
+    ended: bool = False
+    duration_s: float = 0.0
+    commands: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    transcript_bytes: int = 0
+    exit_status: Optional[int] = None
+    geo: Optional[dict] = None
+    timestamp: datetime = field(default_factory=datetime.utcnow)
+
+
+@dataclass
+class SshConnectionEvent:
+    """Connection-level telemetry of one SSH client, sent when it disconnects (see ssh_telemetry.py)."""
+    ip: str
+    client_version: Optional[str] = None
+    hassh: Optional[str] = None
+    hassh_algorithms: Optional[str] = None
+    kex_algorithms: Optional[str] = None
+    host_key_algorithms: Optional[str] = None
+    ciphers: Optional[str] = None
+    macs: Optional[str] = None
+    compression: Optional[str] = None
+    cipher: Optional[str] = None
+    mac: Optional[str] = None
+    auth_methods: str = ""
+    auth_attempts: int = 0
+    public_keys: str = ""
+    authenticated: bool = False
+    handshake_ms: Optional[float] = None
+    duration_s: Optional[float] = None
+    timestamp: datetime = field(default_factory=datetime.utcnow)
+
+
+EVENT_TYPES = {cls.__name__: cls for cls in (
+    CommandEvent, LoginEvent, WebAttackEvent, ServiceProbeEvent, SshSessionEvent, SshConnectionEvent
+)}
+
+
+def event_to_dict(event) -> Dict[str, Any]:
+    """JSON-ready form of an event, for sending it to another process."""
+    return {**asdict(event), "kind": type(event).__name__, "timestamp": event.timestamp.isoformat()}
+
+
+def event_from_dict(data: Dict[str, Any]):
+    fields = dict(data)
+    cls = EVENT_TYPES[fields.pop("kind")]
+    fields["timestamp"] = datetime.fromisoformat(fields["timestamp"])
+    return cls(**fields)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Batch writer
+# ─────────────────────────────────────────────────────────────────────────────
+
+class _Batch:
+    """
+    Per-transaction state: each service is looked up once, and attacker
+    changes are coalesced so every attacker gets at most one UPDATE per batch.
+    Dashboard counters, attacker↔technique rows and the per-HASSH SSH
+    rollup are added up here and written with the same commit.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.services: Dict[str, Optional[DynamicService]] = {}
+        self._pending: Dict[str, dict] = {}
+        self._deltas: Dict[int, SummaryDelta] = {}
+        self.counters = CounterDelta()
+        self.techniques = TechniqueDelta()
+        self.ssh_fingerprints = FingerprintDelta()
+
+    def attacker(self, ip: str, geo: Optional[dict] = None, risk_score: int = 0) -> AttackerEntry:
+        entry, created = attacker_cache.upsert(self.db, ip, geo, risk_score)
+        if created:
+            self.counters.add("attackers", datetime.utcnow())
+        self._pending.setdefault(ip, {"entry": entry, "risk_score": None, "techniques": 0, "last_seen": None})
+        return entry
+
+    def touch(self, ip: str, timestamp: datetime, risk_score: Optional[int] = None, ttp: Optional[str] = None):
+        pending = self._pending[ip]
+        if risk_score is not None:
+            pending["risk_score"] = max(risk_score, pending["risk_score"] or 0)
+        if ttp:
+            bit = technique_catalog.bit(self.db, ttp)
+            if bit is not None:
+                pending["techniques"] |= 1 << bit
+                self.techniques.add(pending["entry"].id, bit, timestamp)
+        if pending["last_seen"] is None or timestamp > pending["last_seen"]:
+            pending["last_seen"] = timestamp
+
+    def summary(self, attacker: AttackerEntry) -> SummaryDelta:
+        delta = self._deltas.get(attacker.id)
+        if delta is None:
+            delta = self._deltas[attacker.id] = SummaryDelta()
+        return delta
+
+    def service(self, name: str) -> Optional[DynamicService]:
+        if name not in self.services:
+            self.services[name] = self.db.query(DynamicService).filter(DynamicService.name == name).first()
+        return self.services[name]
+
+    def touched_ips(self) -> List[str]:
+        return list(self._pending)
+
+    def finish(self):
+        """Write the coalesced attacker updates through the identity cache."""
+        for pending in self._pending.values():
+            attacker_cache.update(
+                self.db,
+                pending["entry"],
+                risk_score=pending["risk_score"],
+                techniques=pending["techniques"],
+                last_seen=pending["last_seen"],
+            )
+        apply_deltas(self.db, self._deltas)
+        apply_counter_deltas(self.db, self.counters)
+        apply_technique_deltas(self.db, self.techniques)
+        apply_fingerprint_deltas(self.db, self.ssh_fingerprints)
+
+
+def _apply_command(batch: _Batch, event: CommandEvent):
+    attacker = batch.attacker(event.ip, event.geo)
+    analysis = event.analysis
+    risk_score = analysis.get("score", 0)
+    ttp_tag = analysis.get("ttp", "")
+
+    batch.db.add(HoneypotCommand(
+        attacker_id=attacker.id,
+        command=event.command,
+        fingerprint=fingerprint(event.command),
+        severity=analysis.get("severity", "LOW"),
+        ttp=ttp_tag,
+        timestamp=event.timestamp
+    ))
+
+    # High-risk commands get an immediate threat report
+    if risk_score > 50:
+        batch.db.add(ThreatReport(
+            attacker_id=attacker.id,
+            severity=analysis.get("severity", "MEDIUM"),
+            description=analysis.get("description", "Suspicious command"),
+            recommended_action=analysis.get("action", "Monitor"),
+            service_type="ssh",
+            timestamp=event.timestamp
+        ))
+
+    batch.touch(event.ip, event.timestamp, risk_score=risk_score, ttp=ttp_tag)
+    batch.summary(attacker).add_command(event.command, risk_score, event.timestamp)
+    batch.counters.add("commands", event.timestamp)
+
+
+def _apply_login(batch: _Batch, event: LoginEvent):
+    attacker = batch.attacker(event.ip, event.geo)
+    batch.db.add(Credential(
+        attacker_id=attacker.id,
+        username=event.username,
+        password=event.password,
+        source=event.source,
+        timestamp=event.timestamp
+    ))
+    batch.touch(event.ip, event.timestamp)
+    batch.summary(attacker).add_credential(event.username, event.password, event.timestamp)
+    batch.counters.add("credentials", event.timestamp)
+
+
+def _apply_web_attack(batch: _Batch, event: WebAttackEvent):
+    attacker = batch.attacker(event.ip)
+    batch.db.add(WebAttack(
+        attacker_id=attacker.id,
+        endpoint=event.endpoint,
+        payload=event.payload,
+        user_agent=event.user_agent,
+        timestamp=event.timestamp
+    ))
+    batch.touch(event.ip, event.timestamp)
+    batch.summary(attacker).add_web_attack(event.payload, event.timestamp)
+    batch.counters.add("web_attacks", event.timestamp)
+
+
+def _apply_service_probe(batch: _Batch, event: ServiceProbeEvent):
+    attacker = batch.attacker(event.ip, event.geo, risk_score=30)  # Base score for probing
+    svc = batch.service(event.service_name)
+
+    batch.db.add(ServiceInteraction(
+        service_id=svc.id if svc else None,
+        attacker_id=attacker.id,
+        attacker_ip=event.ip,
+        raw_data=event.raw_data,
+        timestamp=event.timestamp
+    ))
+
+    if svc:
+        svc.interaction_count = (svc.interaction_count or 0) + 1
+
+    batch.db.add(ThreatReport(
+        attacker_id=attacker.id,
+        severity="MEDIUM",
+        description=f"Attacker probed fake {event.service_name.upper()} service on port {event.service_port}",
+        recommended_action="Monitor and correlate with other activity",
+        service_type=event.service_name,
+        timestamp=event.timestamp
+    ))
+
+    batch.touch(event.ip, event.timestamp, ttp="T1046 - Network Service Scanning")
+    batch.summary(attacker).add_service_probe(event.service_name, event.timestamp)
+    batch.counters.add("service_probes", event.timestamp)
+
+
+def _apply_ssh_session(batch: _Batch, event: SshSessionEvent):
+    attacker = batch.attacker(event.ip, event.geo)
+    row = {
+        "session_id": event.session_id,
+        "attacker_id": attacker.id,
+        "attacker_ip": event.ip,
+        "username": event.username,
+        "term_type": event.term_type,
+        "term_size": event.term_size,
+        "transcript_path": event.transcript_path,
+        # An end event also creates the row if its start event was dropped
+        "started_at": event.timestamp - timedelta(seconds=event.duration_s),
+    }
+    stmt = dialect_insert(batch.db)(SshSession)
+    if event.ended:
+        ended = {
+            "ended_at": event.timestamp,
+            "commands": event.commands,
+            "bytes_in": event.bytes_in,
+            "bytes_out": event.bytes_out,
+            "transcript_bytes": event.transcript_bytes,
+            "exit_status": event.exit_status,
+        }
+        stmt = stmt.values(**row, **ended).on_conflict_do_update(index_elements=["session_id"], set_=ended)
+    else:
+        stmt = stmt.values(**row).on_conflict_do_nothing(index_elements=["session_id"])
+    batch.db.execute(stmt)
+    batch.touch(event.ip, event.timestamp)
+
+
+def _apply_ssh_connection(batch: _Batch, event: SshConnectionEvent):
+    # Telemetry only: a banner grab is no attack, so the attacker row is left alone
+    batch.db.add(SshConnection(
+        attacker_ip=event.ip,
+        client_version=event.client_version,
+        hassh=event.hassh,
+        kex_algorithms=event.kex_algorithms,
+        host_key_algorithms=event.host_key_algorithms,
+        ciphers=event.ciphers,
+        macs=event.macs,
+        compression=event.compression,
+        cipher=event.cipher,
+        mac=event.mac,
+        auth_methods=event.auth_methods,
+        auth_attempts=event.auth_attempts,
+        public_keys=event.public_keys,
+        authenticated=int(event.authenticated),
+        handshake_ms=event.handshake_ms,
+        duration_s=event.duration_s,
+        timestamp=event.timestamp
+    ))
+    if event.hassh:
+        batch.ssh_fingerprints.add(event.hassh, event.hassh_algorithms, event.client_version, event.timestamp)
+
+
+_APPLIERS = {
+    CommandEvent: _apply_command,
+    LoginEvent: _apply_login,
+    WebAttackEvent: _apply_web_attack,
+    ServiceProbeEvent: _apply_service_probe,
+    SshSessionEvent: _apply_ssh_session,
+    SshConnectionEvent: _apply_ssh_connection,
+}
+
+
+class EventIngestor:
+    """
+    Central queue between the honeypot listeners and the database.
+    Listeners call `await ingestor.put(event)`; the writer task does the rest.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = INGEST_QUEUE_SIZE,
+        batch_size: int = INGEST_BATCH_SIZE,
+        linger_ms: int = INGEST_LINGER_MS,
+        backpressure: str = INGEST_BACKPRESSURE,
+    ):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            print(f"[Ingest] Unknown backpressure policy {backpressure!r}, using drop_oldest.")
+            backpressure = "drop_oldest"
+        self.batch_size = max(1, batch_size)
+        self.linger = max(0, linger_ms) / 1000.0
+        self.backpressure = backpressure
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        # Events taken off the queue but not yet handed to a flush (lingering)
+        self._batch: List[Any] = []
+        self._inflight: Optional[asyncio.Future] = None
+        self._forward = None
+        self.stats = {"enqueued": 0, "dropped": 0, "written": 0, "failed": 0, "batches": 0}
+
+    def forward_to(self, client):
+        """Send events to the hub through a BrokerClient instead of writing them here."""
+        self._forward = client
+
+    # ── Producer side ────────────────────────────────────────────────────────
+
+    async def put(self, event) -> bool:
+        """Enqueue an event. Returns False if it was dropped by backpressure."""
+        if self._forward is not None:
+            self._forward.send_event(event_to_dict(event))
+            self.stats["enqueued"] += 1
+            return True
+
+        if self.backpressure == "block":
+            await self._queue.put(event)
+            self.stats["enqueued"] += 1
+            return True
+
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            if self.backpressure == "drop_newest":
+                self.stats["dropped"] += 1
+                return False
+            # drop_oldest: make room by discarding the head of the queue
+            try:
+                self._queue.get_nowait()
+                self.stats["dropped"] += 1
+            except asyncio.QueueEmpty:
+                pass
+            self._queue.put_nowait(event)
+        self.stats["enqueued"] += 1
+        return True
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth(),
+            "batch_size": self.batch_size,
+            "linger_ms": int(self.linger * 1000),
+            "backpressure": self.backpressure,
+            **self.stats,
+            "attacker_cache": {"size": len(attacker_cache), **attacker_cache.stats},
+        }
+
+    # ── Writer side ──────────────────────────────────────────────────────────
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            print(f"[Ingest] Writer started (batch={self.batch_size}, linger={self.linger * 1000:.0f}ms, "
+                  f"backpressure={self.backpressure})")
+
+    async def stop(self):
+        """Stop the writer and flush whatever is still queued."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._inflight and not self._inflight.done():
+            await asyncio.gather(self._inflight, return_exceptions=True)
+        # A batch the writer was still lingering on goes first, in arrival order
+        remaining, self._batch = self._batch, []
+        remaining += self._drain(self._queue.qsize())
+        if remaining:
+            await asyncio.to_thread(self._flush, remaining)
+
+    def _drain(self, limit: int) -> List[Any]:
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return items
+
+    async def _run(self):
+        while True:
+            # Kept on self so stop() flushes it if cancelled while lingering
+            batch = self._batch = [await self._queue.get()]
+            batch.extend(self._drain(self.batch_size - len(batch)))
+            if len(batch) < self.batch_size and self.linger:
+                # Give a burst a moment to accumulate before paying for a commit
+                await asyncio.sleep(self.linger)
+                batch.extend(self._drain(self.batch_size - len(batch)))
+
+            # Shield the write so a shutdown never abandons a half-flushed batch
+            self._batch = []
+            self._inflight = asyncio.ensure_future(asyncio.to_thread(self._flush, batch))
+            await asyncio.shield(self._inflight)
+
+    def _flush(self, events: List[Any]):
+        """Write a batch in a single transaction (runs in a worker thread)."""
+        db = SessionLocal()
+        batch = _Batch(db)
+        try:
+            for event in events:
+                _APPLIERS[type(event)](batch, event)
+            batch.finish()
+            db.commit()
+            self.stats["written"] += len(events)
+            self.stats["batches"] += 1
+        except Exception as e:
+            db.rollback()
+            # Cached entries may hold ids/scores/techniques that were never committed
+            attacker_cache.invalidate(batch.touched_ips())
+            technique_catalog.invalidate()
+            print(f"[Ingest] Batch of {len(events)} failed ({e}); retrying events individually.")
+            self._flush_individually(db, events)
+        finally:
+            db.close()
+
+    def _flush_individually(self, db, events: List[Any]):
+        for event in events:
+            batch = _Batch(db)
+            try:
+                _APPLIERS[type(event)](batch, event)
+                batch.finish()
+                db.commit()
+                self.stats["written"] += 1
+            except Exception as e:
+                db.rollback()
+                attacker_cache.invalidate(batch.touched_ips())
+                technique_catalog.invalidate()
+                self.stats["failed"] += 1
+                print(f"[Ingest] Dropping {type(event).__name__} from {getattr(event, 'ip', '?')}: {e}")
+
+
+# Singleton
+ingestor = EventIngestor()
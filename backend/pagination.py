@@ -0,0 +1,116 @@
+"""
+pagination.py — Keyset Pagination and NDJSON Streaming for List Endpoints
+
+List endpoints page newest-first on (timestamp, id). The cursor is the sort
+key of the last row returned, so each page is an index range scan whatever
+its depth, unlike OFFSET, which rescans every skipped row.
+
+    GET /api/credentials?limit=100                  → JSON list, first page
+        X-Next-Cursor: <cursor>                     (absent on the last page)
+    GET /api/credentials?limit=100&cursor=<cursor>  → next page
+    GET /api/credentials?format=ndjson              → every matching row, streamed
+
+JSON bodies stay plain lists so existing clients keep working. NDJSON
+responses stream from their own session with `yield_per`, so memory and
+time-to-first-byte do not grow with table size.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import and_, or_
+
+from .database import SessionLocal
+
+MAX_PAGE_SIZE = 5000
+STREAM_CHUNK_ROWS = 1000
+
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    raw = json.dumps([sort_value.isoformat() if sort_value else None, row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """Raises ValueError on a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return (datetime.fromisoformat(sort_value) if sort_value else None), int(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def time_range(query, column, since: Optional[datetime], until: Optional[datetime]):
+    if since is not None:
+        query = query.filter(column >= since)
+    if until is not None:
+        query = query.filter(column < until)
+    return query
+
+
+def _after(query, sort_col, id_col, cursor: Optional[str]):
+    """Newest-first order, resuming strictly after the cursor row."""
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            sort_col < sort_value,
+            and_(sort_col == sort_value, id_col < row_id),
+        ))
+    return query.order_by(sort_col.desc(), id_col.desc())
+
+
+def list_response(
+    db,
+    build_query: Callable[[Any], Any],
+    sort_col,
+    id_col,
+    key: Callable[[Any], Tuple[datetime, int]],
+    serialize: Callable[[Any], Dict[str, Any]],
+    limit: Optional[int],
+    cursor: Optional[str],
+    fmt: str = "json",
+    default_limit: int = 100,
+):
+    """
+    Run a filtered list query as one keyset page (JSON) or a full NDJSON stream.
+    `build_query(session)` returns the filtered, unordered query; `key(row)`
+    returns the row's (sort value, id).
+    """
+    try:
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    if fmt == "ndjson":
+        def stream():
+            session = SessionLocal()
+            try:
+                query = _after(build_query(session), sort_col, id_col, cursor)
+                if limit:
+                    query = query.limit(limit)
+                for row in query.yield_per(STREAM_CHUNK_ROWS):
+                    yield json.dumps(serialize(row), default=json_default) + "\n"
+            finally:
+                session.close()
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    page_size = min(max(limit or default_limit, 1), MAX_PAGE_SIZE)
+    rows = _after(build_query(db), sort_col, id_col, cursor).limit(page_size + 1).all()
+    headers = {}
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        headers["X-Next-Cursor"] = encode_cursor(*key(rows[-1]))
+    body = json.dumps([serialize(row) for row in rows], default=json_default)
+    return Response(content=body, media_type="application/json", headers=headers)
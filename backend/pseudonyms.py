@@ -0,0 +1,88 @@
+"""
+pseudonyms.py — Deterministic IP Pseudonyms and Mock Geolocation
+
+A demo run attacks the honeypots from localhost, which would put every event
+on one "127.0.0.1" attacker with no location. The honeypots therefore show
+loopback and private clients under a stable fake public IP, and every
+attacker gets a sample location for the map.
+
+Both mappings are a keyed BLAKE2b hash of the client IP. They have no side
+effects, so they are safe from any coroutine or thread. They are memoized per
+process and identical in every process that shares the key, so SSH shards,
+fake services and the web honeypot agree on one attacker. The source port is
+not part of the key: one local attacker stays one attacker across
+connections.
+
+Tuning (environment variables):
+    IP_PSEUDONYMS      which client IPs are replaced by a fake public IP:
+                         "off"   — none, record real IPs (production)
+                         "local" — loopback and private IPs (default; demos
+                                   from this machine or a LAN)
+                         "all"   — every IP, e.g. for a public demo
+    IP_PSEUDONYM_KEY   hash key; change it to reshuffle the mapping
+                       (default "honeypot-demo")
+    IP_PSEUDONYM_CACHE memoized addresses per process   (default 65536)
+"""
+
+import hashlib
+import ipaddress
+import os
+from functools import lru_cache
+
+IP_PSEUDONYMS = os.getenv("IP_PSEUDONYMS", "local").lower()
+if IP_PSEUDONYMS not in ("off", "local", "all"):
+    raise ValueError(f"Unknown IP_PSEUDONYMS {IP_PSEUDONYMS!r}. Options: ['off', 'local', 'all']")
+IP_PSEUDONYM_KEY = os.getenv("IP_PSEUDONYM_KEY", "honeypot-demo").encode()[:64]
+IP_PSEUDONYM_CACHE = int(os.getenv("IP_PSEUDONYM_CACHE", "65536"))
+
+SAMPLE_LOCATIONS = [
+    {"country": "China", "city": "Beijing", "lat": 39.9042, "lon": 116.4074},
+    {"country": "Russia", "city": "Moscow", "lat": 55.7558, "lon": 37.6173},
+    {"country": "North Korea", "city": "Pyongyang", "lat": 39.0392, "lon": 125.7625},
+    {"country": "Brazil", "city": "São Paulo", "lat": -23.5505, "lon": -46.6333},
+    {"country": "Iran", "city": "Tehran", "lat": 35.6892, "lon": 51.3890},
+    {"country": "USA", "city": "New York", "lat": 40.7128, "lon": -74.0060},
+    {"country": "Germany", "city": "Berlin", "lat": 52.5200, "lon": 13.4050},
+    {"country": "Ukraine", "city": "Kyiv", "lat": 50.4501, "lon": 30.5234},
+]
+
+# First octets that would not look like a public attacker (private, loopback, CGNAT, link-local)
+_NON_PUBLIC_FIRST_OCTETS = {10, 100, 127, 169, 172, 192}
+
+
+def _digest(ip: str, purpose: bytes) -> bytes:
+    return hashlib.blake2b(ip.encode(), key=IP_PSEUDONYM_KEY, person=purpose, digest_size=8).digest()
+
+
+def _is_local(ip: str) -> bool:
+    if ip == "localhost":
+        return True
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return address.is_loopback or address.is_private or address.is_link_local
+
+
+@lru_cache(maxsize=IP_PSEUDONYM_CACHE)
+def pseudonym_ip(ip: str) -> str:
+    """A stable public-looking IPv4 address for `ip`."""
+    d = _digest(ip, b"ip")
+    first = 1 + d[0] % 220
+    if first in _NON_PUBLIC_FIRST_OCTETS:
+        first += 1
+    return f"{first}.{d[1]}.{d[2]}.{1 + d[3] % 254}"
+
+
+@lru_cache(maxsize=IP_PSEUDONYM_CACHE)
+def recorded_ip(ip: str) -> str:
+    """The IP a honeypot records for a client, per IP_PSEUDONYMS."""
+    if IP_PSEUDONYMS == "all" or (IP_PSEUDONYMS == "local" and _is_local(ip)):
+        return pseudonym_ip(ip)
+    return ip
+
+
+@lru_cache(maxsize=IP_PSEUDONYM_CACHE)
+def geo_for(ip: str) -> dict:
+    """A sample location for `ip`, the same one every time. Callers must not modify it."""
+    return SAMPLE_LOCATIONS[int.from_bytes(_digest(ip, b"geo"), "big") % len(SAMPLE_LOCATIONS)]
@@ -0,0 +1,199 @@
+"""
+report_jobs.py — Background Report Generation
+
+`POST /api/attacker/{ip}/generate-report` only enqueues a job and returns its
+id. A bounded pool of workers runs the threat-report and profile prompts in
+parallel, stores the result, and pushes a `report_ready` WebSocket event.
+Requests for an attacker that already has a job in flight get that job back.
+
+Tuning (environment variables):
+    REPORT_WORKERS        concurrent report jobs        (default 2)
+    REPORT_JOBS_RETAINED  finished jobs kept for polling (default 500)
+"""
+
+import asyncio
+import json
+import os
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from .aggregator import rebuild_summary, summary_to_attacker_data
+from .ai_analyzer import generate_attacker_profile, generate_threat_report
+from .attacker_cache import attacker_cache
+from .database import AsyncSessionLocal
+from .models import Attacker, AttackerSummary, ThreatReport
+from .techniques import merge_tags
+from .websocket_manager import manager
+
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_JOBS_RETAINED = int(os.getenv("REPORT_JOBS_RETAINED", "500"))
+
+
+@dataclass
+class ReportJob:
+    id: str
+    ip: str
+    status: str = "queued"  # queued | running | done | failed
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "ip_address": self.ip,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+async def build_report(ip: str) -> Optional[Dict[str, Any]]:
+    """Generate and persist a full report for `ip`. Returns None if the attacker is unknown."""
+    # Short read: no session stays open while the prompts run
+    async with AsyncSessionLocal() as db:
+        attacker = (await db.execute(
+            select(Attacker).where(Attacker.ip_address == ip)
+        )).scalars().first()
+        if not attacker:
+            return None
+
+        # O(1): read the incrementally maintained summary instead of the full history
+        summary = await db.get(AttackerSummary, attacker.id)
+        if summary is None:
+            summary = await db.run_sync(lambda session: rebuild_summary(session, attacker.id))
+        attacker_data = summary_to_attacker_data(attacker, summary)
+        attacker_id = attacker.id
+
+    # Both prompts are independent — run them side by side
+    threat_report, profile_md = await asyncio.gather(
+        generate_threat_report(attacker_data),
+        generate_attacker_profile(attacker_data),
+    )
+
+    # Short write: re-read the row, since ingestion kept updating it meanwhile
+    async with AsyncSessionLocal() as db:
+        attacker = await db.get(Attacker, attacker_id)
+        if attacker is None:
+            return None  # reset or archived while the prompts ran
+
+        # Record detected TTPs alongside the ones seen in events
+        first_seen, last_seen = attacker.first_seen, attacker.last_seen or datetime.utcnow()
+        attacker.ttp_tags = await db.run_sync(lambda session: merge_tags(
+            session, attacker_id, attacker_data["ttps"], first_seen or last_seen, last_seen
+        ))
+        attacker.attacker_profile = profile_md
+
+        db.add(ThreatReport(
+            attacker_id=attacker_id,
+            severity=threat_report.get("risk_level", "MEDIUM"),
+            description=threat_report.get("summary", ""),
+            recommended_action=", ".join(threat_report.get("recommendations", [])),
+            service_type="full_report",
+            full_report_json=json.dumps(threat_report)
+        ))
+        await db.commit()
+        ttp_tags = attacker.ttp_tags
+    # ttp_tags was rewritten outside the ingestion path — drop the cached copy
+    attacker_cache.invalidate([ip])
+
+    return {
+        "ip_address": ip,
+        "ttp_tags": ttp_tags,
+        "profile_markdown": profile_md,
+        "threat_report": threat_report
+    }
+
+
+class ReportJobQueue:
+    def __init__(self, workers: int = REPORT_WORKERS, retained: int = REPORT_JOBS_RETAINED):
+        self.workers = max(1, workers)
+        self.retained = retained
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._jobs: "OrderedDict[str, ReportJob]" = OrderedDict()
+        self._inflight: Dict[str, str] = {}  # ip → job id
+        self._tasks: List[asyncio.Task] = []
+
+    def submit(self, ip: str) -> Tuple[ReportJob, bool]:
+        """Enqueue a report for `ip`. Returns (job, created) — created is False for a duplicate."""
+        job_id = self._inflight.get(ip)
+        if job_id is not None:
+            return self._jobs[job_id], False
+
+        job = ReportJob(id=uuid.uuid4().hex, ip=ip)
+        self._jobs[job.id] = job
+        self._inflight[ip] = job.id
+        self._queue.put_nowait(job)
+        self._trim()
+        return job, True
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        return self._jobs.get(job_id)
+
+    def _trim(self):
+        """Forget the oldest finished jobs beyond the retention limit."""
+        excess = len(self._jobs) - self.retained
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].status in ("done", "failed"):
+                del self._jobs[job_id]
+                excess -= 1
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._inflight.pop(job.ip, None)
+                self._queue.task_done()
+
+    async def _run(self, job: ReportJob):
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        try:
+            job.result = await build_report(job.ip)
+            if job.result is None:
+                job.status, job.error = "failed", "Attacker not found"
+            else:
+                job.status = "done"
+        except asyncio.CancelledError:
+            job.status, job.error = "failed", "Cancelled"
+            raise
+        except Exception as e:
+            print(f"[Reports] Job {job.id} for {job.ip} failed: {e}")
+            job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+        finally:
+            job.finished_at = datetime.utcnow()
+
+        manager.publish({
+            "type": "report_ready",
+            "job_id": job.id,
+            "ip": job.ip,
+            "status": job.status,
+        })
+
+
+# Singleton
+report_jobs = ReportJobQueue()
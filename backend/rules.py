@@ -0,0 +1,192 @@
+"""
+rules.py — Declarative Detection Rules & Compiled Matcher
+
+Every rule used to classify SSH commands and web payloads lives in the tables
+below. A table is compiled once into a single combined regex (RuleEngine), so
+a string is scanned in one pass and *every* matching rule is returned rather
+than only the first tier that happened to match.
+
+Rule kinds:
+    "verdict" — contributes severity/score/action to the per-command verdict;
+                the highest-scoring matched verdict rule wins
+    "ttp"     — only tags a MITRE ATT&CK technique (used by detect_ttps)
+
+Matching keeps the original semantics: case-insensitive substring match.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+RULE_CACHE_SIZE = int(os.getenv("RULE_CACHE_SIZE", "4096"))
+
+
+@dataclass(frozen=True)
+class Rule:
+    rule_id: str
+    ttp: str
+    patterns: Tuple[str, ...]
+    kind: str = "ttp"
+    severity: str = "LOW"
+    score: int = 0
+    description: str = ""
+    action: str = "None"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Rule tables
+# ─────────────────────────────────────────────────────────────────────────────
+
+COMMAND_RULES: Tuple[Rule, ...] = (
+    # ── Verdict tiers (what classify_command reports) ─────────────────────────
+    Rule(
+        rule_id="reverse_shell_or_download",
+        kind="verdict",
+        severity="CRITICAL",
+        score=95,
+        description="Attempted reverse shell or malware download.",
+        action="Immediate IP Block",
+        ttp="T1059 - Command and Scripting Interpreter",
+        patterns=("wget", "curl", "nc ", "ncat", "bash -i", "python -c", "php -r"),
+    ),
+    Rule(
+        rule_id="destructive_or_privileged",
+        kind="verdict",
+        severity="HIGH",
+        score=75,
+        description="Destructive or privileged command attempt.",
+        action="Monitor Closely",
+        ttp="T1548 - Abuse Elevation Control Mechanism",
+        patterns=("sudo", "rm -rf", "chmod 777", "chown", "dd ", "mkfs"),
+    ),
+    Rule(
+        rule_id="enumeration",
+        kind="verdict",
+        severity="MEDIUM",
+        score=45,
+        description="System enumeration and reconnaissance.",
+        action="Log Activity",
+        ttp="T1082 - System Information Discovery",
+        patterns=("whoami", "id", "pwd", "ls", "uname", "cat /etc/passwd"),
+    ),
+
+    # ── TTP tags (what detect_ttps reports) ──────────────────────────────────
+    Rule(rule_id="system_info_discovery", ttp="T1082 - System Information Discovery",
+         patterns=("whoami", "id", "uname", "hostname", "ifconfig", "ip addr")),
+    Rule(rule_id="process_discovery", ttp="T1057 - Process Discovery",
+         patterns=("ps", "netstat", "ss ")),
+    Rule(rule_id="credential_dumping", ttp="T1003 - OS Credential Dumping",
+         patterns=("cat /etc/passwd", "cat /etc/shadow")),
+    Rule(rule_id="script_interpreter", ttp="T1059 - Command and Scripting Interpreter",
+         patterns=("bash -i", "python -c", "perl -e", "ruby -e", "php -r")),
+    Rule(rule_id="scheduled_task", ttp="T1053 - Scheduled Task/Job",
+         patterns=("crontab", ".bashrc", ".profile", "~/.ssh/authorized_keys")),
+    Rule(rule_id="indicator_removal", ttp="T1070 - Indicator Removal",
+         patterns=("history -c", "unset HISTFILE", "rm -rf /var/log")),
+    Rule(rule_id="ingress_tool_transfer", ttp="T1105 - Ingress Tool Transfer",
+         patterns=("wget", "curl", "nc ", "ncat", "socat")),
+)
+
+WEB_RULES: Tuple[Rule, ...] = (
+    Rule(rule_id="sql_injection", ttp="T1190 - Exploit Public-Facing Application (SQLi)",
+         patterns=("select", "union", "' or", "1=1", "--")),
+    Rule(rule_id="xss", ttp="T1059.007 - Cross-Site Scripting",
+         patterns=("<script",)),
+)
+
+DEFAULT_VERDICT = Rule(
+    rule_id="general_shell",
+    kind="verdict",
+    severity="LOW",
+    score=10,
+    description="General shell interaction.",
+    action="None",
+    ttp="T1059 - Command and Scripting Interpreter",
+    patterns=(),
+)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Compiled engine
+# ─────────────────────────────────────────────────────────────────────────────
+
+class RuleEngine:
+    """
+    Compiles a rule table into one alternation regex.
+
+    Patterns are ordered longest-first, so at any position the regex reports
+    the longest pattern that matches there; every shorter pattern matching at
+    the same position is necessarily a prefix of it, which `_hits` resolves
+    up-front. Resuming the search one character after each match start makes
+    overlapping patterns visible too — all matches in a single scan.
+    """
+
+    def __init__(self, rules: Iterable[Rule], cache_size: int = RULE_CACHE_SIZE):
+        self.rules: Tuple[Rule, ...] = tuple(rules)
+
+        owners: Dict[str, set] = {}
+        for index, rule in enumerate(self.rules):
+            for pattern in rule.patterns:
+                owners.setdefault(pattern.lower(), set()).add(index)
+
+        patterns = sorted(owners, key=len, reverse=True)
+        self._hits: Dict[str, FrozenSet[int]] = {
+            p: frozenset().union(*(owners[q] for q in patterns if p.startswith(q)))
+            for p in patterns
+        }
+        self._search = re.compile("|".join(re.escape(p) for p in patterns)).search if patterns else None
+
+        self._cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[Rule, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _scan(self, text: str) -> Tuple[Rule, ...]:
+        if self._search is None:
+            return ()
+        found = set()
+        pos = 0
+        search = self._search
+        while True:
+            m = search(text, pos)
+            if m is None:
+                break
+            found |= self._hits[m.group()]
+            pos = m.start() + 1
+        return tuple(self.rules[i] for i in sorted(found))
+
+    def match(self, text: str) -> Tuple[Rule, ...]:
+        """Return every rule with a pattern occurring in `text` (table order)."""
+        text = text.lower()
+        with self._lock:
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                return cached
+
+        matched = self._scan(text)
+        if self._cache_size:
+            with self._lock:
+                self._cache[text] = matched
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return matched
+
+
+def verdict(matches: Iterable[Rule]) -> Rule:
+    """Highest-scoring verdict rule among `matches` (ties: table order)."""
+    best = DEFAULT_VERDICT
+    for rule in matches:
+        if rule.kind == "verdict" and rule.score > best.score:
+            best = rule
+    return best
+
+
+def ttps_of(matches: Iterable[Rule]) -> List[str]:
+    return [rule.ttp for rule in matches if rule.kind == "ttp"]
+
+
+command_engine = RuleEngine(COMMAND_RULES)
+web_engine = RuleEngine(WEB_RULES)
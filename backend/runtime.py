@@ -0,0 +1,161 @@
+"""
+runtime.py — Event Loop, Listen Backlogs and Startup Pre-Warming
+
+Every honeypot here (asyncssh, the raw asyncio.Protocol fake services,
+FastAPI) is bound to the event loop, so the loop and the listening sockets
+set the ceiling on how fast connections are accepted. HONEYPOT_RUNTIME picks:
+
+    default       the stock asyncio loop and listen backlogs, as before
+    performance   uvloop (when installed; `pip install uvloop`, not available
+                  on Windows), deep listen backlogs for the SSH and fake
+                  service listeners and the API, and pre-warming: host keys,
+                  rule tables and both DB pools are made ready before any
+                  listener accepts a connection, so the first attackers do not
+                  pay for lazy initialisation
+
+`python -m backend.runtime` serves the single-process app with these settings
+(plain `uvicorn backend.main:app` keeps uvicorn's own loop choice);
+`python -m backend.cluster` applies them to every process it starts.
+benchmark_connections.py compares connections/sec in both modes.
+
+Tuning (environment variables):
+    HONEYPOT_RUNTIME   "default" or "performance"
+    LISTEN_BACKLOG     listen() backlog of the honeypot listeners
+                       (default 100, or 4096 in performance mode; the kernel
+                       caps it at net.core.somaxconn)
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from typing import Dict, Iterable
+
+RUNTIME_MODE = os.getenv("HONEYPOT_RUNTIME", "default").lower()
+if RUNTIME_MODE not in ("default", "performance"):
+    raise ValueError(f"Unknown HONEYPOT_RUNTIME {RUNTIME_MODE!r}. Options: ['default', 'performance']")
+PERFORMANCE = RUNTIME_MODE == "performance"
+
+LISTEN_BACKLOG = int(os.getenv("LISTEN_BACKLOG", "4096" if PERFORMANCE else "100"))
+
+try:
+    import uvloop
+except ImportError:  # optional; Windows has no uvloop
+    uvloop = None
+
+USE_UVLOOP = PERFORMANCE and uvloop is not None
+
+# Step name → seconds, filled in by prewarm() and host_keys.py
+startup_metrics: Dict[str, float] = {}
+
+
+def install_event_loop():
+    """Make new event loops uvloop loops in performance mode. Call before asyncio.run()."""
+    if USE_UVLOOP:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    elif PERFORMANCE:
+        print("[Runtime] uvloop is not installed; performance mode continues on the asyncio loop.")
+
+
+def uvicorn_args() -> list:
+    """Command-line options that give a uvicorn process the same runtime settings."""
+    if not PERFORMANCE:
+        return []
+    return ["--loop", "uvloop" if USE_UVLOOP else "asyncio", "--backlog", str(max(LISTEN_BACKLOG, 2048))]
+
+
+def info() -> dict:
+    loop = asyncio.get_running_loop()
+    return {
+        "mode": RUNTIME_MODE,
+        "event_loop": f"{type(loop).__module__}.{type(loop).__name__}",
+        "uvloop_installed": uvloop is not None,
+        "listen_backlog": LISTEN_BACKLOG,
+        "startup": dict(startup_metrics),
+    }
+
+
+# ─── Pre-warming ─────────────────────────────────────────────────────────────
+
+def _warm_rules():
+    from .rules import command_engine, web_engine
+    from .techniques import KNOWN_NAMES, canonical, label
+
+    for engine in (command_engine, web_engine):
+        engine.match("warmup")
+    for technique_id, name in KNOWN_NAMES.items():
+        canonical(label(technique_id, name))
+
+
+def _warm_sync_pool():
+    from .database import POOL_SIZE, engine
+
+    conns = [engine.connect() for _ in range(POOL_SIZE)]
+    try:
+        for conn in conns:
+            conn.exec_driver_sql("SELECT 1")
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+async def _warm_async_pool():
+    from .database import POOL_SIZE, async_engine
+
+    conns = await asyncio.gather(*(async_engine.connect().start() for _ in range(POOL_SIZE)))
+    try:
+        await asyncio.gather(*(conn.exec_driver_sql("SELECT 1") for conn in conns))
+    finally:
+        await asyncio.gather(*(conn.close() for conn in conns))
+
+
+async def _warm_host_keys():
+    from .host_keys import host_keys
+
+    await host_keys.load()
+
+
+async def _timed(step: str, coro):
+    started = time.perf_counter()
+    await coro
+    startup_metrics[f"prewarm.{step}_s"] = round(time.perf_counter() - started, 4)
+
+
+async def prewarm(steps: Iterable[str] = ("host_keys", "rules", "db")):
+    """
+    Run the given warm-up steps concurrently before listeners start (performance
+    mode only). Steps: host_keys, rules, db (fills the sync and async pools).
+    """
+    if not PERFORMANCE:
+        return
+    jobs = {
+        "host_keys": _warm_host_keys,
+        "rules": lambda: asyncio.to_thread(_warm_rules),
+        "db": lambda: asyncio.gather(asyncio.to_thread(_warm_sync_pool), _warm_async_pool()),
+    }
+    started = time.perf_counter()
+    await asyncio.gather(*(_timed(step, jobs[step]()) for step in steps))
+    startup_metrics["prewarm_s"] = round(time.perf_counter() - started, 4)
+    print(f"[Runtime] Pre-warmed {', '.join(steps)} in {startup_metrics['prewarm_s'] * 1000:.0f} ms")
+
+
+def main_():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    install_event_loop()
+    if PERFORMANCE:
+        uvicorn.run(
+            "backend.main:app", host=args.host, port=args.port,
+            loop="uvloop" if USE_UVLOOP else "asyncio", backlog=max(LISTEN_BACKLOG, 2048),
+        )
+    else:
+        uvicorn.run("backend.main:app", host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,140 @@
+"""
+shard_stats.py — Listener Shards and Their Health / Throughput Counters
+
+In multi-process mode (cluster.py) the SSH and fake-service roles can run as
+LISTENER_SHARDS processes each. Every shard binds the same ports with
+SO_REUSEPORT and the kernel spreads incoming connections across them, so
+handshakes (SSH key exchange above all) are no longer capped by one event
+loop.
+
+Each listener in a process counts its connections, open connections, bytes
+received and events. A shard publishes `shard_report()` as broker state every
+SHARD_REPORT_INTERVAL_S; the API marks a shard unhealthy when its report is
+older than three intervals (process gone or loop stuck). In single-process
+mode the one local "shard" is reported directly.
+
+Tuning (environment variables):
+    LISTENER_SHARDS           processes per listener role (default 1; needs SO_REUSEPORT)
+    SHARD_REPORT_INTERVAL_S   seconds between shard reports (default 5)
+    LISTENER_SHARD            this process's shard number (set by the supervisor)
+"""
+
+import os
+import socket
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .runtime import startup_metrics
+
+LISTENER_SHARDS = max(1, int(os.getenv("LISTENER_SHARDS", "1")))
+LISTENER_SHARD = int(os.getenv("LISTENER_SHARD", "0"))
+SHARD_REPORT_INTERVAL_S = float(os.getenv("SHARD_REPORT_INTERVAL_S", "5"))
+
+REUSE_PORT_SUPPORTED = hasattr(socket, "SO_REUSEPORT")
+# Sharded listeners share their ports; a lone listener binds exclusively as before
+REUSE_PORT = LISTENER_SHARDS > 1 and REUSE_PORT_SUPPORTED
+
+_RATE_MIN_WINDOW_S = 1.0
+
+
+class ListenerStats:
+    """Connection and throughput counters of one listener in this process."""
+
+    def __init__(self, name: str, port: int):
+        self.name = name
+        self.port = port
+        self.listening = True
+        self.started_at = time.time()
+        self.last_connection_at: Optional[float] = None
+        self.counters = {"connections": 0, "active": 0, "bytes_in": 0, "events": 0}
+        self._window = (time.monotonic(), 0, 0)  # (at, connections, bytes_in) for rates
+        self._rates = {"connections_per_s": 0.0, "bytes_in_per_s": 0.0}
+
+    def opened(self):
+        self.counters["connections"] += 1
+        self.counters["active"] += 1
+        self.last_connection_at = time.time()
+
+    def closed(self):
+        self.counters["active"] = max(0, self.counters["active"] - 1)
+
+    def received(self, nbytes: int):
+        self.counters["bytes_in"] += nbytes
+
+    def event(self):
+        self.counters["events"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        at, connections, bytes_in = self._window
+        elapsed = now - at
+        if elapsed >= _RATE_MIN_WINDOW_S:
+            self._rates = {
+                "connections_per_s": round((self.counters["connections"] - connections) / elapsed, 2),
+                "bytes_in_per_s": round((self.counters["bytes_in"] - bytes_in) / elapsed, 1),
+            }
+            self._window = (now, self.counters["connections"], self.counters["bytes_in"])
+        return {
+            "name": self.name,
+            "port": self.port,
+            "listening": self.listening,
+            "started_at": self.started_at,
+            "last_connection_at": self.last_connection_at,
+            **self.counters,
+            **self._rates,
+        }
+
+
+# Listeners of this process, by name ("ssh", "mysql", ...)
+listeners: Dict[str, ListenerStats] = {}
+
+
+# Extra per-process sections of the shard report (e.g. "shell" session memory)
+report_extras: Dict[str, Callable[[], Any]] = {}
+
+
+def register_listener(name: str, port: int) -> ListenerStats:
+    """Counters for a listener that is (re)starting; totals survive a restart."""
+    stats = listeners.get(name)
+    if stats is None or stats.port != port:
+        stats = listeners[name] = ListenerStats(name, port)
+    stats.listening = True
+    return stats
+
+
+def shard_report() -> Dict[str, Any]:
+    return {
+        "shard": LISTENER_SHARD,
+        "pid": os.getpid(),
+        "reuse_port": REUSE_PORT,
+        "reported_at": time.time(),
+        "listeners": [stats.snapshot() for stats in listeners.values()],
+        "startup": dict(startup_metrics),
+        **{name: collect() for name, collect in report_extras.items()},
+    }
+
+
+def shard_state_key(role: str) -> str:
+    return f"shards.{role}.{LISTENER_SHARD}"
+
+
+def collect_shards(state: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Shard reports with a `healthy` flag: from broker state in multi-process
+    mode, or this process's own listeners when `state` is None.
+    """
+    if state is None:
+        return [{"role": "local", "healthy": True, **shard_report()}]
+    now = time.time()
+    shards = []
+    for key, report in sorted(state.items()):
+        if not key.startswith("shards.") or not report:
+            continue
+        age = now - report.get("reported_at", 0)
+        shards.append({
+            "role": key.split(".")[1],
+            "healthy": age <= 3 * SHARD_REPORT_INTERVAL_S,
+            "report_age_s": round(age, 1),
+            **report,
+        })
+    return shards
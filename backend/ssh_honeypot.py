@@ -1,224 +1,299 @@
 import asyncio
 import asyncssh
-import sys
-import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from .database import SessionLocal
-from .models import Attacker, HoneypotCommand, Credential, ThreatReport
 from .ai_analyzer import classify_command
+from .fake_shell import _HISTORY_LINE_MAX, NoSpace, ShellSession, shell_sessions
+from .ingestion import ingestor, CommandEvent, LoginEvent, SshConnectionEvent, SshSessionEvent
+from .pseudonyms import geo_for, recorded_ip
+from .host_keys import host_keys
+from .runtime import LISTEN_BACKLOG
+from .shard_stats import REUSE_PORT, register_listener, report_extras
+from .ssh_telemetry import ConnectionTelemetry
+from .transcripts import transcript_writer
 from .websocket_manager import manager
-import random
+import time
+import uuid
 from datetime import datetime
 
-SAMPLE_LOCATIONS = [
-    {"country": "China", "city": "Beijing", "lat": 39.9042, "lon": 116.4074},
-    {"country": "Russia", "city": "Moscow", "lat": 55.7558, "lon": 37.6173},
-    {"country": "North Korea", "city": "Pyongyang", "lat": 39.0392, "lon": 125.7625},
-    {"country": "Brazil", "city": "Sao Paulo", "lat": -23.5505, "lon": -46.6333},
-    {"country": "Iran", "city": "Tehran", "lat": 35.6892, "lon": 51.3890},
-    {"country": "USA", "city": "New York", "lat": 40.7128, "lon": -74.0060},
-    {"country": "Germany", "city": "Berlin", "lat": 52.5200, "lon": 13.4050},
-    {"country": "Ukraine", "city": "Kyiv", "lat": 50.4501, "lon": 30.5234},
-]
-
-def get_fake_ip(real_ip, port):
-    if real_ip not in ['127.0.0.1', '::1', 'localhost']:
-        return real_ip
-    # Deterministic fake IP based on port so it stays consistent for the session
-    random.seed(port)
-    ip = f"{random.randint(1, 220)}.{random.randint(1, 255)}.{random.randint(1, 255)}.{random.randint(1, 255)}"
-    random.seed() # Reset
-    return ip
-
-def get_geoip(ip):
-    # Mock GeoIP - Consistent for same IP
-    random.seed(ip) 
-    loc = random.choice(SAMPLE_LOCATIONS)
-    random.seed()
-    return loc
-
-class FakeShell(asyncssh.SSHServerProcess):
-    def __init__(self, process):
-        self._process = process
-        # Manually call connection_made since it seems asyncssh isn't calling it or we missed it
-        self.connection_made(process)
+SSH_PORT = 2222
+# Connection counters of this process's SSH listener (one shard when sharded)
+_stats = register_listener("ssh", SSH_PORT)
+report_extras["shell"] = shell_sessions.info
+report_extras["transcripts"] = transcript_writer.info
 
-    def connection_made(self, process):
+class FakeShell:
+    """
+    One SSH session: an interactive bash look-alike (fake_shell.py) that keeps
+    its state until the attacker exits, or a single exec-request command.
+    Everything typed and printed is recorded to the session's transcript
+    (transcripts.py).
+    """
+
+    def __init__(self, process):
         self._process = process
+        peer = process.get_extra_info('peername')
+        self.real_ip = peer[0]
+        self.client_ip = recorded_ip(peer[0])
+        self.username = process.get_extra_info('username') or "root"
+        self.session = ShellSession(user=self.username)
+        self.session_id = uuid.uuid4().hex
+        self.recorder = transcript_writer.open(self.session_id)
+        self.term_type = process.get_terminal_type()
+        self.term_size = None
+        if self.term_type:
+            cols, rows = process.get_terminal_size()[:2]
+            self.term_size = f"{cols}x{rows}"
+            self.recorder.resize(cols, rows)
+        self.commands = 0
+        # Input read from the channel but not consumed by _readline() yet
         self._input = ""
-        
-        # Check if this is an exec request (e.g. ssh user@host command)
-        command = None
-        # Try different ways to get command depending on asyncssh version
-        if hasattr(process, 'get_command'):
-            command = process.get_command()
-        elif hasattr(process, 'command'):
-            command = process.command
-        else:
-            command = process.get_extra_info('command')
-            
-        # print(f"DEBUG: connection_made. Command: '{command}'")
-        if command:
-            asyncio.create_task(self.handle_command(command))
+        self._pos = 0
+        self._prev = ""
+        self._escape = None
+
+    async def run(self):
+        started = time.monotonic()
+        await self._session_event()
+        try:
+            await self._run()
+        finally:
+            self.recorder.close(self.session.status)
+            await self._session_event(ended=True, duration_s=time.monotonic() - started)
+        self._process.exit(self.session.status)
+
+    async def _run(self):
+        # Exec request (e.g. ssh user@host command): run it and report its status
+        if self._process.command:
+            self.recorder.input(self._process.command + "\n")
+            await self.execute(self._process.command)
             return
 
-        self._process.write("Welcome to Ubuntu 22.04 LTS (GNU/Linux 5.15.0-91-generic x86_64)\n\n")
-        self._process.write(" * Documentation:  https://help.ubuntu.com\n")
-        self._process.write(" * Management:     https://landscape.canonical.com\n")
-        self._process.write(" * Support:        https://ubuntu.com/advantage\n\n")
-        self._process.write("Last login: " + datetime.now().strftime("%a %b %d %H:%M:%S") + " from 192.168.1.5\n")
-        self._process.write("$ ")
+        self._write("Welcome to Ubuntu 22.04 LTS (GNU/Linux 5.15.0-91-generic x86_64)\n\n")
+        self._write(" * Documentation:  https://help.ubuntu.com\n")
+        self._write(" * Management:     https://landscape.canonical.com\n")
+        self._write(" * Support:        https://ubuntu.com/advantage\n\n")
+        self._write("Last login: " + datetime.now().strftime("%a %b %d %H:%M:%S") + " from 192.168.1.5\n")
 
-    def data_received(self, data, datatype):
-        self._input += data
-        
-        # Simple line buffering
-        while '\n' in self._input:
-            cmd, self._input = self._input.split('\n', 1)
-            cmd = cmd.strip()
-            
-            if cmd:
-                # Echo the newline
-                self._process.write('\n')
-                asyncio.create_task(self.handle_command(cmd))
-                self._process.write("$ ")
+        while not self.session.exited:
+            self._write(self.session.prompt())
+            try:
+                line = await self._readline()
+            except (asyncssh.DisconnectError, asyncssh.ConnectionLost, BrokenPipeError):
+                break
+            if line is None:
+                break  # EOF (Ctrl+D or the client went away)
+            if line.strip():
+                await self.execute(line.strip())
 
-    def connection_lost(self, exc):
-        print(f"DEBUG: FakeShell connection lost: {exc}")
+    def _write(self, text: str):
+        if self.term_type:
+            text = text.replace("\r\n", "\n").replace("\n", "\r\n")
+        self.recorder.output(text)
+        self._process.stdout.write(text)
+
+    async def _read(self):
+        """The next chunk of raw input, recorded as typed; None at EOF."""
+        while True:
+            try:
+                data = await self._process.stdin.read(4096)
+            except asyncssh.TerminalSizeChanged as e:
+                self.recorder.resize(e.width, e.height)
+                continue
+            except (asyncssh.BreakReceived, asyncssh.SignalReceived):
+                continue
+            if data:
+                self.recorder.input(data)
+            return data or None
+
+    async def _readline(self):
+        """
+        One line of input, echoed and edited like a terminal in canonical
+        mode: asyncssh's line editor is off so the raw keystrokes reach the
+        transcript. None at EOF. The line is capped at _HISTORY_LINE_MAX
+        characters (the rest is dropped, like a full tty buffer) and counts
+        toward the session budget while it is being typed.
+        """
+        line, echo = [], []
+        budget = self.session.budget
+        try:
+            return await self._edit_line(line, echo, budget)
+        finally:
+            budget.charge(-len(line))
+
+    async def _edit_line(self, line, echo, budget):
+        """_readline's loop; `line` holds exactly the characters charged to `budget`."""
+        while True:
+            if self._pos >= len(self._input):
+                if echo and self.term_type:
+                    self._write("".join(echo))
+                    echo = []
+                data = await self._read()
+                if data is None:
+                    return None
+                self._input, self._pos = data, 0
+            ch = self._input[self._pos]
+            self._pos += 1
+            prev, self._prev = self._prev, ch
 
-    async def handle_command(self, cmd):
-        peer = self._process.get_extra_info('peername')
-        client_ip = get_fake_ip(peer[0], peer[1])
-        print(f"Command from {client_ip} (Real: {peer[0]}): {cmd}") 
+            if self._escape is not None:
+                # Drop escape sequences (arrow keys, function keys) up to their final byte
+                if self._escape == "" and ch in "[O":
+                    self._escape = ch
+                elif self._escape == "" or ch.isalpha() or ch == "~":
+                    self._escape = None
+                continue
+            if ch == "\x1b":
+                self._escape = ""
+            elif ch == "\n" and prev == "\r":
+                continue
+            elif ch in "\r\n":
+                echo.append("\n")
+                break
+            elif ch in "\x7f\x08":
+                if line:
+                    line.pop()
+                    budget.charge(-1)
+                    echo.append("\b \b")
+            elif ch == "\x03":
+                echo.append("^C\n")
+                budget.charge(-len(line))
+                line.clear()
+                self.session.status = 130
+                break
+            elif ch == "\x04":
+                if not line:
+                    return None
+            elif ch == "\x15":
+                echo.append("\b \b" * len(line))
+                budget.charge(-len(line))
+                line.clear()
+            elif ch >= " " and len(line) < _HISTORY_LINE_MAX:
+                try:
+                    budget.charge(1)
+                except NoSpace:
+                    continue
+                line.append(ch)
+                echo.append(ch)
+        if self.term_type:
+            self._write("".join(echo))
+        return "".join(line)
 
-        # Mock Output for common commands
-        if cmd.strip() == "whoami":
-            self._process.stdout.write("root\n")
-        elif cmd.strip() == "pwd":
-            self._process.stdout.write("/root\n")
-        elif cmd.strip() == "ls":
-            self._process.stdout.write("botnet.sh  passwords.txt\n")
+    async def _session_event(self, ended: bool = False, duration_s: float = 0.0):
+        try:
+            await ingestor.put(SshSessionEvent(
+                ip=self.client_ip,
+                session_id=self.session_id,
+                username=self.username,
+                term_type=self.term_type,
+                term_size=self.term_size,
+                transcript_path=self.recorder.path,
+                ended=ended,
+                duration_s=duration_s,
+                commands=self.commands,
+                bytes_in=self.recorder.bytes_in,
+                bytes_out=self.recorder.bytes_out,
+                transcript_bytes=self.recorder.recorded,
+                exit_status=self.session.status if ended else None,
+                geo=geo_for(self.client_ip),
+            ))
+        except Exception as e:
+            print(f"Error logging session: {e}")
 
+    async def execute(self, cmd):
+        _stats.event()
+        self.commands += 1
+        print(f"Command from {self.client_ip} (Real: {self.real_ip}): {cmd}")
+        try:
+            output = self.session.run(cmd)
+        except Exception as e:
+            # A fake-shell bug must not end the session; look like a crashed binary instead
+            print(f"Error running command: {e!r}")
+            self.session.status = 139
+            output = "Segmentation fault (core dumped)\n"
+        self._write(output)
 
-        # Database Logging
-        db = SessionLocal()
         try:
-            # Upsert Attacker
-            attacker = db.query(Attacker).filter(Attacker.ip_address == client_ip).first()
-            if not attacker:
-                geo = get_geoip(client_ip)
-                attacker = Attacker(
-                    ip_address=client_ip,
-                    city=geo['city'],
-                    country=geo['country'],
-                    latitude=geo['lat'],
-                    longitude=geo['lon']
-                )
-                db.add(attacker)
-                db.commit()
-                db.refresh(attacker)
-            
             # Instant rule-based analysis — Gemini is reserved for report generation only
             analysis = classify_command(cmd)
-            risk_score = analysis.get("score", 0)
-            ttp_tag = analysis.get("ttp", "")
 
-            # Log Command with severity and TTP
-            h_cmd = HoneypotCommand(
-                attacker_id=attacker.id,
+            # Persisted asynchronously by the batched ingestion writer
+            await ingestor.put(CommandEvent(
+                ip=self.client_ip,
                 command=cmd,
-                severity=analysis.get("severity", "LOW"),
-                ttp=ttp_tag
-            )
-            db.add(h_cmd)
-
-            # Update Risk Score
-            if risk_score > attacker.risk_score:
-                attacker.risk_score = risk_score
-
-            # Merge TTP tag onto attacker
-            if ttp_tag:
-                existing_ttps = set(filter(None, (attacker.ttp_tags or "").split(",")))
-                existing_ttps.add(ttp_tag)
-                attacker.ttp_tags = ",".join(sorted(existing_ttps))
-
-            # Create Threat Report if high risk
-            if risk_score > 50:
-                report = ThreatReport(
-                    attacker_id=attacker.id,
-                    severity=analysis.get("severity", "MEDIUM"),
-                    description=analysis.get("description", "Suspicious command"),
-                    recommended_action=analysis.get("action", "Monitor"),
-                    service_type="ssh"
-                )
-                db.add(report)
-
-            attacker.last_seen = datetime.utcnow()
-            db.commit()
+                analysis=analysis,
+                geo=geo_for(self.client_ip)
+            ))
 
             # Realtime Notification
             if manager:
-                await manager.broadcast_json({
+                manager.publish({
                     "type": "command",
-                    "ip": client_ip,
+                    "ip": self.client_ip,
                     "command": cmd,
                     "analysis": analysis
                 })
 
         except Exception as e:
             print(f"Error handling command: {e}")
-        finally:
-            db.close()
-            # CRITICAL FIX: Close the process after command execution
-            await asyncio.sleep(0.1) # Brief pause to ensure flush
-            # print(f"DEBUG: Exiting process for {cmd}")
-            self._process.stdout.close()
-            self._process.exit(0)
+
+
+async def run_fake_shell(process):
+    await FakeShell(process).run()
 
 class MySSHServer(asyncssh.SSHServer):
     def __init__(self):
-        pass
+        # Banner, offered algorithms and auth order of this connection (ssh_telemetry.py)
+        self._telemetry = ConnectionTelemetry()
 
     def connection_made(self, conn):
         self._conn = conn
+        self._peer = conn.get_extra_info('peername')
+        _stats.opened()
         print(f"SSH Connection from {conn.get_extra_info('peername')[0]}")
 
     def connection_lost(self, exc):
+        _stats.closed()
         print(f"DEBUG: MySSHServer Connection lost: {exc}")
+        event = SshConnectionEvent(ip=recorded_ip(self._peer[0]), **self._telemetry.fields(self._conn))
+        asyncio.create_task(ingestor.put(event))
+
+    def begin_auth(self, username):
+        self._telemetry.handshake_done(self._conn)
+        return True
+
+    def auth_completed(self):
+        self._telemetry.authenticated = True
+
+    def public_key_auth_supported(self):
+        # Offered like OpenSSH so clients reveal their keys; every key is refused
+        return True
+
+    def validate_public_key(self, username, key):
+        self._telemetry.auth_attempt("publickey", key.get_fingerprint())
+        return False
 
     def password_auth_supported(self):
         return True
 
     async def validate_password(self, username, password):
-        peer = self._conn.get_extra_info('peername')
-        client_ip = get_fake_ip(peer[0], peer[1])
+        self._telemetry.auth_attempt("password")
+        client_ip = recorded_ip(self._peer[0])
         print(f"Login attempt: {username}:{password} from {client_ip}")
         
         # Log Credentials
-        db = SessionLocal()
         try:
-            attacker = db.query(Attacker).filter(Attacker.ip_address == client_ip).first()
-            if not attacker:
-                geo = get_geoip(client_ip)
-                attacker = Attacker(
-                    ip_address=client_ip,
-                    city=geo['city'],
-                    country=geo['country'],
-                    latitude=geo['lat'],
-                    longitude=geo['lon']
-                )
-                db.add(attacker)
-                db.commit()
-                db.refresh(attacker)
-            
-            cred = Credential(attacker_id=attacker.id, username=username, password=password, source="ssh")
-            db.add(cred)
-            db.commit()
-            
+            await ingestor.put(LoginEvent(
+                ip=client_ip,
+                username=username,
+                password=password,
+                source="ssh",
+                geo=geo_for(client_ip)
+            ))
+
             if manager:
-                await manager.broadcast_json({
+                manager.publish({
                     "type": "login",
                     "ip": client_ip,
                     "username": username,
@@ -227,21 +302,18 @@ class MySSHServer(asyncssh.SSHServer):
                 })
         except Exception as e:
             print(f"Error logging creds: {e}")
-        finally:
-            db.close()
 
         return True # Accept ALL passwords
 
 async def start_ssh_server():
-    # Generate host key if it doesn't exist
-    if not os.path.exists('ssh_host_key'):
-        print("Generating new SSH host key...")
-        key = asyncssh.generate_private_key('ssh-rsa')
-        key.write_private_key('ssh_host_key')
-
-    print("Starting SSH Honeypot on port 2222...")
-    return await asyncssh.create_server(MySSHServer, '', 2222, server_host_keys=['ssh_host_key'], process_factory=FakeShell)
-
-def generate_host_key():
-    # Helper to generate a key file if needed
-    pass
+    # ed25519, ecdsa and rsa like a stock OpenSSH server, generated off-loop if missing
+    keys = await host_keys.load()
+    transcript_writer.start()
+    _stats.listening = True
+    print(f"Starting SSH Honeypot on port {SSH_PORT}...")
+    # Sharded SSH processes all bind the port; the kernel balances connections between them.
+    # No line editor: FakeShell echoes input itself so transcripts get the raw keystrokes.
+    return await asyncssh.create_server(
+        MySSHServer, '', SSH_PORT, server_host_keys=keys, process_factory=run_fake_shell,
+        line_editor=False, reuse_port=REUSE_PORT, backlog=LISTEN_BACKLOG,
+    )
@@ -0,0 +1,193 @@
+"""
+ssh_telemetry.py — SSH Client Fingerprints (HASSH) and Connection Facts
+
+Bots are rented, rotated and NATed, so their IPs say little about who runs
+them; the SSH library they are built on says more. Every SSH client sends its
+version banner and a KEXINIT message listing the algorithms it supports, in
+its own preference order, before authentication starts. The honeypot already
+receives both during the handshake, so recording them costs no extra round
+trips: the banner comes from asyncssh's connection info and the client's
+KEXINIT from the copy asyncssh keeps for the exchange hash. That copy is a
+private attribute (`_client_kexinit`), so requirements.txt pins the asyncssh
+version it was tested with, and a missing attribute is logged once instead of
+silently storing connections without a HASSH.
+
+Per connection this records the banner, the offered key exchange, host key,
+cipher, MAC and compression lists, the negotiated cipher and MAC, the
+handshake time, the auth methods in the order the client tried them, the
+fingerprints of offered public keys, and whether auth succeeded. The HASSH
+fingerprint (https://github.com/salesforce/hassh) is the MD5 of the client's
+
+    kex algorithms;ciphers;macs;compression
+
+so one tool version gives one fingerprint from any IP. The ingestion writer
+stores one SshConnection row per connection and keeps SshFingerprint, a
+per-HASSH rollup, up to date, so grouping a fleet by tooling is a read of a
+small table.
+
+Tuning (environment variables):
+    SSH_TELEMETRY_MAX_KEYS   public key fingerprints kept per connection (default 10)
+"""
+
+import hashlib
+import os
+import struct
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import asyncssh
+from sqlalchemy import case
+
+from .database import dialect_insert
+from .models import SshFingerprint
+
+SSH_TELEMETRY_MAX_KEYS = int(os.getenv("SSH_TELEMETRY_MAX_KEYS", "10"))
+
+_MSG_KEXINIT = 20
+_KEXINIT_ATTR = "_client_kexinit"
+_kexinit_missing_logged = False
+_COOKIE_BYTES = 16
+# Name-lists of a KEXINIT, in wire order
+_KEXINIT_LISTS = (
+    "kex_algorithms", "host_key_algorithms",
+    "ciphers", "ciphers_s2c", "macs", "macs_s2c",
+    "compression", "compression_s2c", "languages", "languages_s2c",
+)
+
+
+def parse_kexinit(payload: bytes) -> Optional[Dict[str, str]]:
+    """The name-lists of a raw KEXINIT message (client→server lists under the plain names)."""
+    if not payload or payload[0] != _MSG_KEXINIT:
+        return None
+    pos = 1 + _COOKIE_BYTES
+    lists = {}
+    try:
+        for name in _KEXINIT_LISTS:
+            (length,) = struct.unpack_from(">I", payload, pos)
+            pos += 4
+            if pos + length > len(payload):
+                return None
+            lists[name] = payload[pos:pos + length].decode("ascii", "replace")
+            pos += length
+    except struct.error:
+        return None
+    return lists
+
+
+def hassh(kexinit: Dict[str, str]) -> Dict[str, str]:
+    """HASSH fingerprint of a client KEXINIT and the string it hashes."""
+    algorithms = ";".join((
+        kexinit["kex_algorithms"], kexinit["ciphers"], kexinit["macs"], kexinit["compression"],
+    ))
+    return {"hassh": hashlib.md5(algorithms.encode()).hexdigest(), "hassh_algorithms": algorithms}
+
+
+class ConnectionTelemetry:
+    """What one SSH connection told us; filled in by the server callbacks."""
+
+    def __init__(self):
+        self.started_at = datetime.utcnow()
+        self._started = time.monotonic()
+        self.handshake_ms: Optional[float] = None
+        self.kexinit: Optional[Dict[str, str]] = None
+        self.auth_methods: List[str] = []
+        self.auth_attempts = 0
+        self.public_keys: List[str] = []
+        self.authenticated = False
+
+    def handshake_done(self, conn):
+        """Key exchange is over and auth begins: capture the client's KEXINIT once."""
+        if self.handshake_ms is None:
+            self.handshake_ms = round((time.monotonic() - self._started) * 1000, 1)
+        self._capture_kexinit(conn)
+
+    def _capture_kexinit(self, conn):
+        global _kexinit_missing_logged
+        if self.kexinit is not None:
+            return
+        # Kept by asyncssh for the exchange hash; a later re-key replaces it
+        payload = getattr(conn, _KEXINIT_ATTR, None)
+        if payload is None:
+            if not _kexinit_missing_logged:
+                _kexinit_missing_logged = True
+                print(f"[SSH] asyncssh {asyncssh.__version__} has no {_KEXINIT_ATTR}; "
+                      "connections are recorded without HASSH fingerprints.")
+            return
+        self.kexinit = parse_kexinit(payload)
+
+    def auth_attempt(self, method: str, public_key: Optional[str] = None):
+        self.auth_attempts += 1
+        if method not in self.auth_methods:
+            self.auth_methods.append(method)
+        if public_key and public_key not in self.public_keys and len(self.public_keys) < SSH_TELEMETRY_MAX_KEYS:
+            self.public_keys.append(public_key)
+
+    def fields(self, conn) -> Dict[str, Any]:
+        """Keyword arguments of the connection's SshConnectionEvent."""
+        self._capture_kexinit(conn)
+        kexinit = self.kexinit or {}
+        return {
+            "client_version": conn.get_extra_info("client_version"),
+            **(hassh(kexinit) if kexinit else {}),
+            "kex_algorithms": kexinit.get("kex_algorithms"),
+            "host_key_algorithms": kexinit.get("host_key_algorithms"),
+            "ciphers": kexinit.get("ciphers"),
+            "macs": kexinit.get("macs"),
+            "compression": kexinit.get("compression"),
+            "cipher": conn.get_extra_info("recv_cipher"),
+            "mac": conn.get_extra_info("recv_mac"),
+            "auth_methods": ",".join(self.auth_methods),
+            "auth_attempts": self.auth_attempts,
+            "public_keys": ",".join(self.public_keys),
+            "authenticated": self.authenticated,
+            "handshake_ms": self.handshake_ms,
+            "duration_s": round(time.monotonic() - self._started, 3),
+            "timestamp": self.started_at,
+        }
+
+
+# ─── Per-HASSH rollup ────────────────────────────────────────────────────────
+
+class FingerprintDelta:
+    """A batch's connections per HASSH, written with one upsert."""
+
+    def __init__(self):
+        self.rows: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, fingerprint: str, algorithms: str, client_version: Optional[str], timestamp: datetime):
+        row = self.rows.get(fingerprint)
+        if row is None:
+            self.rows[fingerprint] = {
+                "hassh": fingerprint, "hassh_algorithms": algorithms, "client_version": client_version,
+                "connections": 1, "first_seen": timestamp, "last_seen": timestamp,
+            }
+            return
+        row["connections"] += 1
+        row["first_seen"] = min(row["first_seen"], timestamp)
+        if timestamp >= row["last_seen"]:
+            row["last_seen"] = timestamp
+            row["client_version"] = client_version
+
+    def __bool__(self):
+        return bool(self.rows)
+
+
+def apply_fingerprint_deltas(db, delta: FingerprintDelta):
+    """Add a batch's connections to the rollup. Runs inside the caller's transaction."""
+    if not delta:
+        return
+    table = SshFingerprint.__table__.c
+    stmt = dialect_insert(db)(SshFingerprint)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["hassh"],
+        set_={
+            "connections": table.connections + excluded.connections,
+            "first_seen": case((excluded.first_seen < table.first_seen, excluded.first_seen), else_=table.first_seen),
+            "last_seen": case((excluded.last_seen > table.last_seen, excluded.last_seen), else_=table.last_seen),
+            "client_version": case((excluded.last_seen > table.last_seen, excluded.client_version),
+                                   else_=table.client_version),
+        },
+    )
+    db.execute(stmt, list(delta.rows.values()))
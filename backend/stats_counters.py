@@ -0,0 +1,162 @@
+"""
+stats_counters.py — Materialized Dashboard Counters
+
+`/api/stats` used to run five COUNT(*) scans per call. The ingestion writer
+now maintains the totals in `stat_counters`, inside the same transaction as
+the rows it inserts, so the endpoint is a single primary-key read and the
+numbers never drift from the data.
+
+The same batch also adds to per-minute and per-hour buckets in
+`stat_buckets`, so the dashboard can chart rates without touching raw tables.
+Increments are upserts (`value = value + n`), which keeps them correct with
+more than one writer.
+
+Tuning (environment variables):
+    STATS_MINUTE_RETENTION_H   hours of per-minute buckets kept (default 48)
+    STATS_HOUR_RETENTION_D     days of per-hour buckets kept    (default 90)
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from .database import dialect_insert
+from .models import (
+    Attacker, HoneypotCommand, WebAttack, Credential,
+    ServiceInteraction, StatCounter, StatBucket
+)
+
+STATS_MINUTE_RETENTION_H = int(os.getenv("STATS_MINUTE_RETENTION_H", "48"))
+STATS_HOUR_RETENTION_D = int(os.getenv("STATS_HOUR_RETENTION_D", "90"))
+
+# Counter name → table it mirrors (used for the one-time backfill)
+COUNTERS = {
+    "attackers": Attacker,
+    "commands": HoneypotCommand,
+    "web_attacks": WebAttack,
+    "credentials": Credential,
+    "service_probes": ServiceInteraction,
+}
+
+GRANULARITIES = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1)}
+
+_PRUNE_EVERY_S = 300
+_last_prune = 0.0
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(second=0, microsecond=0)
+
+
+class CounterDelta:
+    """Counter increments accumulated over an ingestion batch."""
+
+    def __init__(self):
+        self.totals: Dict[str, int] = {}
+        self.buckets: Dict[Tuple[str, str, datetime], int] = {}
+
+    def add(self, name: str, timestamp: datetime, n: int = 1):
+        self.totals[name] = self.totals.get(name, 0) + n
+        for granularity in GRANULARITIES:
+            key = (name, granularity, bucket_start(timestamp, granularity))
+            self.buckets[key] = self.buckets.get(key, 0) + n
+
+    def __bool__(self):
+        return bool(self.totals)
+
+
+def _add_rows(db, model, key_columns: Tuple[str, ...], rows: List[Dict[str, Any]]):
+    """INSERT ... ON CONFLICT DO UPDATE SET value = value + excluded.value, as one executemany."""
+    stmt = dialect_insert(db)(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key_columns),
+        set_={"value": model.__table__.c.value + stmt.excluded.value},
+    )
+    db.execute(stmt, rows)
+
+
+def apply_counter_deltas(db, delta: CounterDelta):
+    """Add a batch's increments. Runs inside the caller's transaction."""
+    if not delta:
+        return
+    _add_rows(db, StatCounter, ("name",), [
+        {"name": name, "value": n} for name, n in delta.totals.items()
+    ])
+    _add_rows(db, StatBucket, ("name", "granularity", "bucket_start"), [
+        {"name": name, "granularity": granularity, "bucket_start": start, "value": n}
+        for (name, granularity, start), n in delta.buckets.items()
+    ])
+
+    global _last_prune
+    if time.monotonic() - _last_prune > _PRUNE_EVERY_S:
+        _last_prune = time.monotonic()
+        prune_buckets(db)
+
+
+def prune_buckets(db, now: Optional[datetime] = None):
+    now = now or datetime.utcnow()
+    for granularity, keep in (
+        ("minute", timedelta(hours=STATS_MINUTE_RETENTION_H)),
+        ("hour", timedelta(days=STATS_HOUR_RETENTION_D)),
+    ):
+        db.query(StatBucket).filter(
+            StatBucket.granularity == granularity, StatBucket.bucket_start < now - keep
+        ).delete(synchronize_session=False)
+
+
+def backfill_counters(db) -> bool:
+    """Seed the totals from the raw tables once (databases that predate counters)."""
+    if db.query(StatCounter).first() is not None:
+        return False
+    for name, model in COUNTERS.items():
+        db.add(StatCounter(name=name, value=db.query(model).count()))
+    db.commit()
+    return True
+
+
+def reset_counters(db):
+    db.query(StatCounter).delete()
+    db.query(StatBucket).delete()
+    for name in COUNTERS:
+        db.add(StatCounter(name=name, value=0))
+
+
+def read_counters(db) -> Dict[str, int]:
+    totals = {name: 0 for name in COUNTERS}
+    for name, value in db.query(StatCounter.name, StatCounter.value):
+        totals[name] = value or 0
+    return totals
+
+
+def read_buckets(
+    db, granularity: str, since: datetime, names: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """Dense series from `since` to now: one count per bucket per counter."""
+    step = GRANULARITIES[granularity]
+    names = names or list(COUNTERS)
+    start = bucket_start(since, granularity)
+    end = bucket_start(datetime.utcnow(), granularity)
+
+    starts = []
+    current = start
+    while current <= end:
+        starts.append(current)
+        current += step
+    index = {s: i for i, s in enumerate(starts)}
+
+    series = {name: [0] * len(starts) for name in names}
+    for name, bucket, value in (
+        db.query(StatBucket.name, StatBucket.bucket_start, StatBucket.value)
+        .filter(
+            StatBucket.granularity == granularity,
+            StatBucket.bucket_start >= start,
+            StatBucket.name.in_(names),
+        )
+    ):
+        i = index.get(bucket)
+        if i is not None:
+            series[name][i] = value
+    return {"granularity": granularity, "buckets": starts, "series": series}
@@ -0,0 +1,313 @@
+"""
+techniques.py — Normalized MITRE ATT&CK Technique Storage
+
+Attacker techniques used to live only in `Attacker.ttp_tags`, a comma-joined
+string that every event split, unioned, sorted and rejoined, in whatever
+spelling its producer used ("T1046-MYSQL", "T1046 - Network Service Scanning
+(MySQL)"). They are now stored as:
+
+    techniques           catalog, one row per technique id (unique index)
+    attacker_techniques  attacker ↔ technique with first_seen, last_seen and
+                         the number of events tagged with it
+
+Every tag goes through `canonical()`, which maps all spellings of a technique
+to one (technique_id, name). A catalog row's id is also its bit index: the
+attacker cache holds each attacker's techniques as an int bitset, so merging
+an event's technique is a single OR, and `ttp_tags` (kept as a display copy
+for existing clients) is only re-rendered when a bit is new.
+"""
+
+import re
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from .database import dialect_insert
+from .models import Attacker, AttackerTechnique, HoneypotCommand, ServiceInteraction, Technique
+from .rules import COMMAND_RULES, DEFAULT_VERDICT, WEB_RULES
+
+_TAG = re.compile(r"^\s*(T\d{4}(?:\.\d{3})?)\b\s*[-:]?\s*(.*)$", re.IGNORECASE)
+_QUALIFIER = re.compile(r"\s*\([^)]*\)\s*$")
+
+# Techniques tagged outside the rule tables (ingestion, detect_ttps)
+_EXTRA_NAMES = {
+    "T1046": "Network Service Scanning",
+    "T1110": "Brute Force",
+}
+
+
+def _parse(tag: str) -> Optional[Tuple[str, str]]:
+    """Split a tag into (technique id, name without qualifiers); name may be empty."""
+    match = _TAG.match(tag or "")
+    if not match:
+        return None
+    name = _QUALIFIER.sub("", match.group(2)).strip()
+    # "T1046-MYSQL": a bare upper-case word after the id is a qualifier, not a name
+    if name.isupper() and " " not in name:
+        name = ""
+    return match.group(1).upper(), name
+
+
+def _known_names() -> Dict[str, str]:
+    names = dict(_EXTRA_NAMES)
+    for rule in COMMAND_RULES + WEB_RULES + (DEFAULT_VERDICT,):
+        parsed = _parse(rule.ttp)
+        if parsed and parsed[1]:
+            names.setdefault(*parsed)
+    return names
+
+
+KNOWN_NAMES = _known_names()
+
+
+@lru_cache(maxsize=1024)
+def canonical(tag: str) -> Optional[Tuple[str, str]]:
+    """
+    Map any spelling of a technique tag to (technique_id, name), e.g.
+    "T1046-MYSQL" and "T1046 - Network Service Scanning (MySQL)" both give
+    ("T1046", "Network Service Scanning"). Returns None for tags without an id.
+    """
+    parsed = _parse(tag)
+    if parsed is None:
+        return None
+    technique_id, name = parsed
+    return technique_id, KNOWN_NAMES.get(technique_id) or name or technique_id
+
+
+def label(technique_id: str, name: str) -> str:
+    return technique_id if name == technique_id else f"{technique_id} - {name}"
+
+
+# ─── Catalog ─────────────────────────────────────────────────────────────────
+
+class TechniqueCatalog:
+    """In-memory mirror of the `techniques` table: technique id ↔ bit index."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bits: Dict[str, int] = {}
+        self._labels: Dict[int, str] = {}
+        self._loaded = False
+
+    def _load(self, db):
+        for pk, technique_id, name in db.query(Technique.id, Technique.technique_id, Technique.name):
+            self._bits[technique_id] = pk
+            self._labels[pk] = label(technique_id, name)
+        self._loaded = True
+
+    def bit(self, db, tag: str) -> Optional[int]:
+        """
+        Bit index of a tag's technique, inserting it into the catalog if it is
+        new. Inserts are only flushed — the caller's transaction commits them.
+        """
+        parsed = canonical(tag)
+        if parsed is None:
+            return None
+        technique_id, name = parsed
+        pk = self._bits.get(technique_id)
+        if pk is not None:
+            return pk
+        with self._lock:
+            if not self._loaded:
+                self._load(db)
+            pk = self._bits.get(technique_id)
+            if pk is None:
+                row = Technique(technique_id=technique_id, name=name)
+                db.add(row)
+                db.flush()
+                pk = self._bits[technique_id] = row.id
+                self._labels[pk] = label(technique_id, name)
+        return pk
+
+    def bits(self, db, tags: Iterable[str]) -> int:
+        mask = 0
+        for tag in tags:
+            pk = self.bit(db, tag)
+            if pk is not None:
+                mask |= 1 << pk
+        return mask
+
+    def render(self, db, mask: int) -> str:
+        """
+        The `ttp_tags` display string for a bitset. Masks come from the
+        database, so the catalog is (re)loaded when it is empty or has not
+        seen one of the bits yet (rows added by another process).
+        """
+        bits = []
+        while mask:
+            low = mask & -mask
+            bits.append(low.bit_length() - 1)
+            mask ^= low
+        if not self._loaded or any(bit not in self._labels for bit in bits):
+            with self._lock:
+                self._load(db)
+        return ",".join(sorted(self._labels[bit] for bit in bits if bit in self._labels))
+
+    def invalidate(self):
+        """Forget everything — used after a rollback may have discarded new rows."""
+        with self._lock:
+            self._bits.clear()
+            self._labels.clear()
+            self._loaded = False
+
+
+# Singleton
+technique_catalog = TechniqueCatalog()
+
+
+# ─── Attacker ↔ technique rows ───────────────────────────────────────────────
+
+class TechniqueDelta:
+    """Per-(attacker, technique) first/last seen and counts accumulated over a batch."""
+
+    def __init__(self):
+        self.rows: Dict[Tuple[int, int], List] = {}
+
+    def add(self, attacker_id: int, bit: int, timestamp: datetime, n: int = 1):
+        self.merge(attacker_id, bit, timestamp, timestamp, n)
+
+    def merge(self, attacker_id: int, bit: int, first_seen: datetime, last_seen: datetime, n: int):
+        row = self.rows.get((attacker_id, bit))
+        if row is None:
+            self.rows[(attacker_id, bit)] = [first_seen, last_seen, n]
+            return
+        row[0] = min(row[0], first_seen)
+        row[1] = max(row[1], last_seen)
+        row[2] += n
+
+    def __bool__(self):
+        return bool(self.rows)
+
+
+def apply_technique_deltas(db, delta: TechniqueDelta):
+    """Upsert a batch's attacker↔technique rows as one executemany, in the caller's transaction."""
+    if not delta:
+        return
+    table = AttackerTechnique.__table__.c
+    stmt = dialect_insert(db)(AttackerTechnique)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["attacker_id", "technique_pk"],
+        set_={
+            "count": table.count + excluded.count,
+            "first_seen": case((excluded.first_seen < table.first_seen, excluded.first_seen), else_=table.first_seen),
+            "last_seen": case((excluded.last_seen > table.last_seen, excluded.last_seen), else_=table.last_seen),
+        },
+    )
+    db.execute(stmt, [
+        {"attacker_id": attacker_id, "technique_pk": bit, "first_seen": first, "last_seen": last, "count": n}
+        for (attacker_id, bit), (first, last, n) in delta.rows.items()
+    ])
+
+
+def merge_tags(
+    db, attacker_id: int, tags: Iterable[str], first_seen: datetime, last_seen: datetime
+) -> str:
+    """
+    Record techniques inferred outside the event stream (report generation)
+    with a count of 0 and return the attacker's re-rendered `ttp_tags`.
+    """
+    delta = TechniqueDelta()
+    for tag in tags:
+        bit = technique_catalog.bit(db, tag)
+        if bit is not None:
+            delta.merge(attacker_id, bit, first_seen, last_seen, 0)
+    apply_technique_deltas(db, delta)
+    mask = 0
+    for (bit,) in db.query(AttackerTechnique.technique_pk).filter(AttackerTechnique.attacker_id == attacker_id):
+        mask |= 1 << bit
+    return technique_catalog.render(db, mask)
+
+
+def technique_stats(db) -> List[Dict]:
+    """Catalog with how many attackers used each technique and how often."""
+    rows = db.query(
+        Technique.technique_id,
+        Technique.name,
+        func.count(AttackerTechnique.attacker_id),
+        func.coalesce(func.sum(AttackerTechnique.count), 0),
+        func.max(AttackerTechnique.last_seen),
+    ).outerjoin(
+        AttackerTechnique, AttackerTechnique.technique_pk == Technique.id
+    ).group_by(Technique.id).order_by(Technique.technique_id)
+    return [
+        {
+            "technique_id": technique_id,
+            "name": name,
+            "label": label(technique_id, name),
+            "attackers": attackers,
+            "events": events,
+            "last_seen": last_seen,
+        }
+        for technique_id, name, attackers, events, last_seen in rows
+    ]
+
+
+def find_technique(db, tag: str) -> Optional[Technique]:
+    """Catalog row for any spelling of a technique id, or None."""
+    parsed = canonical(tag)
+    if parsed is None:
+        return None
+    return db.query(Technique).filter(Technique.technique_id == parsed[0]).first()
+
+
+# ─── Backfill ────────────────────────────────────────────────────────────────
+
+def rebuild_attacker_techniques(db: Session, batch_size: int = 1000) -> int:
+    """
+    Seed the catalog and rebuild attacker_techniques from the raw event tables
+    (databases that predate it), then rewrite every `ttp_tags` in canonical
+    form. Tags with no remaining events (report-only or archived) are kept
+    with a count of 0. Returns the number of attackers rewritten.
+    """
+    for technique_id, name in KNOWN_NAMES.items():
+        technique_catalog.bit(db, label(technique_id, name))
+
+    delta = TechniqueDelta()
+    for attacker_id, ttp, n, first, last in db.query(
+        HoneypotCommand.attacker_id, HoneypotCommand.ttp, func.count(),
+        func.min(HoneypotCommand.timestamp), func.max(HoneypotCommand.timestamp),
+    ).filter(HoneypotCommand.attacker_id.isnot(None)).group_by(HoneypotCommand.attacker_id, HoneypotCommand.ttp):
+        bit = technique_catalog.bit(db, ttp or "")
+        if bit is not None:
+            delta.merge(attacker_id, bit, first, last, n)
+    probing = technique_catalog.bit(db, "T1046")
+    for attacker_id, n, first, last in db.query(
+        ServiceInteraction.attacker_id, func.count(),
+        func.min(ServiceInteraction.timestamp), func.max(ServiceInteraction.timestamp),
+    ).filter(ServiceInteraction.attacker_id.isnot(None)).group_by(ServiceInteraction.attacker_id):
+        delta.merge(attacker_id, probing, first, last, n)
+
+    masks: Dict[int, int] = {}
+    for attacker_id, bit in delta.rows:
+        masks[attacker_id] = masks.get(attacker_id, 0) | 1 << bit
+
+    rewritten = 0
+    last_id = 0
+    while True:
+        chunk = db.query(Attacker.id, Attacker.ttp_tags, Attacker.first_seen, Attacker.last_seen).filter(
+            Attacker.id > last_id
+        ).order_by(Attacker.id).limit(batch_size).all()
+        if not chunk:
+            break
+        for attacker_id, ttp_tags, first, last in chunk:
+            mask = masks.get(attacker_id, 0)
+            for tag in filter(None, (ttp_tags or "").split(",")):
+                bit = technique_catalog.bit(db, tag)
+                if bit is not None and not mask & (1 << bit):
+                    mask |= 1 << bit
+                    delta.merge(attacker_id, bit, first or last, last or first, 0)
+            rendered = technique_catalog.render(db, mask)
+            if rendered != (ttp_tags or ""):
+                db.query(Attacker).filter(Attacker.id == attacker_id).update(
+                    {"ttp_tags": rendered}, synchronize_session=False
+                )
+                rewritten += 1
+        last_id = chunk[-1][0]
+
+    apply_technique_deltas(db, delta)
+    return rewritten
@@ -0,0 +1,325 @@
+"""
+threat_intel.py — Streaming Threat-Intel Export
+
+Rows are read in chunks with `yield_per` and written out as they are read,
+so an export's memory use is bounded by the chunk size, not the database.
+Per-attacker commands, credentials and web attacks are fetched with one
+`IN (...)` query per chunk of attackers instead of lazy loads per attacker.
+
+Formats (`/api/threat-intel/export?format=...`):
+    json      one JSON document, same top-level keys as before (default)
+    json.gz   the same document, gzip-compressed on the fly
+    ndjson    one record per line, each tagged with "record_type"
+    stix      STIX 2.1 bundle: ipv4/ipv6-addr observables, indicators,
+              MITRE ATT&CK attack-patterns, "indicates" relationships and
+              threat reports as notes
+
+`since` limits the export to activity at or after a timestamp. Every
+response carries `X-Export-Timestamp` (when the export ran) and
+`X-Next-Since`, the `since` for the next incremental pull (JSON and NDJSON
+exports repeat it as "next_since"). Events are stamped when a honeypot sees
+them but committed later by the batched ingestion writer, so a row can land
+with a timestamp just before an earlier export ran. `X-Next-Since` therefore
+trails the export by EXPORT_SINCE_MARGIN_S; consecutive pulls overlap by that
+window and consumers must dedupe (STIX ids are stable across exports; other
+records by attacker IP and timestamp).
+
+Tuning (environment variables):
+    EXPORT_SINCE_MARGIN_S  how far X-Next-Since trails the export; keep it above
+                           INGEST_LINGER_MS plus the slowest batch flush and,
+                           in cluster mode, the hop to the hub  (default 60)
+"""
+
+import json
+import os
+import re
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from .database import SessionLocal
+from .models import (
+    Attacker, HoneypotCommand, Credential, WebAttack,
+    ThreatReport, ServiceInteraction, DynamicService
+)
+from .pagination import json_default
+
+EXPORT_CHUNK_ROWS = 500
+EXPORT_SINCE_MARGIN_S = float(os.getenv("EXPORT_SINCE_MARGIN_S", "60"))
+
+FORMATS = {
+    "json": ("application/json", "threat_intel_export.json"),
+    "json.gz": ("application/gzip", "threat_intel_export.json.gz"),
+    "ndjson": ("application/x-ndjson", "threat_intel_export.ndjson"),
+    "stix": ("application/stix+json;version=2.1", "threat_intel_export.stix.json"),
+}
+
+# STIX 2.1 namespace for deterministic SCO ids (spec section 2.9)
+_STIX_SCO_NAMESPACE = uuid.UUID("00abedb4-aa42-466c-9c01-fed23315a9b7")
+# Namespace for this honeypot's own SDO ids, so repeated exports update the same objects
+_HONEYPOT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "urn:cybersckute:honeypot")
+_IDENTITY_ID = f"identity--{uuid.uuid5(_HONEYPOT_NAMESPACE, 'identity')}"
+_TECHNIQUE_ID = re.compile(r"T\d{4}(?:\.\d{3})?")
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, default=json_default)
+
+
+def next_since(exported_at: datetime) -> datetime:
+    """The `since` that makes the next pull include every row committed after this export."""
+    return exported_at - timedelta(seconds=EXPORT_SINCE_MARGIN_S)
+
+
+def _since(query, column, since: Optional[datetime]):
+    return query.filter(column >= since) if since is not None else query
+
+
+# ─── Chunked Readers ─────────────────────────────────────────────────────────
+
+def _attackers(db, since: Optional[datetime]) -> Iterator[Dict[str, Any]]:
+    """Attacker records with their activity, one IN-query per chunk per child table."""
+    # last_seen order lets incremental pulls range-scan ix_attackers_last_seen
+    query = _since(db.query(Attacker), Attacker.last_seen, since).order_by(Attacker.last_seen, Attacker.id)
+    chunk: List[Attacker] = []
+    for attacker in query.yield_per(EXPORT_CHUNK_ROWS):
+        chunk.append(attacker)
+        if len(chunk) >= EXPORT_CHUNK_ROWS:
+            yield from _attacker_chunk(db, chunk, since)
+            chunk = []
+    if chunk:
+        yield from _attacker_chunk(db, chunk, since)
+
+
+def _attacker_chunk(db, chunk: List[Attacker], since: Optional[datetime]) -> Iterator[Dict[str, Any]]:
+    ids = [a.id for a in chunk]
+    commands: Dict[int, list] = {i: [] for i in ids}
+    credentials: Dict[int, list] = {i: [] for i in ids}
+    web_attacks: Dict[int, list] = {i: [] for i in ids}
+
+    for attacker_id, command in _since(
+        db.query(HoneypotCommand.attacker_id, HoneypotCommand.command)
+        .filter(HoneypotCommand.attacker_id.in_(ids)), HoneypotCommand.timestamp, since
+    ).order_by(HoneypotCommand.attacker_id, HoneypotCommand.timestamp):
+        commands[attacker_id].append(command)
+    for attacker_id, username, password, source in _since(
+        db.query(Credential.attacker_id, Credential.username, Credential.password, Credential.source)
+        .filter(Credential.attacker_id.in_(ids)), Credential.timestamp, since
+    ).order_by(Credential.attacker_id, Credential.timestamp):
+        credentials[attacker_id].append({"username": username, "password": password, "source": source})
+    for attacker_id, endpoint, payload in _since(
+        db.query(WebAttack.attacker_id, WebAttack.endpoint, WebAttack.payload)
+        .filter(WebAttack.attacker_id.in_(ids)), WebAttack.timestamp, since
+    ).order_by(WebAttack.attacker_id, WebAttack.timestamp):
+        web_attacks[attacker_id].append({"endpoint": endpoint, "payload": payload})
+
+    for a in chunk:
+        yield {
+            "ip_address": a.ip_address,
+            "location": f"{a.city}, {a.country}",
+            "risk_score": a.risk_score,
+            "ttp_tags": (a.ttp_tags or "").split(","),
+            "attacker_profile": a.attacker_profile or "",
+            "first_seen": a.first_seen,
+            "last_seen": a.last_seen,
+            "commands": commands[a.id],
+            "credentials": credentials[a.id],
+            "web_attacks": web_attacks[a.id],
+        }
+
+
+def _reports(db, since: Optional[datetime]) -> Iterator[Dict[str, Any]]:
+    query = _since(
+        db.query(ThreatReport, Attacker.ip_address).outerjoin(Attacker, ThreatReport.attacker_id == Attacker.id),
+        ThreatReport.timestamp, since,
+    ).order_by(ThreatReport.timestamp.desc())
+    for r, ip in query.yield_per(EXPORT_CHUNK_ROWS):
+        yield {
+            "id": r.id,
+            "attacker_id": r.attacker_id,
+            "attacker_ip": ip,
+            "severity": r.severity,
+            "description": r.description,
+            "recommended_action": r.recommended_action,
+            "service_type": r.service_type,
+            "full_report": json.loads(r.full_report_json or "{}"),
+            "timestamp": r.timestamp,
+        }
+
+
+def _interactions(db, since: Optional[datetime]) -> Iterator[Dict[str, Any]]:
+    query = _since(
+        db.query(ServiceInteraction, DynamicService.name)
+        .outerjoin(DynamicService, ServiceInteraction.service_id == DynamicService.id),
+        ServiceInteraction.timestamp, since,
+    ).order_by(ServiceInteraction.timestamp.desc())
+    for si, service_name in query.yield_per(EXPORT_CHUNK_ROWS):
+        yield {
+            "service": service_name or "unknown",
+            "attacker_ip": si.attacker_ip,
+            "raw_data": si.raw_data,
+            "timestamp": si.timestamp,
+        }
+
+
+# ─── Writers ─────────────────────────────────────────────────────────────────
+
+def _json_array(key: str, records: Iterator[Dict[str, Any]], counts: Dict[str, int]) -> Iterator[str]:
+    yield f', "{key}": ['
+    count = 0
+    for record in records:
+        yield ("" if count == 0 else ", ") + _dumps(record)
+        count += 1
+    yield "]"
+    counts[key] = count
+
+
+def _json_document(db, since: Optional[datetime], exported_at: datetime) -> Iterator[str]:
+    counts: Dict[str, int] = {}
+    yield "{" + (f'"export_timestamp": {_dumps(exported_at)}, "since": {_dumps(since)}, '
+                 f'"next_since": {_dumps(next_since(exported_at))}')
+    yield from _json_array("attackers", _attackers(db, since), counts)
+    yield from _json_array("threat_reports", _reports(db, since), counts)
+    yield from _json_array("service_interactions", _interactions(db, since), counts)
+    # Totals are only known once everything has been written
+    yield ', "summary": ' + _dumps({
+        "total_attackers": counts["attackers"],
+        "total_reports": counts["threat_reports"],
+        "total_service_probes": counts["service_interactions"],
+    }) + "}"
+
+
+def _ndjson(db, since: Optional[datetime], exported_at: datetime) -> Iterator[str]:
+    yield _dumps({
+        "record_type": "export", "export_timestamp": exported_at, "since": since,
+        "next_since": next_since(exported_at),
+    }) + "\n"
+    for record_type, records in (
+        ("attacker", _attackers(db, since)),
+        ("threat_report", _reports(db, since)),
+        ("service_interaction", _interactions(db, since)),
+    ):
+        for record in records:
+            yield _dumps({"record_type": record_type, **record}) + "\n"
+
+
+def _gzip(chunks: Iterator[str]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 → gzip container
+    pending = []
+    size = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            pending.append(data)
+            size += len(data)
+        if size >= 64 * 1024:
+            yield b"".join(pending)
+            pending, size = [], 0
+    pending.append(compressor.flush())
+    yield b"".join(pending)
+
+
+# ─── STIX 2.1 ────────────────────────────────────────────────────────────────
+
+def _stix_time(value: Optional[datetime]) -> str:
+    return (value or datetime.utcnow()).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def _sdo_id(kind: str, key: str) -> str:
+    return f"{kind}--{uuid.uuid5(_HONEYPOT_NAMESPACE, f'{kind}:{key}')}"
+
+
+def _stix_objects(db, since: Optional[datetime], exported_at: datetime) -> Iterator[Dict[str, Any]]:
+    now = _stix_time(exported_at)
+    common = {"spec_version": "2.1", "created_by_ref": _IDENTITY_ID}
+    yield {
+        "type": "identity", "spec_version": "2.1", "id": _IDENTITY_ID,
+        "created": now, "modified": now,
+        "name": "AI-Enhanced Honeypot & Deception System", "identity_class": "system",
+    }
+
+    seen_patterns = set()
+    for a in _attackers(db, since):
+        ip = a["ip_address"]
+        addr_type = "ipv6-addr" if ":" in ip else "ipv4-addr"
+        addr_id = f"{addr_type}--{uuid.uuid5(_STIX_SCO_NAMESPACE, json.dumps({'value': ip}, separators=(',', ':')))}"
+        yield {"type": addr_type, "spec_version": "2.1", "id": addr_id, "value": ip}
+
+        indicator_id = _sdo_id("indicator", ip)
+        yield {
+            **common, "type": "indicator", "id": indicator_id,
+            "created": _stix_time(a["first_seen"]), "modified": _stix_time(a["last_seen"]),
+            "name": f"Honeypot attacker {ip}",
+            "description": (a["attacker_profile"] or "")[:4000] or None,
+            "indicator_types": ["malicious-activity"],
+            "pattern": f"[{addr_type}:value = '{ip}']",
+            "pattern_type": "stix",
+            "valid_from": _stix_time(a["first_seen"]),
+            "confidence": min(max(a["risk_score"] or 0, 0), 100),
+            "labels": [t for t in a["ttp_tags"] if t],
+        }
+
+        for tag in a["ttp_tags"]:
+            match = _TECHNIQUE_ID.search(tag or "")
+            if not match:
+                continue
+            technique = match.group()
+            pattern_id = _sdo_id("attack-pattern", technique)
+            if technique not in seen_patterns:
+                seen_patterns.add(technique)
+                yield {
+                    **common, "type": "attack-pattern", "id": pattern_id,
+                    "created": now, "modified": now,
+                    "name": tag.split(" - ", 1)[-1] if " - " in tag else technique,
+                    "external_references": [{
+                        "source_name": "mitre-attack",
+                        "external_id": technique,
+                        "url": f"https://attack.mitre.org/techniques/{technique.replace('.', '/')}/",
+                    }],
+                }
+            yield {
+                **common, "type": "relationship", "id": _sdo_id("relationship", f"{ip}:{technique}"),
+                "created": now, "modified": now,
+                "relationship_type": "indicates",
+                "source_ref": indicator_id, "target_ref": pattern_id,
+            }
+
+    for r in _reports(db, since):
+        if not r["attacker_ip"]:
+            continue
+        yield {
+            **common, "type": "note", "id": _sdo_id("note", str(r["id"])),
+            "created": _stix_time(r["timestamp"]), "modified": _stix_time(r["timestamp"]),
+            "abstract": f"{r['severity']} — {r['service_type']}",
+            "content": f"{r['description']}\n\nRecommended action: {r['recommended_action']}",
+            "object_refs": [_sdo_id("indicator", r["attacker_ip"])],
+        }
+
+
+def _stix_bundle(db, since: Optional[datetime], exported_at: datetime) -> Iterator[str]:
+    yield '{"type": "bundle", "id": "bundle--' + str(uuid.uuid4()) + '", "objects": ['
+    first = True
+    for obj in _stix_objects(db, since, exported_at):
+        obj = {k: v for k, v in obj.items() if v is not None}
+        yield ("" if first else ", ") + _dumps(obj)
+        first = False
+    yield "]}"
+
+
+# ─── Entry Point ─────────────────────────────────────────────────────────────
+
+def export_stream(fmt: str, since: Optional[datetime], exported_at: datetime) -> Iterator:
+    """Yield the export in `fmt` chunk by chunk, reading through its own session."""
+    db = SessionLocal()
+    try:
+        if fmt == "ndjson":
+            yield from _ndjson(db, since, exported_at)
+        elif fmt == "stix":
+            yield from _stix_bundle(db, since, exported_at)
+        elif fmt == "json.gz":
+            yield from _gzip(_json_document(db, since, exported_at))
+        else:
+            yield from _json_document(db, since, exported_at)
+    finally:
+        db.close()
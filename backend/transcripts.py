@@ -0,0 +1,290 @@
+"""
+transcripts.py — Per-Session SSH Transcripts
+
+Every SSH session is recorded as one append-only transcript: the attacker's
+raw input chunks (keystrokes, pastes), everything the fake shell printed, and
+terminal size changes, each with its time offset. Only the session itself
+gets a database row (SshSession, via the ingestion pipeline); the keystrokes
+stay in the file.
+
+File layout, one file per session:
+
+    <TRANSCRIPT_DIR>/<YYYY-MM-DD>/<session_id>.hpt
+
+    header   b"HPTS" | version (u8) | session start (f64, epoch seconds)
+    body     one zlib stream of records:
+             kind (u8) | ms since the previous record (u32) | length (u32) | payload
+
+Kinds: input and output (UTF-8 text), resize (u16 cols, u16 rows) and end
+(i32 exit status). Sessions append records to an in-memory buffer; a
+background task compresses and appends them every TRANSCRIPT_FLUSH_S, or
+sooner once TRANSCRIPT_FLUSH_BYTES are pending, in a worker thread. Each
+batch ends with a zlib sync flush, so a session that is still running (or
+whose process died) can be replayed up to its last batch.
+
+`iter_records` decompresses a transcript incrementally; `replay` turns it
+into NDJSON or an asciicast v2 recording for /api/sessions/{id}/transcript.
+
+Tuning (environment variables):
+    TRANSCRIPT_DIR          transcript root                     (default ./transcripts)
+    TRANSCRIPT_FLUSH_S      seconds between batched writes      (default 1)
+    TRANSCRIPT_FLUSH_BYTES  write early once this much is queued (default 262144)
+    TRANSCRIPT_MAX_BYTES    raw bytes recorded per session;     (default 1048576)
+                            later input/output is counted, not stored
+"""
+
+import asyncio
+import json
+import os
+import struct
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+TRANSCRIPT_DIR = os.getenv("TRANSCRIPT_DIR", "./transcripts")
+TRANSCRIPT_FLUSH_S = float(os.getenv("TRANSCRIPT_FLUSH_S", "1"))
+TRANSCRIPT_FLUSH_BYTES = int(os.getenv("TRANSCRIPT_FLUSH_BYTES", str(256 * 1024)))
+TRANSCRIPT_MAX_BYTES = int(os.getenv("TRANSCRIPT_MAX_BYTES", str(1024 * 1024)))
+
+MAGIC = b"HPTS"
+VERSION = 1
+_HEADER = struct.Struct("<4sBd")
+_RECORD = struct.Struct("<BII")
+_SIZE = struct.Struct("<HH")
+_STATUS = struct.Struct("<i")
+
+INPUT, OUTPUT, RESIZE, END = 1, 2, 3, 4
+KIND_NAMES = {INPUT: "i", OUTPUT: "o", RESIZE: "r", END: "end"}
+
+_READ_CHUNK = 64 * 1024
+
+
+def transcript_file(relative_path: str) -> str:
+    """Absolute location of a transcript stored as `relative_path` in SshSession."""
+    return os.path.join(TRANSCRIPT_DIR, relative_path)
+
+
+# ─── Recording ───────────────────────────────────────────────────────────────
+
+class SessionRecorder:
+    """Records one session; all calls are cheap appends on the event loop."""
+
+    def __init__(self, writer: "TranscriptWriter", session_id: str):
+        self.session_id = session_id
+        self.started_at = time.time()
+        self.path = os.path.join(datetime.utcnow().strftime("%Y-%m-%d"), f"{session_id}.hpt")
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.recorded = 0
+        self.truncated = False
+        self.closed = False
+        self._writer = writer
+        self._last = time.monotonic()
+        # Only touched by the writer thread, one batch at a time
+        self._compressor = zlib.compressobj(6)
+        self._header_written = False
+
+    def _record(self, kind: int, payload: bytes):
+        now = time.monotonic()
+        delta_ms = min(int((now - self._last) * 1000), 0xFFFFFFFF)
+        self._last = now
+        self.recorded += len(payload)
+        self._writer.append(self, _RECORD.pack(kind, delta_ms, len(payload)) + payload)
+
+    def _data(self, kind: int, text: str):
+        payload = text.encode("utf-8", "replace")
+        if kind == INPUT:
+            self.bytes_in += len(payload)
+        else:
+            self.bytes_out += len(payload)
+        if self.closed or not payload:
+            return
+        if self.recorded + len(payload) > TRANSCRIPT_MAX_BYTES:
+            self.truncated = True
+            return
+        self._record(kind, payload)
+
+    def input(self, text: str):
+        self._data(INPUT, text)
+
+    def output(self, text: str):
+        self._data(OUTPUT, text)
+
+    def resize(self, cols: int, rows: int):
+        if not self.closed:
+            self._record(RESIZE, _SIZE.pack(min(cols, 0xFFFF), min(rows, 0xFFFF)))
+
+    def close(self, exit_status: int = 0):
+        if not self.closed:
+            self._record(END, _STATUS.pack(exit_status))
+            self.closed = True
+            self._writer.append(self, None)
+
+
+class TranscriptWriter:
+    """Buffers records of all open sessions and appends them to disk in batches."""
+
+    def __init__(self, flush_s: float = TRANSCRIPT_FLUSH_S, flush_bytes: int = TRANSCRIPT_FLUSH_BYTES):
+        self.flush_s = flush_s
+        self.flush_bytes = flush_bytes
+        # Recorder → pending record bytes (None marks the end of the session)
+        self._pending: Dict[SessionRecorder, List[Optional[bytes]]] = {}
+        self._pending_bytes = 0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Optional[asyncio.Future] = None
+        self.stats = {"sessions": 0, "open": 0, "batches": 0, "raw_bytes": 0, "written_bytes": 0, "failed": 0}
+
+    def open(self, session_id: str) -> SessionRecorder:
+        recorder = SessionRecorder(self, session_id)
+        self.stats["sessions"] += 1
+        self.stats["open"] += 1
+        return recorder
+
+    def append(self, recorder: SessionRecorder, record: Optional[bytes]):
+        self._pending.setdefault(recorder, []).append(record)
+        if record is not None:
+            self._pending_bytes += len(record)
+            if self._pending_bytes >= self.flush_bytes:
+                self._wake.set()
+
+    def info(self) -> Dict:
+        return {
+            "dir": TRANSCRIPT_DIR,
+            "pending_bytes": self._pending_bytes,
+            "flush_s": self.flush_s,
+            **self.stats,
+        }
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            print(f"[Transcripts] Recording SSH sessions to {TRANSCRIPT_DIR} (flush every {self.flush_s:g}s)")
+
+    async def stop(self):
+        """Stop the flusher and write everything still buffered."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._inflight and not self._inflight.done():
+            await asyncio.gather(self._inflight, return_exceptions=True)
+        await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending, self._pending_bytes = self._pending, {}, 0
+        # Shielded so a shutdown never leaves a half-written batch behind
+        self._inflight = asyncio.ensure_future(asyncio.to_thread(self._write, batch))
+        await asyncio.shield(self._inflight)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def _write(self, batch: Dict[SessionRecorder, List[Optional[bytes]]]):
+        """Compress and append each session's records (runs in a worker thread)."""
+        for recorder, records in batch.items():
+            finished = records[-1] is None
+            raw = b"".join(r for r in records if r is not None)
+            try:
+                out = recorder._compressor.compress(raw)
+                out += recorder._compressor.flush(zlib.Z_FINISH if finished else zlib.Z_SYNC_FLUSH)
+                path = transcript_file(recorder.path)
+                if not recorder._header_written:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    out = _HEADER.pack(MAGIC, VERSION, recorder.started_at) + out
+                    recorder._header_written = True
+                with open(path, "ab") as f:
+                    f.write(out)
+                self.stats["raw_bytes"] += len(raw)
+                self.stats["written_bytes"] += len(out)
+            except (OSError, zlib.error) as e:
+                self.stats["failed"] += 1
+                print(f"[Transcripts] Could not write {recorder.session_id}: {e}")
+            if finished:
+                self.stats["open"] -= 1
+        self.stats["batches"] += 1
+
+
+# Singleton
+transcript_writer = TranscriptWriter()
+
+
+# ─── Replay ──────────────────────────────────────────────────────────────────
+
+def iter_records(path: str) -> Iterator[Tuple[float, str, bytes]]:
+    """
+    (seconds since session start, kind, payload) for each record, decompressed
+    as the file is read. A transcript that is still being written ends at its
+    last complete record.
+    """
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        magic, version, _ = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} transcript")
+        decompressor = zlib.decompressobj()
+        buf = b""
+        elapsed_ms = 0
+        while True:
+            chunk = f.read(_READ_CHUNK)
+            if chunk:
+                buf += decompressor.decompress(chunk)
+            pos = 0
+            while len(buf) - pos >= _RECORD.size:
+                kind, delta_ms, length = _RECORD.unpack_from(buf, pos)
+                end = pos + _RECORD.size + length
+                if end > len(buf):
+                    break
+                elapsed_ms += delta_ms
+                yield elapsed_ms / 1000, KIND_NAMES.get(kind, str(kind)), buf[pos + _RECORD.size:end]
+                pos = end
+            buf = buf[pos:]
+            if not chunk or decompressor.eof:
+                return
+
+
+def read_header(path: str) -> float:
+    """Session start (epoch seconds) from a transcript's header."""
+    with open(path, "rb") as f:
+        _, _, started_at = _HEADER.unpack(f.read(_HEADER.size))
+    return started_at
+
+
+def _event_data(kind: str, payload: bytes):
+    if kind == "r":
+        cols, rows = _SIZE.unpack(payload)
+        return f"{cols}x{rows}"
+    if kind == "end":
+        return _STATUS.unpack(payload)[0]
+    return payload.decode("utf-8", "replace")
+
+
+def replay(path: str, fmt: str = "ndjson", term: Optional[str] = None,
+           size: Tuple[int, int] = (80, 24)) -> Iterator[str]:
+    """
+    Lines of a transcript for a player: NDJSON ({"t", "type", "data"} per
+    record) or asciicast v2 (header, then [t, code, data] events).
+    """
+    records = iter_records(path)
+    if fmt == "asciicast":
+        header = {"version": 2, "width": size[0], "height": size[1], "timestamp": int(read_header(path))}
+        if term:
+            header["env"] = {"TERM": term}
+        yield json.dumps(header) + "\n"
+        for t, kind, payload in records:
+            if kind != "end":
+                yield json.dumps([round(t, 3), kind, _event_data(kind, payload)]) + "\n"
+        return
+    for t, kind, payload in records:
+        yield json.dumps({"t": round(t, 3), "type": kind, "data": _event_data(kind, payload)}) + "\n"
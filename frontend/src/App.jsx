@@ -7,12 +7,21 @@ import CredentialsTable from './components/CredentialsTable';
 import ServicesPanel from './components/ServicesPanel';
 import AttackerProfile from './components/AttackerProfile';
 
+const FEED_TYPES = ['command', 'login', 'web_attack', 'service_probe'];
+// Not shown in the feed: finished report jobs, handed to the open attacker profile
+const LIVE_TYPES = [...FEED_TYPES, 'report_ready'];
+const MAX_LOGS = 500;
+const REFRESH_THROTTLE_MS = 2000;
+
 function App() {
   const [stats, setStats] = useState({ attackers: 0, commands: 0, web_attacks: 0, credentials: 0, service_probes: 0 });
   const [logs, setLogs] = useState([]);
   const [attackers, setAttackers] = useState([]);
   const [selectedAttackerIp, setSelectedAttackerIp] = useState(null);
+  const [liveConnected, setLiveConnected] = useState(false);
+  const [readyReports, setReadyReports] = useState({});
   const ws = useRef(null);
+  const refreshTimer = useRef(null);
 
   const fetchAllData = () => {
     fetch('http://localhost:8000/api/attackers')
@@ -21,31 +30,69 @@ function App() {
       .then(res => res.json()).then(data => setStats(data));
   };
 
+  // Coalesce reload requests: at most one /api refresh per REFRESH_THROTTLE_MS
+  const scheduleRefresh = () => {
+    if (refreshTimer.current) return;
+    refreshTimer.current = setTimeout(() => {
+      refreshTimer.current = null;
+      fetchAllData();
+    }, REFRESH_THROTTLE_MS);
+  };
+
   useEffect(() => {
     fetchAllData();
 
-    ws.current = new WebSocket('ws://localhost:8000/live');
+    // Batched mode: one frame per ~100 ms with the event types the dashboard uses
+    // and the counter increments for that window
+    ws.current = new WebSocket(`ws://localhost:8000/live?mode=batch&types=${LIVE_TYPES.join(',')}`);
     ws.current.onopen = () => {
+      setLiveConnected(true);
       setLogs(prev => [...prev, { ip: 'SYSTEM', message: 'CONNECTED TO SECURITY GRID', timestamp: Date.now() }]);
     };
+    // Without the socket, report jobs fall back to polling
+    ws.current.onclose = () => setLiveConnected(false);
 
     ws.current.onmessage = (event) => {
       const data = JSON.parse(event.data);
-      setLogs(prev => [...prev, { ...data, timestamp: Date.now() }]);
-
-      if (data.type === 'command') {
-        setStats(prev => ({ ...prev, commands: prev.commands + 1 }));
-      } else if (data.type === 'web_attack') {
-        setStats(prev => ({ ...prev, web_attacks: prev.web_attacks + 1 }));
-      } else if (data.type === 'service_probe') {
-        setStats(prev => ({ ...prev, service_probes: (prev.service_probes || 0) + 1 }));
-        fetchAllData();
-      } else if (data.type === 'login') {
-        fetchAllData();
+      if (data.type !== 'batch') return;
+
+      const reports = data.events.filter(e => e.type === 'report_ready');
+      if (reports.length) {
+        setReadyReports(prev => {
+          const next = { ...prev };
+          for (const r of reports) next[r.job_id] = r;
+          return next;
+        });
+        scheduleRefresh();  // a report rewrites the attacker's TTP tags
+      }
+
+      const feed = data.events.filter(e => e.type !== 'report_ready');
+      if (feed.length) {
+        const now = Date.now();
+        setLogs(prev => [...prev, ...feed.map(e => ({ ...e, timestamp: now }))].slice(-MAX_LOGS));
+      }
+
+      const delta = data.stats_delta || {};
+      if (Object.keys(delta).length) {
+        setStats(prev => {
+          const next = { ...prev };
+          for (const [key, count] of Object.entries(delta)) {
+            next[key] = (next[key] || 0) + count;
+          }
+          return next;
+        });
+      }
+
+      // New logins / probes may introduce attackers — refresh the lists once
+      if (data.events.some(e => e.type === 'login' || e.type === 'service_probe')) {
+        scheduleRefresh();
       }
     };
 
-    return () => { if (ws.current) ws.current.close(); };
+    return () => {
+      if (ws.current) ws.current.close();
+      clearTimeout(refreshTimer.current);
+    };
   }, []);
 
   const handleReset = async () => {
@@ -179,7 +226,12 @@ function App() {
 
       {/* Attacker Profile Modal */}
       {selectedAttackerIp && (
-        <AttackerProfile ip={selectedAttackerIp} onClose={() => setSelectedAttackerIp(null)} />
+        <AttackerProfile
+          ip={selectedAttackerIp}
+          onClose={() => setSelectedAttackerIp(null)}
+          liveConnected={liveConnected}
+          readyReports={readyReports}
+        />
       )}
     </div>
   );
@@ -6,10 +6,13 @@ import {
 } from 'docx';
 import { saveAs } from 'file-saver';
 
-function AttackerProfile({ ip, onClose }) {
+const JOB_POLL_MS = 1500;
+
+function AttackerProfile({ ip, onClose, liveConnected = false, readyReports = {} }) {
     const [profile, setProfile] = useState(null);
     const [loading, setLoading] = useState(false);
     const [reportGenerated, setReportGenerated] = useState(false);
+    const [jobId, setJobId] = useState(null);
 
     const fetchProfile = async () => {
         const res = await fetch(`http://localhost:8000/api/attacker/${ip}/profile`);
@@ -17,20 +20,53 @@ function AttackerProfile({ ip, onClose }) {
         setProfile(data);
     };
 
+    const finishJob = (job) => {
+        if (job.status === 'done') {
+            const data = job.result;
+            setProfile(prev => ({
+                ...prev,
+                ttp_tags: data.ttp_tags,
+                profile: data.profile_markdown,
+                threat_report: data.threat_report,
+            }));
+            setReportGenerated(true);
+        } else {
+            console.error("Report generation failed:", job.error);
+        }
+        setJobId(null);
+        setLoading(false);
+    };
+
+    const fetchJob = async (id) => {
+        const res = await fetch(`http://localhost:8000/api/reports/jobs/${id}`);
+        const job = await res.json();
+        if (job.status !== 'queued' && job.status !== 'running') finishJob(job);
+    };
+
     const generateReport = async () => {
         setLoading(true);
+        // Report generation runs as a background job; the live socket says when it is done
         const res = await fetch(`http://localhost:8000/api/attacker/${ip}/generate-report`, { method: 'POST' });
-        const data = await res.json();
-        setProfile(prev => ({
-            ...prev,
-            ttp_tags: data.ttp_tags,
-            profile: data.profile_markdown,
-            threat_report: data.threat_report,
-        }));
-        setReportGenerated(true);
-        setLoading(false);
+        const job = await res.json();
+        if (job.status === 'queued' || job.status === 'running') {
+            setJobId(job.job_id);
+        } else {
+            finishJob(job);
+        }
     };
 
+    // report_ready push for our job (it may have arrived before the POST returned)
+    React.useEffect(() => {
+        if (jobId && readyReports[jobId]) fetchJob(jobId);
+    }, [jobId, readyReports]);
+
+    // Fallback while the live socket is down: poll the job
+    React.useEffect(() => {
+        if (!jobId || liveConnected) return;
+        const timer = setInterval(() => fetchJob(jobId), JOB_POLL_MS);
+        return () => clearInterval(timer);
+    }, [jobId, liveConnected]);
+
     const downloadWord = async () => {
         const tr = profile.threat_report;
         const now = new Date().toLocaleString();
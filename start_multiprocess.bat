@@ -0,0 +1,40 @@
+@echo off
+echo ============================================================
+echo   AI-ENHANCED HONEYPOT ^& DECEPTION SYSTEM (multi-process)
+echo ============================================================
+echo.
+
+:: Quick dependency check — remind user to run setup.bat first
+python -c "import fastapi, uvicorn, sqlalchemy, asyncssh" >nul 2>&1
+if %errorlevel% neq 0 (
+    echo  [WARNING] Some Python dependencies seem missing.
+    echo  Please run setup.bat first, then try again.
+    echo.
+    pause
+    exit /b 1
+)
+
+if not exist ".env" (
+    echo  [WARNING] .env file not found!
+    echo  Please run setup.bat first and add your GEMINI_API_KEY.
+    echo.
+    pause
+    exit /b 1
+)
+
+:: Hub, SSH and service listeners, plus one API worker per CPU core
+echo [1/2] Starting hub, listeners and API workers (port 8000)...
+start "Honeypot Cluster" cmd /k "python -m backend.cluster all --port 8000"
+
+echo [2/2] Starting Frontend Dashboard (port 5173)...
+start "Frontend Dashboard" cmd /k "cd frontend && npm run dev"
+
+echo.
+echo ============================================================
+echo   ALL SYSTEMS ONLINE
+echo   Dashboard  : http://localhost:5173
+echo   Backend API: http://localhost:8000
+echo   Cluster    : http://localhost:8000/api/cluster
+echo ============================================================
+echo.
+pause